@@ -484,6 +484,17 @@ ipcMain.handle('enable-recording-mode', async (event) => {
               context.href = element.href;
             }
             
+            // Position dans le viewport (pixels CSS) : zone où le VLM cherche l'élément au rejeu
+            const rect = element.getBoundingClientRect();
+            if (rect.width > 0 && rect.height > 0) {
+              context.rect = {
+                x: Math.round(rect.x),
+                y: Math.round(rect.y),
+                width: Math.round(rect.width),
+                height: Math.round(rect.height)
+              };
+            }
+            
             return context;
           }
           
@@ -552,6 +563,7 @@ ipcMain.handle('enable-recording-mode', async (event) => {
                   type: 'fill',
                   selector: selector,
                   value: e.target.value,
+                  context: getElementContext(e.target),
                   timestamp: Date.now()
                 };
                 logAction(action);
@@ -734,6 +746,16 @@ ipcMain.handle('enable-recording-mode', async (event) => {
               context.href = element.href;
             }
             
+            const rect = element.getBoundingClientRect();
+            if (rect.width > 0 && rect.height > 0) {
+              context.rect = {
+                x: Math.round(rect.x),
+                y: Math.round(rect.y),
+                width: Math.round(rect.width),
+                height: Math.round(rect.height)
+              };
+            }
+            
             return context;
           }
           
@@ -794,6 +816,7 @@ ipcMain.handle('enable-recording-mode', async (event) => {
                     type: 'fill',
                     selector: selector,
                     value: e.target.value,
+                    context: getElementContext(e.target),
                     timestamp: Date.now()
                   });
                 }
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+AgentMemory - Historique borné de l'agent pour les longues sessions
+Les dernières étapes sont gardées telles quelles (ring buffer) ; les plus anciennes sont résumées
+en une ligne chacune dans un digest compact, lui-même borné, qui alimente le prompt du planner
+"""
+
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+from page_observation import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+def _shorten(text: Optional[str], limit: int) -> str:
+    text = ' '.join(str(text or '').split())
+    return text if len(text) <= limit else text[:limit - 1] + '…'
+
+
+class AgentMemory:
+    """
+    - `steps` : les `max_steps` dernières étapes brutes (action, raisonnement, erreur, résultat tronqué)
+    - `digest` : une ligne par étape plus ancienne ("click('12') ✗ timeout"), répétitions fusionnées
+    - `start_task()` : remise à zéro à chaque nouvelle tâche (une ligne de rappel de la précédente est conservée)
+    """
+
+    def __init__(self, max_steps: int = 12, max_digest_lines: int = 30, max_text_chars: int = 200):
+        self.max_steps = max_steps
+        self.max_digest_lines = max_digest_lines
+        self.max_text_chars = max_text_chars
+
+        self.task = ""
+        self.task_started_at = time.time()
+        self.steps: deque = deque()
+        self.digest: deque = deque()
+        self.digest_omitted = 0  # Lignes du digest elles-mêmes oubliées
+        self.task_steps = 0
+
+        # Statistiques (depuis le démarrage)
+        self.total_steps = 0
+        self.tasks = 0
+        self.compacted = 0
+
+    def start_task(self, task: str):
+        """Nouvelle tâche : oublier les étapes de la précédente, ne garder qu'une ligne de contexte"""
+        previous = None
+        if self.task:
+            previous = f"Previous task: {_shorten(self.task, 80)} ({self.task_steps} steps)"
+
+        self.task = task
+        self.task_started_at = time.time()
+        self.steps.clear()
+        self.digest.clear()
+        self.digest_omitted = 0
+        self.task_steps = 0
+        self.tasks += 1
+        if previous:
+            self.digest.append(previous)
+
+    def record(self, action: str, reasoning: str = '', error: Optional[str] = None, result: str = '', url: str = ''):
+        self.steps.append({
+            'action': action,
+            'reasoning': _shorten(reasoning, self.max_text_chars),
+            'error': _shorten(error, self.max_text_chars) if error else None,
+            'result': _shorten(result, self.max_text_chars),
+            'url': url
+        })
+        self.task_steps += 1
+        self.total_steps += 1
+        while len(self.steps) > self.max_steps:
+            self._compact(self.steps.popleft())
+
+    def note(self, text: str):
+        """Événement hors plan (pause, reprise...) : directement dans le digest"""
+        self._append_digest(_shorten(text, self.max_text_chars))
+
+    def mark_error(self, error: str):
+        """L'erreur est survenue après l'enregistrement de la dernière étape"""
+        if self.steps:
+            self.steps[-1]['error'] = _shorten(error, self.max_text_chars)
+
+    def last(self) -> Optional[Dict[str, Any]]:
+        return self.steps[-1] if self.steps else None
+
+    def recent(self, n: int) -> List[Dict[str, Any]]:
+        return list(self.steps)[-n:]
+
+    def recent_actions(self, n: int) -> List[str]:
+        return [step['action'] for step in self.recent(n)]
+
+    def _compact(self, step: Dict[str, Any]):
+        status = f"✗ {_shorten(step['error'], 60)}" if step['error'] else "✓"
+        self._append_digest(f"{_shorten(step['action'], 80)} {status}")
+        self.compacted += 1
+
+    def _append_digest(self, line: str):
+        # Répétitions consécutives fusionnées : "click('12') ✓ (×3)"
+        if self.digest:
+            last = self.digest[-1]
+            base, _, count = last.partition(' (×')
+            if base == line:
+                repeat = int(count.rstrip(')')) + 1 if count else 2
+                self.digest[-1] = f"{line} (×{repeat})"
+                return
+
+        self.digest.append(line)
+        while len(self.digest) > self.max_digest_lines:
+            self.digest.popleft()
+            self.digest_omitted += 1
+
+    def to_prompt(self) -> str:
+        """Historique pour le prompt du planner : digest des étapes anciennes puis étapes récentes"""
+        if not self.steps and not self.digest:
+            return "No previous actions"
+
+        lines = []
+        if self.digest or self.digest_omitted:
+            lines.append("Earlier steps (summary):")
+            if self.digest_omitted:
+                lines.append(f"({self.digest_omitted} older steps omitted)")
+            lines += list(self.digest)
+        if self.steps:
+            lines.append("Recent steps:")
+            for step in self.steps:
+                outcome = f"ERROR: {step['error']}" if step['error'] else step['result']
+                lines.append(f"{step['action']} → {_shorten(outcome, 100)}")
+        return '\n'.join(lines)
+
+    def checkpoint(self, n: int = 5) -> List[Dict[str, Any]]:
+        """Copie des dernières étapes (sauvegarde de pause)"""
+        return [dict(step) for step in self.recent(n)]
+
+    def stats(self) -> Dict[str, Any]:
+        chars = sum(len(value) for step in self.steps for value in step.values() if isinstance(value, str))
+        chars += sum(len(line) for line in self.digest)
+        return {
+            'task_steps': self.task_steps,
+            'steps': len(self.steps),
+            'digest_lines': len(self.digest),
+            'digest_omitted': self.digest_omitted,
+            'total_steps': self.total_steps,
+            'tasks': self.tasks,
+            'chars': chars,
+            'compacted': self.compacted,
+            'prompt_tokens': estimate_tokens(self.to_prompt())
+        }
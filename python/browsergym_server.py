@@ -8,7 +8,9 @@ import asyncio
 import json
 import logging
 import argparse
-import base64
+import itertools
+import re
+import time
 from typing import Optional, Dict, Any, List
 import websockets
 from websockets.server import serve, WebSocketServerProtocol
@@ -18,6 +20,20 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from screencast import CDPScreencast, ScreencastConfig
+from frame_protocol import FRAME_SUBPROTOCOL, StreamFrame, DeltaFrame
+from client_channel import ClientChannel
+from element_resolver import ElementResolver
+from frame_change import FrameChangeDetector
+from frame_delta import DeltaEncoder
+from frame_provider import FrameProvider, CapturedFrame
+from image_ops import PIL_AVAILABLE
+from image_workers import EventLoopLagMonitor, get_image_pool
+from page_fingerprint import page_fingerprint
+from page_settle import PageSettle
+from plan_stream import same_action
+from stream_controller import AdaptiveStreamController, StreamPolicy, StreamSettings
+
 try:
     from browsergym.core.action.highlevel import HighLevelActionSet
     from electron_browser_env import connect_to_electron_browser_async
@@ -27,6 +43,8 @@ try:
     from workflow_storage import WorkflowStorage
     from workflow_player import WorkflowPlayer  # NOUVEAU
     from vlm_service import VLMService  # NOUVEAU
+    from grounding_cache import GroundingCache
+    from llm_client import close_llm_client, llm_resilience_stats
     BROWSERGYM_AVAILABLE = True
     print("✓ BrowserGym loaded successfully")
 except ImportError as e:
@@ -39,21 +57,70 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Cible d'action désignant un élément observé : '12' ou '[data-bid="12"]'
+BID_TARGET = re.compile(r'^\s*(?:\[data-bid=["\']?(\d+)["\']?\]|(\d+))\s*$')
+
+# Chaque changement de qualité/échelle relance Page.startScreencast (trou dans le flux) :
+# quelques paliers seulement, et au plus une relance par SCREENCAST_RESTART_DWELL secondes
+SCREENCAST_QUALITY_LEVELS = (40, 55, 70, 85)
+SCREENCAST_SCALE_LEVELS = (0.5, 0.75, 1.0)
+SCREENCAST_RESTART_DWELL = 5.0
+
+
+def _quantize(value: float, levels: tuple) -> float:
+    """Plus grand palier <= value (le plus petit si value est en dessous de tous)"""
+    return max((level for level in levels if level <= value), default=levels[0])
+
 
 class BrowserGymServer:
     """Serveur WebSocket pour BrowserGym"""
     
-    def __init__(self, cdp_port: int = 9222, ws_port: int = 8765, use_llm: bool = True, use_hybrid: bool = True):
+    def __init__(self, cdp_port: int = 9222, ws_port: int = 8765, use_llm: bool = True, use_hybrid: bool = True,
+                 stream_mode: str = 'screencast', screencast_config: Optional[ScreencastConfig] = None,
+                 keyframe_interval: float = 5.0):
         self.cdp_port = cdp_port
         self.ws_port = ws_port
         self.browser = None
         self.context = None
         self.page = None
-        self.clients: set = set()
+        self.clients: Dict[WebSocketServerProtocol, ClientChannel] = {}
         self.agent_busy = False
+        # Traitement des messages utilisateur : le premier tourne, les suivants attendent leur tour
+        self.agent_tasks: List[asyncio.Task] = []
         self.screenshot_task = None
         self.streaming_active = False
         
+        # Streaming: 'screencast' (push CDP) ou 'poll' (page.screenshot toutes les 200ms)
+        self.stream_mode = stream_mode
+        self.screencast_config = screencast_config or ScreencastConfig()
+        self.screencast: Optional[CDPScreencast] = None
+        # Cadence du live view appliquée côté serveur : le compositor n'envoie une frame qu'à chaque repaint,
+        # everyNthFrame > 1 pourrait donc perdre le seul repaint d'une page statique
+        self._screencast_interval = 0.0
+        self._last_screencast_publish = 0.0
+        self._pending_screencast_frame: Optional[StreamFrame] = None
+        self._screencast_flush: Optional[asyncio.Task] = None
+        self._frame_ids = itertools.count(1)
+        # Suppression des frames identiques + keyframe périodique
+        self.frame_detector = FrameChangeDetector(keyframe_interval=keyframe_interval)
+        # Encodage delta (dirty rectangles) pour les clients qui l'activent, si Pillow est installé
+        self.delta_encoder = DeltaEncoder() if PIL_AVAILABLE else None
+        self._delta_lock = asyncio.Lock()
+        self.last_broadcast_frame = None
+        # Encodage/hash/base64 des images hors de l'event loop + mesure du lag de la boucle
+        self.image_workers = get_image_pool()
+        self.loop_monitor = EventLoopLagMonitor()
+        # Screenshots partagés entre live view, agent et VLM
+        self.frame_provider = FrameProvider()
+        # Attente de stabilisation de la page après les actions (au lieu de sleeps fixes / networkidle)
+        self.page_settle = PageSettle()
+        # FPS / format / qualité adaptés à l'activité et au lag des clients
+        self.stream_controller = AdaptiveStreamController(StreamPolicy(
+            format=self.screencast_config.format,
+            quality=self.screencast_config.quality
+        ))
+        self.workflow_playing = False
+        
         # Choix de l'agent
         self.use_hybrid = use_hybrid and BROWSERGYM_AVAILABLE
         self.use_llm = use_llm and BROWSERGYM_AVAILABLE
@@ -64,6 +131,8 @@ class BrowserGymServer:
         self.workflow_recorder: Optional[WorkflowRecorder] = None
         self.workflow_storage = WorkflowStorage() if BROWSERGYM_AVAILABLE else None
         self.vlm_service = VLMService() if BROWSERGYM_AVAILABLE else None
+        # Résultats du VLM réutilisés d'un rejeu de workflow à l'autre
+        self.grounding_cache = GroundingCache() if BROWSERGYM_AVAILABLE else None
         self.is_recording = False
         
         if self.use_hybrid:
@@ -102,6 +171,8 @@ class BrowserGymServer:
             
             # Utiliser la fonction async pour se connecter
             self.browser, self.context, self.page = await connect_to_electron_browser_async(cdp_url)
+            self.frame_provider.attach(self.page)
+            self.page_settle.attach(self.page)
             
             logger.info("Environment initialized successfully")
             logger.info(f"Page URL: {self.page.url}")
@@ -144,40 +215,60 @@ class BrowserGymServer:
             # ===== HYBRID AGENT (BrowserGym + BrowserOS) =====
             if self.use_hybrid and self.hybrid_agent:
                 logger.info(f"🎯 Using Hybrid Agent (Planning + Rich Observations)")
+                self.hybrid_agent.start_task(message)
                 
                 try:
                     # BOUCLE D'EXÉCUTION : continuer jusqu'à ce que le plan soit vide ou max_iterations
                     max_actions_per_message = 10  # Sécurité pour éviter boucles infinies
                     actions_executed = 0
                     all_responses = []
+                    plan_stream = None
                     
                     while actions_executed < max_actions_per_message:
                         # Get rich observation
-                        observation = await self.hybrid_agent.get_rich_observation(self.page)
+                        observation = await self.hybrid_agent.get_rich_observation(self.page, self.frame_provider)
                         
-                        # Besoin de plan ?
+                        # Besoin de plan ? Streaming : la 1ère action est exécutée pendant que le reste se génère
+                        next_step = None
                         if self.hybrid_agent.should_replan(observation):
-                            plan = await self.hybrid_agent.create_plan(message, observation)
-                            self.hybrid_agent.current_plan = plan
+                            # Plan spéculé au tour précédent, valable si la page n'a pas changé depuis
+                            speculative_plan = await self.hybrid_agent.speculation.take(self.page)
+                            
+                            # Premier plan du message : réutilisable d'une fois sur l'autre (PlanCache)
+                            fingerprint = await page_fingerprint(self.page) if actions_executed == 0 and not speculative_plan else None
+                            cached_plan = self.hybrid_agent.cached_plan(message, fingerprint) if fingerprint else None
+                            
+                            if speculative_plan or cached_plan:
+                                self.hybrid_agent.current_plan = speculative_plan or cached_plan
+                            else:
+                                plan_stream = self.hybrid_agent.start_plan(message, observation, fingerprint)
+                                next_step = await plan_stream.first_action()
+                                if next_step is None:
+                                    self.hybrid_agent.current_plan = await plan_stream.result()
+                                    plan_stream = None
                             
                             # Envoyer le raisonnement au frontend (une seule fois)
                             if actions_executed == 0:
+                                plan = self.hybrid_agent.current_plan
                                 await self.broadcast({
                                     'type': 'agent_thinking',
                                     'data': {
-                                        'reasoning': plan.step_by_step_reasoning,
-                                        'actions_planned': len(plan.proposed_actions)
+                                        'reasoning': plan_stream.header.get('step_by_step_reasoning', '') if plan_stream else plan.step_by_step_reasoning,
+                                        'actions_planned': None if plan_stream else len(plan.proposed_actions)  # Inconnu tant que le plan se génère
                                     }
                                 })
+                        else:
+                            self.hybrid_agent.speculation.discard()
                         
-                        # Vérifier si le plan est terminé
-                        if not self.hybrid_agent.current_plan or not self.hybrid_agent.current_plan.proposed_actions:
-                            if actions_executed == 0:
-                                response_message = "🤔 No actions to execute, task might be complete."
-                            break
-                        
-                        # Exécuter la prochaine action du plan
-                        next_step = self.hybrid_agent.current_plan.proposed_actions.pop(0)
+                        if next_step is None:
+                            # Vérifier si le plan est terminé
+                            if not self.hybrid_agent.current_plan or not self.hybrid_agent.current_plan.proposed_actions:
+                                if actions_executed == 0:
+                                    response_message = "🤔 No actions to execute, task might be complete."
+                                break
+                            
+                            # Exécuter la prochaine action du plan
+                            next_step = self.hybrid_agent.current_plan.proposed_actions.pop(0)
                         action_str = next_step['action']
                         reasoning = next_step['reasoning']
                         
@@ -193,7 +284,7 @@ class BrowserGymServer:
                             url_match = re.search(r'goto\(["\'](.+?)["\']\)', action_str)
                             if url_match:
                                 url = url_match.group(1)
-                                await self.page.goto(url, wait_until='networkidle', timeout=30000)
+                                await self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
                                 action_result = f"✅ [{actions_executed+1}] Navigated to {url}\n💭 {reasoning}"
                             else:
                                 action_result = f"⚠️ Could not parse URL from: {action_str}"
@@ -210,11 +301,21 @@ class BrowserGymServer:
                                 text = fill_match.group(2)
                                 
                                 try:
-                                    # Essayer plusieurs stratégies pour trouver le champ
+                                    # 0. Id d'élément de l'observation : un seul aller-retour
+                                    handle = await self._resolve_bid(selector)
+                                    if handle:
+                                        await handle.fill(text, timeout=5000)
+                                        try:
+                                            await handle.press('Enter', timeout=1000)
+                                        except Exception:
+                                            pass
+                                        action_result = f"✅ [{actions_executed+1}] Filled element {selector} with '{text}' and pressed Enter\n💭 {reasoning}"
+                                    
+                                    # Sinon, essayer plusieurs stratégies pour trouver le champ
                                     # IMPORTANT: Tester input ET textarea !
                                     
                                     # 1. Sélecteur CSS direct
-                                    if await self.page.locator(selector).count() > 0:
+                                    elif await self.page.locator(selector).count() > 0:
                                         await self.page.fill(selector, text, timeout=5000)
                                         # Presser Enter automatiquement pour les champs de recherche
                                         await self.page.press(selector, 'Enter', timeout=1000)
@@ -278,9 +379,16 @@ class BrowserGymServer:
                                 selector = click_match.group(1)
                                 
                                 try:
-                                    # Essayer plusieurs stratégies
+                                    # 0. Id d'élément de l'observation : un seul aller-retour,
+                                    #    sinon sélecteur, texte ou aria-label scorés dans la page en un seul evaluate
+                                    handle = await self._resolve_bid(selector) or await self._resolve_target(selector)
+                                    if handle:
+                                        await handle.click(timeout=5000)
+                                        action_result = f"✅ [{actions_executed+1}] Clicked element {selector}\n💭 {reasoning}"
+                                    
+                                    # Sinon, essayer plusieurs stratégies
                                     # 1. Sélecteur CSS direct
-                                    if await self.page.locator(selector).count() > 0:
+                                    elif await self.page.locator(selector).count() > 0:
                                         await self.page.click(selector, timeout=5000)
                                         action_result = f"✅ [{actions_executed+1}] Clicked '{selector}'\n💭 {reasoning}"
                                     
@@ -319,6 +427,10 @@ class BrowserGymServer:
                         
                         # === DONE ===
                         elif 'done' in action_str.lower():
+                            # final_answer est générée après proposed_actions
+                            if plan_stream:
+                                self.hybrid_agent.current_plan = await plan_stream.result()
+                                plan_stream = None
                             final_msg = self.hybrid_agent.current_plan.final_answer if self.hybrid_agent.current_plan else "Task completed"
                             action_result = f"✅ Task complete!\n\n{final_msg}"
                             all_responses.append(action_result)
@@ -333,6 +445,9 @@ class BrowserGymServer:
                         else:
                             action_result = f"⚠️ [{actions_executed+1}] Unknown action type: '{action_str}'\n💭 {reasoning}"
                         
+                        # La page a (peut-être) changé : ne plus servir les screenshots d'avant l'action
+                        self.frame_provider.invalidate()
+                        
                         all_responses.append(action_result)
                         
                         # Envoyer un message intermédiaire au frontend
@@ -346,16 +461,29 @@ class BrowserGymServer:
                         if "❌" in action_result or "⚠️" in action_result:
                             action_error = action_result
                         
-                        self.hybrid_agent.action_history.append({
-                            'action': action_str,
-                            'reasoning': reasoning,
-                            'error': action_error,
-                            'result': action_result
-                        })
-                        self.hybrid_agent.execution_history.append(f"{action_str} → {action_result[:100]}")
+                        self.hybrid_agent.memory.record(action_str, reasoning, action_error, action_result, self.page.url)
                         self.hybrid_agent.iteration += 1
                         actions_executed += 1
                         
+                        # Une action d'un plan mis en cache échoue : le plan n'est plus fiable
+                        current_plan = self.hybrid_agent.current_plan
+                        if action_error and not plan_stream and current_plan and current_plan.cache_key:
+                            self.hybrid_agent.plan_cache.invalidate(current_plan.cache_key)
+                        
+                        # Plan streamé : récupérer la suite, sans l'action déjà exécutée
+                        if plan_stream:
+                            plan = await plan_stream.result()
+                            if plan.proposed_actions and same_action(plan.proposed_actions[0], next_step):
+                                plan.proposed_actions.pop(0)
+                            if action_error and plan.cache_key:
+                                self.hybrid_agent.plan_cache.invalidate(plan.cache_key)
+                                plan.cache_key = None
+                            self.hybrid_agent.current_plan = plan
+                            plan_stream = None
+                        
+                        # Replanification prévue au prochain tour : la lancer pendant que la page se stabilise
+                        await self.hybrid_agent.speculation.start(message, self.page, self.frame_provider)
+                        
                         # Validation périodique
                         if self.hybrid_agent.iteration % self.hybrid_agent.VALIDATE_EVERY_N_STEPS == 0:
                             validation = await self.hybrid_agent.validate_progress(message, observation)
@@ -368,8 +496,8 @@ class BrowserGymServer:
                                 })
                                 break
                         
-                        # Petite pause pour laisser le temps au screenshot de se mettre à jour
-                        await asyncio.sleep(0.5)
+                        # Attendre que la page se stabilise (DOM calme, pas de requête en vol) avant la prochaine observation
+                        await self.page_settle.wait()
                     
                     # Message final récapitulatif
                     if actions_executed > 0:
@@ -382,8 +510,12 @@ class BrowserGymServer:
                     response_message = f"❌ Error: {str(nav_error)}"
                     
                     # Enregistrer l'erreur pour replanification
-                    if self.hybrid_agent.action_history:
-                        self.hybrid_agent.action_history[-1]['error'] = str(nav_error)
+                    self.hybrid_agent.memory.mark_error(str(nav_error))
+                finally:
+                    # Erreur ou pause pendant la 1ère action : abandonner la génération du plan
+                    if plan_stream:
+                        plan_stream.cancel()
+                    self.hybrid_agent.speculation.discard()
             
             # ===== SIMPLE LLM AGENT (fallback) =====
             elif self.use_llm and self.llm_agent:
@@ -394,7 +526,7 @@ class BrowserGymServer:
                     'title': await self.page.title() if self.page else None
                 }
                 
-                llm_result = self.llm_agent.get_action_from_message(message, page_info)
+                llm_result = await self.llm_agent.get_action_from_message(message, page_info)
                 
                 if llm_result.get('error'):
                     self.agent_busy = False
@@ -406,7 +538,8 @@ class BrowserGymServer:
                 try:
                     if parsed_action['type'] == 'goto':
                         url = parsed_action['url']
-                        await self.page.goto(url, wait_until='networkidle', timeout=30000)
+                        await self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
+                        await self.page_settle.wait()
                         response_message = f"✅ Navigated to {url}"
                     else:
                         response_message = f"⚠️ Action type '{parsed_action['type']}' not implemented"
@@ -432,7 +565,8 @@ class BrowserGymServer:
                             self.agent_busy = False
                             return {'type': 'agent_message', 'message': response_message}
                     
-                    await self.page.goto(url, wait_until='networkidle', timeout=30000)
+                    await self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
+                    await self.page_settle.wait()
                     response_message = f"✅ Navigated to {url}"
                     
                 except Exception as nav_error:
@@ -446,6 +580,67 @@ class BrowserGymServer:
             self.agent_busy = False
             return {'type': 'error', 'error': str(e)}
     
+    async def _resolve_bid(self, target: str):
+        """
+        Résoudre une cible '12' / '[data-bid="12"]' (ids posés par PageObserver) en handle,
+        en un seul appel. None si ce n'est pas un id ou si l'élément a disparu (→ cascade de fallback)
+        """
+        match = BID_TARGET.match(target)
+        if not match:
+            return None
+        
+        bid = match.group(1) or match.group(2)
+        handle = await self.page.query_selector(f'[data-bid="{bid}"]')
+        if not handle:
+            logger.info(f"  Element {bid} no longer on the page, falling back to locator strategies")
+        return handle
+    
+    async def _resolve_target(self, target: str):
+        """
+        Résoudre une description libre (sélecteur CSS, texte visible, aria-label) via ElementResolver.
+        None si aucun candidat n'atteint le score minimum (→ cascade de fallback)
+        """
+        try:
+            resolved = await ElementResolver(self.page).resolve({
+                'selector': target,
+                'text': target,
+                'ariaLabel': target
+            })
+        except Exception as e:
+            logger.info(f"  In-page resolver failed: {e}")
+            return None
+        return resolved.handle if resolved else None
+    
+    def start_agent_task(self, channel: ClientChannel, message: str):
+        """
+        Traiter un message utilisateur en tâche de fond : la boucle du client reste libre
+        pour pause_agent, les stats, etc. pendant que le LLM réfléchit.
+        """
+        previous = self.agent_tasks[-1] if self.agent_tasks else None
+        task = asyncio.create_task(self._run_agent_task(channel, message, previous))
+        self.agent_tasks.append(task)
+        task.add_done_callback(self.agent_tasks.remove)
+    
+    def cancel_agent_tasks(self):
+        """Annuler le message en cours de traitement et ceux en attente"""
+        for task in list(self.agent_tasks):
+            if not task.done():
+                task.cancel()
+    
+    async def _run_agent_task(self, channel: ClientChannel, message: str, previous: Optional[asyncio.Task]):
+        try:
+            # Les messages restent traités dans l'ordre d'arrivée
+            if previous and not previous.done():
+                await asyncio.wait([previous])
+            response = await self.handle_user_message(message)
+        except asyncio.CancelledError:
+            # Annulé par pause_agent : la requête LLM en cours est abandonnée
+            logger.info("✋ Agent task cancelled")
+            self.agent_busy = False
+            response = {'type': 'agent_message', 'message': '✋ Agent interrupted'}
+        
+        channel.send_control(response)
+    
     async def handle_action(self, action: str) -> Dict[str, Any]:
         """Exécuter une action dans l'environnement"""
         try:
@@ -486,16 +681,21 @@ class BrowserGymServer:
             
             # Sauvegarder l'état avec l'agent hybride
             if self.use_hybrid and self.hybrid_agent:
+                # Données simples uniquement (pas le plan lui-même) : la tâche suffit pour replanifier
                 checkpoint = {
                     'url': self.page.url if self.page else None,
-                    'current_plan': self.hybrid_agent.current_plan,
-                    'action_history': self.hybrid_agent.action_history[-5:],  # Dernières 5 actions
+                    'user_task': self.hybrid_agent.memory.task,
+                    'action_history': self.hybrid_agent.memory.checkpoint(5),  # Dernières 5 actions
                     'iteration': self.hybrid_agent.iteration
                 }
                 self.hybrid_agent.paused = True
                 self.hybrid_agent.pause_checkpoint = checkpoint
                 logger.info(f"Checkpoint saved at: {checkpoint['url']}")
             
+            # Interrompre le plan/l'action en cours (y compris un appel LLM en vol) et les messages en attente,
+            # qui sinon démarreraient pendant la pause
+            self.cancel_agent_tasks()
+            
             return {
                 'type': 'agent_paused',
                 'message': '✋ Agent paused - You have manual control'
@@ -518,13 +718,13 @@ class BrowserGymServer:
                 self.hybrid_agent.paused = False
                 
                 # Obtenir l'observation actuelle (après intervention utilisateur)
-                observation = await self.hybrid_agent.get_rich_observation(self.page)
+                observation = await self.hybrid_agent.get_rich_observation(self.page, self.frame_provider)
                 
                 # Réanalyser la situation
                 logger.info("🧠 Analyzing current state after manual intervention...")
                 
                 checkpoint = self.hybrid_agent.pause_checkpoint or {}
-                user_task = checkpoint.get('current_plan', {}).get('user_task', 'Continue the task')
+                user_task = checkpoint.get('user_task') or 'Continue the task'
                 
                 # Créer un nouveau plan basé sur l'état actuel
                 new_plan = await self.hybrid_agent.create_plan(
@@ -533,9 +733,7 @@ class BrowserGymServer:
                 )
                 
                 # Ajouter contexte de la pause
-                self.hybrid_agent.execution_history.append(
-                    f"[PAUSE] User took manual control. Resumed at {observation.url}"
-                )
+                self.hybrid_agent.memory.note(f"[PAUSE] User took manual control. Resumed at {observation.url}")
                 
                 self.hybrid_agent.current_plan = new_plan
                 
@@ -681,8 +879,12 @@ class BrowserGymServer:
             logger.info(f"▶️ Playing workflow: {workflow.get('name')}")
             
             # Créer player et exécuter
-            player = WorkflowPlayer(self.page, self.vlm_service)
-            results = await player.play(workflow, variables)
+            player = WorkflowPlayer(self.page, self.vlm_service, self.frame_provider, self.page_settle, self.grounding_cache)
+            self.workflow_playing = True
+            try:
+                results = await player.play(workflow, variables)
+            finally:
+                self.workflow_playing = False
             
             return {
                 'type': 'workflow_completed',
@@ -721,9 +923,15 @@ class BrowserGymServer:
     
     async def handle_client(self, websocket: WebSocketServerProtocol, path: str):
         """Gérer une connexion client"""
-        self.clients.add(websocket)
+        channel = ClientChannel(websocket)
+        channel.start()
+        self.clients[websocket] = channel
         client_id = id(websocket)
-        logger.info(f"Client connected: {client_id}")
+        logger.info(f"Client connected: {client_id} (binary frames: {channel.binary_frames})")
+        
+        # Le nouveau client reçoit tout de suite la dernière image (même si la page ne bouge plus)
+        if self.frame_detector.last_frame:
+            channel.send_frame(self.frame_detector.last_frame.refreshed(next(self._frame_ids)))
         
         try:
             async for message in websocket:
@@ -752,7 +960,9 @@ class BrowserGymServer:
                     if msg_type == 'init':
                         response = await self.initialize_env(data.get('config', {}))
                     elif msg_type == 'user_message':
-                        response = await self.handle_user_message(data.get('message', ''))
+                        # Réponse envoyée par la tâche de fond quand le traitement est terminé
+                        self.start_agent_task(channel, data.get('message', ''))
+                        response = None
                     elif msg_type == 'action':
                         response = await self.handle_action(data.get('action', ''))
                     elif msg_type == 'reset':
@@ -780,21 +990,35 @@ class BrowserGymServer:
                     elif msg_type == 'delete_workflow':
                         workflow_id = data.get('workflow_id')
                         response = await self.handle_delete_workflow(workflow_id)
+                    elif msg_type == 'get_agent_stats':
+                        response = self.handle_get_agent_stats()
+                    elif msg_type == 'get_stream_stats':
+                        response = self.handle_get_stream_stats(channel)
+                    elif msg_type == 'set_delta_mode':
+                        response = self.handle_set_delta_mode(channel, bool(data.get('enabled', True)))
+                    elif msg_type == 'request_keyframe':
+                        response = self.handle_request_keyframe(channel)
+                    elif msg_type == 'stream_config':
+                        response = self.handle_stream_config(data.get('config', {}))
+                    elif msg_type == 'get_frame':
+                        response = await self.handle_get_frame(data.get('level', 'thumb'))
                     else:
                         response = {'type': 'error', 'error': f'Unknown message type: {msg_type}'}
                     
-                    # Envoyer la réponse
-                    await websocket.send(json.dumps(response))
+                    # Envoyer la réponse (via la file du client, dans l'ordre)
+                    if response:
+                        channel.send_control(response)
                     
                 except json.JSONDecodeError as e:
                     logger.error(f"Invalid JSON: {e}")
-                    await websocket.send(json.dumps({'type': 'error', 'error': 'Invalid JSON'}))
+                    channel.send_control({'type': 'error', 'error': 'Invalid JSON'})
                 except Exception as e:
                     logger.error(f"Error processing message: {e}")
-                    await websocket.send(json.dumps({'type': 'error', 'error': str(e)}))
+                    channel.send_control({'type': 'error', 'error': str(e)})
         
         finally:
-            self.clients.remove(websocket)
+            del self.clients[websocket]
+            await channel.close()
             logger.info(f"Client disconnected: {client_id}")
             
             # Nettoyer
@@ -805,47 +1029,309 @@ class BrowserGymServer:
                 self.browser = None
                 self.context = None
                 self.page = None
+                self.page_settle.detach()
     
     async def broadcast(self, message: Dict[str, Any]):
-        """Envoyer un message à tous les clients"""
+        """Envoyer un message à tous les clients (mis en file, ne bloque pas sur un client lent)"""
         if self.clients:
             msg_json = json.dumps(message)
-            await asyncio.gather(
-                *[client.send(msg_json) for client in self.clients],
-                return_exceptions=True
-            )
+            for channel in list(self.clients.values()):
+                channel.send_control(msg_json)
+    
+    async def broadcast_frame(self, frame: StreamFrame):
+        """
+        Envoyer une frame à tous les clients :
+        binaire brut pour ceux qui ont négocié FRAME_SUBPROTOCOL, JSON+base64 pour les autres.
+        Chaque client ne garde que la frame la plus récente en attente.
+        """
+        for channel in list(self.clients.values()):
+            channel.send_frame(frame)
+    
+    def handle_get_agent_stats(self) -> Dict[str, Any]:
+        """Statistiques de l'agent hybride (spéculation de plans...)"""
+        if not self.hybrid_agent:
+            return {'type': 'agent_stats', 'data': {}}
+        
+        return {
+            'type': 'agent_stats',
+            'data': {
+                'iteration': self.hybrid_agent.iteration,
+                'speculation': self.hybrid_agent.speculation.stats(),
+                'plan_cache': self.hybrid_agent.plan_cache.stats(),
+                'observations': self.hybrid_agent.observation_stats,
+                'page_settle': self.page_settle.stats(),
+                'memory': self.hybrid_agent.memory.stats(),
+                'prompts': self.hybrid_agent.prompt_usage.stats(),
+                'llm': llm_resilience_stats(),
+                'vlm': self.vlm_service.stats() if self.vlm_service else None,
+                'grounding_cache': self.grounding_cache.stats() if self.grounding_cache else None
+            }
+        }
+    
+    def handle_get_stream_stats(self, channel: ClientChannel) -> Dict[str, Any]:
+        """Statistiques de streaming : lag de ce client + résumé de tous les clients"""
+        all_stats = [c.stats() for c in self.clients.values()]
+        return {
+            'type': 'stream_stats',
+            'data': {
+                'stream_mode': self.stream_mode,
+                'client': channel.stats(),
+                'clients': len(all_stats),
+                'max_frame_lag_ms': max((st['frame_lag_ms'] for st in all_stats), default=0.0),
+                'frames': self.frame_detector.stats(),
+                'delta': self.delta_encoder.stats() if self.delta_encoder else None,
+                'frame_provider': self.frame_provider.stats(),
+                'controller': self.stream_controller.to_dict(),
+                'image_workers': self.image_workers.stats(),
+                'event_loop': self.loop_monitor.stats()
+            }
+        }
+    
+    def handle_set_delta_mode(self, channel: ClientChannel, enabled: bool) -> Dict[str, Any]:
+        """Activer/désactiver l'encodage delta pour ce client"""
+        if enabled and not self.delta_encoder:
+            return {'type': 'error', 'error': 'Delta mode unavailable (Pillow not installed)'}
+        
+        channel.delta_enabled = enabled
+        channel.request_keyframe()
+        logger.info(f"🧩 Client {channel.client_id} delta mode: {enabled}")
+        
+        return {'type': 'delta_mode', 'data': {'enabled': enabled}}
+    
+    def handle_stream_config(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Modifier la politique de streaming, ex:
+        {'type': 'stream_config', 'config': {'active_fps': 15, 'idle_fps': 1, 'quality': 60, 'lossless': false}}
+        Sans 'config', retourne simplement la politique courante.
+        """
+        if not isinstance(config, dict):
+            return {'type': 'error', 'error': 'stream_config expects a config object'}
+        
+        try:
+            state = self.stream_controller.update_policy(config) if config else self.stream_controller.to_dict()
+        except ValueError as e:
+            return {'type': 'error', 'error': f"Invalid stream_config: {e}"}
+        state['current'] = self._stream_settings().to_dict()
+        
+        return {'type': 'stream_config', 'data': state}
+    
+    async def handle_get_frame(self, level_name: str) -> Dict[str, Any]:
+        """Screenshot courant à une résolution donnée ('full', 'half' ou 'thumb' pour une miniature)"""
+        if not self.page:
+            return {'type': 'error', 'error': 'No page available'}
+        
+        pyramid = await self.frame_provider.get_pyramid(max_age_ms=500)
+        try:
+            level = await pyramid.level(level_name)
+        except ValueError as e:
+            return {'type': 'error', 'error': str(e)}
+        
+        return {
+            'type': 'frame',
+            'level': level.name,
+            'format': level.format,
+            'width': level.width,
+            'height': level.height,
+            'data': await level.load_base64(pyramid.workers)
+        }
+    
+    def handle_request_keyframe(self, channel: ClientChannel) -> Dict[str, Any]:
+        """Le client a perdu sa keyframe : renvoyer keyframe + dernier delta"""
+        channel.request_keyframe()
+        if self.last_broadcast_frame:
+            channel.send_frame(self.last_broadcast_frame)
+        
+        return {'type': 'keyframe_requested'}
     
     async def screenshot_streaming_loop(self):
-        """Boucle de streaming de screenshots"""
+        """Boucle de streaming de screenshots (screencast CDP, fallback polling)"""
         logger.info("🎬 Screenshot streaming started")
         
+        try:
+            if self.stream_mode == 'screencast':
+                await self._run_screencast()
+                if self.streaming_active and self.page:
+                    logger.warning("⚠️ CDP screencast unavailable, falling back to polling")
+            
+            await self._poll_screenshots()
+        finally:
+            logger.info("🛑 Screenshot streaming stopped")
+    
+    async def _run_screencast(self):
+        """Streaming push : attendre tant que le screencast CDP est sain"""
+        settings = self._stream_settings()
+        self._screencast_interval = settings.interval
+        config = self._screencast_config_for(settings)
+        self.screencast = CDPScreencast(self.page, self._on_screencast_frame, config)
+        
+        try:
+            await self.screencast.start()
+            started_at = time.monotonic()
+            
+            while self.streaming_active and self.page and not self.screencast.failed:
+                await asyncio.sleep(0.5)
+                
+                # Appliquer la décision du contrôleur adaptatif. La cadence est appliquée ici, sans relance ;
+                # un changement de palier qualité/échelle attend SCREENCAST_RESTART_DWELL, un changement de format non
+                settings = self._stream_settings()
+                self._screencast_interval = settings.interval
+                config = self._screencast_config_for(settings)
+                current = self.screencast.config
+                if config != current and (
+                    config.format != current.format or time.monotonic() - started_at >= SCREENCAST_RESTART_DWELL
+                ):
+                    await self.screencast.restart(config)
+                    started_at = time.monotonic()
+                
+                # Page immobile : le compositor n'envoie rien, renvoyer une keyframe périodiquement
+                keyframe = self.frame_detector.heartbeat_frame(next(self._frame_ids))
+                if keyframe:
+                    await self._send_frame(keyframe, keyframe=True)
+                
+        except Exception as e:
+            logger.error(f"Screencast error: {e}")
+        finally:
+            if self._screencast_flush:
+                self._screencast_flush.cancel()
+                self._screencast_flush = None
+            self._pending_screencast_frame = None
+            await self.screencast.stop()
+            self.screencast = None
+    
+    async def _on_screencast_frame(self, data_base64: str, metadata: Dict[str, Any]):
+        """Frame reçue du compositor : déjà encodée en base64 par CDP"""
+        fmt = metadata.get('format', 'png')
+        
+        # Réutilisable par l'agent (pas par le VLM : frame potentiellement réduite)
+        self.frame_provider.ingest(CapturedFrame(fmt, data_base64=data_base64, full_resolution=False))
+        
+        frame = StreamFrame.from_base64(next(self._frame_ids), data_base64, fmt)
+        
+        # Plus tôt que la cadence choisie : garder la plus récente et la publier à la fin de l'intervalle,
+        # pour que le dernier repaint soit toujours livré
+        wait = self._screencast_interval - (time.monotonic() - self._last_screencast_publish)
+        if wait > 0:
+            self._pending_screencast_frame = frame
+            if not self._screencast_flush or self._screencast_flush.done():
+                self._screencast_flush = asyncio.create_task(self._flush_screencast_frame(wait))
+            return
+        
+        self._last_screencast_publish = time.monotonic()
+        await self._publish_frame(frame)
+    
+    async def _flush_screencast_frame(self, delay: float):
+        await asyncio.sleep(delay)
+        frame, self._pending_screencast_frame = self._pending_screencast_frame, None
+        if frame is not None and self.streaming_active:
+            self._last_screencast_publish = time.monotonic()
+            await self._publish_frame(frame)
+    
+    async def _publish_frame(self, frame: StreamFrame):
+        """Diffuser une frame capturée, sauf si elle est identique à la précédente"""
+        digest = await self.image_workers.run(lambda: frame.digest)
+        if not self.frame_detector.is_unchanged(digest):
+            self.frame_detector.mark_sent(frame, digest)
+            await self._send_frame(frame)
+    
+    async def _send_frame(self, frame: StreamFrame, keyframe: bool = False):
+        """Encoder en delta si au moins un client l'a activé, préparer les messages, puis diffuser"""
+        if self.delta_encoder and any(c.delta_enabled for c in self.clients.values()):
+            async with self._delta_lock:
+                try:
+                    frame = await self.image_workers.run(self.delta_encoder.encode, frame, keyframe)
+                except Exception as e:
+                    logger.error(f"Delta encoding error: {e}")
+                    self.delta_encoder.reset()
+        
+        # base64 / JSON / header binaire calculés dans le pool, pas dans les writers des clients
+        channels = list(self.clients.values())
+        need_text = any(not c.binary_frames for c in channels)
+        need_binary = any(c.binary_frames for c in channels)
+        if channels:
+            await self.image_workers.run(self._prepare_frame_messages, frame, need_text, need_binary)
+        
+        self.last_broadcast_frame = frame
+        await self.broadcast_frame(frame)
+    
+    @staticmethod
+    def _prepare_frame_messages(frame, need_text: bool, need_binary: bool):
+        """Remplir les caches de messages de la frame (exécuté dans un thread du pool)"""
+        frames = [frame, frame.full, frame.base] if isinstance(frame, DeltaFrame) else [frame]
+        for item in frames:
+            if need_text:
+                item.to_json_message()
+            if need_binary:
+                item.to_binary_message()
+    
+    async def _poll_screenshots(self):
+        """Mode polling : capture à la cadence choisie par le contrôleur adaptatif"""
         while self.streaming_active and self.page:
             try:
-                # Prendre un screenshot
-                screenshot_bytes = await self.page.screenshot(type='png')
+                settings = self._stream_settings()
                 
-                # Convertir en base64
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
+                # Prendre un screenshot (ou réutiliser celui que l'agent vient de prendre)
+                start = time.perf_counter()
+                captured = await self.frame_provider.get_frame(max_age_ms=settings.interval * 500)
+                self.stream_controller.record_capture((time.perf_counter() - start) * 1000)
                 
-                # Envoyer à tous les clients
-                await self.broadcast({
-                    'type': 'screenshot',
-                    'data': screenshot_base64
-                })
+                # Image inchangée : ne pas payer le réencodage
+                digest = await self.image_workers.digest(captured.data)
+                if not self.frame_detector.is_unchanged(digest):
+                    frame = await self._encode_stream_frame(captured, settings)
+                    self.frame_detector.mark_sent(frame, digest)
+                    await self._send_frame(frame)
                 
-                # Attendre avant le prochain screenshot (5 FPS = 200ms)
-                await asyncio.sleep(0.2)
+                await asyncio.sleep(settings.interval)
                 
             except Exception as e:
                 logger.error(f"Screenshot streaming error: {e}")
                 await asyncio.sleep(1)
+    
+    def _stream_settings(self) -> StreamSettings:
+        """Mettre à jour les signaux du contrôleur et obtenir sa décision"""
+        self.stream_controller.set_activity(self.agent_busy or self.workflow_playing)
+        self.stream_controller.observe_client_lag(max(
+            (max(c.pending_frame_age_ms, c.last_frame_lag_ms) for c in self.clients.values()),
+            default=0.0
+        ))
+        return self.stream_controller.decide()
+    
+    def _screencast_config_for(self, settings: StreamSettings) -> ScreencastConfig:
+        """Traduire la décision du contrôleur en paramètres Page.startScreencast (qualité et échelle par paliers)"""
+        base = self.screencast_config
+        policy = self.stream_controller.policy
+        # Sans dégradation, les valeurs de la politique telles quelles
+        scale = settings.scale if settings.scale >= policy.scale else _quantize(settings.scale, SCREENCAST_SCALE_LEVELS)
+        quality = settings.quality if settings.quality >= policy.quality else int(_quantize(settings.quality, SCREENCAST_QUALITY_LEVELS))
+        return ScreencastConfig(
+            format=settings.format,
+            # Qualité ignorée en png : ne pas relancer pour elle
+            quality=quality if settings.format == 'jpeg' else base.quality,
+            max_width=int(base.max_width * scale),
+            max_height=int(base.max_height * scale),
+            # Toutes les frames du compositor : la cadence est appliquée dans _on_screencast_frame
+            every_nth_frame=1
+        )
+    
+    async def _encode_stream_frame(self, captured: CapturedFrame, settings: StreamSettings) -> StreamFrame:
+        """Réencoder la capture au format/qualité/échelle du live view (si Pillow est disponible), dans le pool"""
+        data, fmt = captured.data, captured.format
         
-        logger.info("🛑 Screenshot streaming stopped")
+        if PIL_AVAILABLE and (settings.format != fmt or settings.scale < 1.0):
+            start = time.perf_counter()
+            data, _, _ = await self.image_workers.reencode(data, settings.format, settings.quality, settings.scale)
+            fmt = settings.format
+            self.stream_controller.record_encode((time.perf_counter() - start) * 1000)
+        
+        return StreamFrame.from_bytes(next(self._frame_ids), data, fmt)
     
     def start_screenshot_streaming(self):
         """Démarrer le streaming de screenshots"""
         if not self.streaming_active:
             self.streaming_active = True
+            self.frame_detector.reset()
+            if self.delta_encoder:
+                self.delta_encoder.reset()
             self.screenshot_task = asyncio.create_task(self.screenshot_streaming_loop())
             logger.info("✅ Screenshot streaming task created")
     
@@ -862,9 +1348,25 @@ class BrowserGymServer:
         logger.info(f"Starting WebSocket server on port {self.ws_port}")
         logger.info(f"CDP port: {self.cdp_port}")
         
-        async with serve(self.handle_client, "localhost", self.ws_port):
-            logger.info(f"Server started on ws://localhost:{self.ws_port}")
-            await asyncio.Future()  # Run forever
+        # Les clients qui demandent FRAME_SUBPROTOCOL reçoivent les frames en binaire
+        self.loop_monitor.start()
+        
+        try:
+            async with serve(self.handle_client, "localhost", self.ws_port, subprotocols=[FRAME_SUBPROTOCOL]):
+                logger.info(f"Server started on ws://localhost:{self.ws_port}")
+                await asyncio.Future()  # Run forever
+        finally:
+            self.cancel_agent_tasks()
+            self.loop_monitor.stop()
+            self.image_workers.shutdown()
+            if self.hybrid_agent:
+                await self.hybrid_agent.plan_cache.flush()
+            if self.grounding_cache:
+                await self.grounding_cache.flush()
+            if BROWSERGYM_AVAILABLE:
+                await close_llm_client()
+            if self.vlm_service:
+                await self.vlm_service.aclose()
 
 
 def main():
@@ -872,13 +1374,34 @@ def main():
     parser.add_argument('--cdp-port', type=int, default=9222, help='CDP port')
     parser.add_argument('--ws-port', type=int, default=8765, help='WebSocket port')
     parser.add_argument('--debug', action='store_true', help='Enable debug logging')
+    parser.add_argument('--stream-mode', choices=['screencast', 'poll'], default='screencast',
+                        help='Screenshot streaming mode (CDP screencast push or screenshot polling)')
+    parser.add_argument('--screencast-format', choices=['jpeg', 'png'], default='jpeg', help='Screencast frame format')
+    parser.add_argument('--screencast-quality', type=int, default=70, help='Screencast JPEG quality (0-100)')
+    parser.add_argument('--screencast-max-width', type=int, default=1024, help='Screencast max frame width')
+    parser.add_argument('--screencast-max-height', type=int, default=768, help='Screencast max frame height')
+    parser.add_argument('--keyframe-interval', type=float, default=5.0,
+                        help='Seconds between keyframes re-sent while the page is unchanged')
     
     args = parser.parse_args()
     
     if args.debug:
         logging.getLogger().setLevel(logging.DEBUG)
     
-    server = BrowserGymServer(cdp_port=args.cdp_port, ws_port=args.ws_port)
+    screencast_config = ScreencastConfig(
+        format=args.screencast_format,
+        quality=args.screencast_quality,
+        max_width=args.screencast_max_width,
+        max_height=args.screencast_max_height
+    )
+    
+    server = BrowserGymServer(
+        cdp_port=args.cdp_port,
+        ws_port=args.ws_port,
+        stream_mode=args.stream_mode,
+        screencast_config=screencast_config,
+        keyframe_interval=args.keyframe_interval
+    )
     
     try:
         asyncio.run(server.start())
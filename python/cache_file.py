@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+CacheFile - Persistance JSON des caches (plans, grounding) hors de l'event loop
+Les modifications rapprochées sont regroupées en une seule écriture atomique (fichier .tmp puis rename)
+"""
+
+import asyncio
+import json
+import logging
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Délai de regroupement des écritures (secondes)
+SAVE_DELAY = 2.0
+
+
+class CacheFile:
+    """
+    `schedule(snapshot)` après chaque modification : `snapshot()` (copie légère, appelée sur l'event loop)
+    est sérialisée et écrite dans un thread au plus une fois par `delay`. `flush()` à l'arrêt.
+    Sans event loop (scripts, tests synchrones), l'écriture est immédiate.
+    `default` : sérialisation des objets que json ne connaît pas (ex. dataclasses.asdict)
+    """
+
+    def __init__(self, path: Path, label: str, delay: float = SAVE_DELAY,
+                 default: Optional[Callable[[Any], Any]] = None):
+        self.path = path
+        self.label = label
+        self.delay = delay
+        self.default = default
+        self._snapshot: Optional[Callable[[], Dict[str, Any]]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._writing: Optional[asyncio.Future] = None
+
+    def load(self) -> Optional[Dict[str, Any]]:
+        """Contenu du fichier, None s'il n'existe pas ou est illisible"""
+        if not self.path.exists():
+            return None
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not load {self.label} {self.path}: {e}")
+            return None
+
+    def schedule(self, snapshot: Callable[[], Dict[str, Any]]):
+        self._snapshot = snapshot
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._write(self._take())
+            return
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._save_later())
+
+    async def flush(self):
+        """Écrire tout de suite les modifications en attente"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+        await self._save()
+
+    async def _save_later(self):
+        # Modifications arrivées pendant l'écriture : une nouvelle écriture après le délai
+        while self._snapshot is not None:
+            await asyncio.sleep(self.delay)
+            await self._save()
+
+    async def _save(self):
+        # Une écriture à la fois : la précédente (éventuellement déjà lancée dans son thread) se termine d'abord
+        if self._writing and not self._writing.done():
+            await asyncio.shield(self._writing)
+        if self._snapshot is None:
+            return
+        self._writing = asyncio.ensure_future(asyncio.to_thread(self._write, self._take()))
+        await asyncio.shield(self._writing)
+
+    def _take(self) -> Dict[str, Any]:
+        snapshot, self._snapshot = self._snapshot, None
+        return snapshot()
+
+    def _write(self, data: Dict[str, Any]):
+        try:
+            tmp_path = self.path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=2, ensure_ascii=False, default=self.default)
+            tmp_path.replace(self.path)
+        except (OSError, TypeError, ValueError) as e:
+            logger.warning(f"⚠️ Could not save {self.label}: {e}")
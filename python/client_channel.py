@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+ClientChannel - File d'envoi dédiée à chaque client WebSocket
+- Messages de contrôle : FIFO, livrés dans l'ordre (jamais supprimés)
+- Frames : un seul slot, la plus récente remplace la précédente (latest-frame-wins)
+Un client lent ne ralentit ni le streaming ni les autres clients
+"""
+
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Union
+
+from frame_protocol import FRAME_SUBPROTOCOL, StreamFrame, DeltaFrame
+
+logger = logging.getLogger(__name__)
+
+
+class ClientChannel:
+    """Writer task + file bornée pour un client"""
+
+    def __init__(self, websocket, max_control_queue: int = 1000):
+        self.websocket = websocket
+        self.client_id = id(websocket)
+        self.binary_frames = getattr(websocket, 'subprotocol', None) == FRAME_SUBPROTOCOL
+        self.max_control_queue = max_control_queue
+
+        # Mode delta (opt-in) : id de la dernière keyframe reçue par ce client
+        self.delta_enabled = False
+        self.keyframe_id: Optional[int] = None
+
+        self._control: deque = deque()
+        self._pending_frame: Optional[StreamFrame] = None
+        self._pending_since: Optional[float] = None
+        self._wakeup = asyncio.Event()
+        self._writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+
+        # Statistiques
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.control_sent = 0
+        self.bytes_sent = 0
+        self.last_frame_lag_ms = 0.0
+        self.max_frame_lag_ms = 0.0
+        self.last_send_ms = 0.0
+
+    def start(self):
+        """Démarrer la tâche d'écriture"""
+        if not self._writer_task:
+            self._writer_task = asyncio.create_task(self._writer())
+
+    async def close(self):
+        """Arrêter la tâche d'écriture (le socket est fermé par websockets)"""
+        self.closed = True
+        self._control.clear()
+        self._pending_frame = None
+        if self._writer_task:
+            self._writer_task.cancel()
+            try:
+                await self._writer_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._writer_task = None
+
+    def send_control(self, message: Union[Dict[str, Any], str]):
+        """Mettre en file un message de contrôle (non bloquant, livraison garantie)"""
+        if self.closed:
+            return
+
+        if len(self._control) >= self.max_control_queue:
+            # Le client ne lit plus rien : mieux vaut le déconnecter que gonfler la mémoire
+            logger.warning(f"⚠️ Client {self.client_id} control queue full ({len(self._control)}), disconnecting")
+            self.closed = True
+            self._control.clear()
+            asyncio.create_task(self.websocket.close(code=1008, reason='Client too slow'))
+            return
+
+        self._control.append(message if isinstance(message, str) else json.dumps(message))
+        self._wakeup.set()
+
+    def request_keyframe(self):
+        """Resynchronisation : la prochaine frame delta sera précédée de sa keyframe"""
+        self.keyframe_id = None
+
+    def send_frame(self, frame: Union[StreamFrame, DeltaFrame]):
+        """Remplacer la frame en attente par la plus récente (non bloquant)"""
+        if self.closed:
+            return
+
+        if self._pending_frame is not None:
+            self.frames_dropped += 1
+        else:
+            self._pending_since = time.time()
+
+        self._pending_frame = frame
+        self._wakeup.set()
+
+    @property
+    def pending_frame_age_ms(self) -> float:
+        if self._pending_frame is None or self._pending_since is None:
+            return 0.0
+        return (time.time() - self._pending_since) * 1000
+
+    def stats(self) -> Dict[str, Any]:
+        """Lag et débit vus par ce client"""
+        return {
+            'client_id': self.client_id,
+            'binary_frames': self.binary_frames,
+            'delta_enabled': self.delta_enabled,
+            'frames_sent': self.frames_sent,
+            'frames_dropped': self.frames_dropped,
+            'control_sent': self.control_sent,
+            'control_queue_depth': len(self._control),
+            'bytes_sent': self.bytes_sent,
+            'frame_lag_ms': round(self.last_frame_lag_ms, 1),
+            'max_frame_lag_ms': round(self.max_frame_lag_ms, 1),
+            'pending_frame_age_ms': round(self.pending_frame_age_ms, 1),
+            'last_send_ms': round(self.last_send_ms, 1)
+        }
+
+    async def _writer(self):
+        """Vider les messages de contrôle en priorité, puis la frame la plus récente"""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+
+                while self._control:
+                    message = self._control.popleft()
+                    await self._send(message)
+                    self.control_sent += 1
+
+                frame, self._pending_frame = self._pending_frame, None
+                if frame is not None:
+                    for message_frame in self._frames_to_send(frame):
+                        payload = message_frame.to_binary_message() if self.binary_frames else message_frame.to_json_message()
+                        await self._send(payload)
+                        if isinstance(message_frame, StreamFrame):
+                            self.keyframe_id = message_frame.frame_id
+                    self.frames_sent += 1
+                    self.last_frame_lag_ms = time.time() * 1000 - frame.timestamp
+                    self.max_frame_lag_ms = max(self.max_frame_lag_ms, self.last_frame_lag_ms)
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Connexion fermée : handle_client fera le ménage
+            logger.debug(f"Client {self.client_id} writer stopped: {e}")
+            self.closed = True
+
+    def _frames_to_send(self, frame: Union[StreamFrame, DeltaFrame]) -> List[Union[StreamFrame, DeltaFrame]]:
+        """Choisir ce que ce client doit recevoir pour une frame donnée"""
+        if not isinstance(frame, DeltaFrame):
+            return [frame]
+
+        # Client sans mode delta : image complète
+        if not self.delta_enabled:
+            return [frame.full]
+
+        # Le client n'a pas (ou plus) la keyframe de référence : l'envoyer d'abord
+        if self.keyframe_id != frame.base_id:
+            return [frame.base, frame]
+
+        return [frame]
+
+    async def _send(self, payload: Union[str, bytes]):
+        start = time.perf_counter()
+        await self.websocket.send(payload)
+        self.last_send_ms = (time.perf_counter() - start) * 1000
+        self.bytes_sent += len(payload)
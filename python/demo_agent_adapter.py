@@ -8,6 +8,9 @@ import logging
 import openai
 from typing import Dict, Any, Optional
 
+from llm_client import create_chat_completion, get_llm_client
+from resilience import CircuitOpenError
+
 logger = logging.getLogger(__name__)
 
 try:
@@ -26,7 +29,7 @@ class ElectronDemoAgent:
     
     def __init__(self, model_name: str = "gpt-4o-mini"):
         self.model_name = model_name
-        self.openai_client = openai.OpenAI()
+        self.openai_client = get_llm_client()  # Lève une erreur sans OPENAI_API_KEY
         self.action_history = []
         
         if BROWSERGYM_AVAILABLE:
@@ -41,7 +44,7 @@ class ElectronDemoAgent:
         
         logger.info(f"ElectronDemoAgent initialized with model: {model_name}")
     
-    def get_action_from_message(self, user_message: str, page_info: Optional[Dict] = None) -> Dict[str, Any]:
+    async def get_action_from_message(self, user_message: str, page_info: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Interpréter un message utilisateur et retourner l'action à exécuter
         
@@ -85,7 +88,7 @@ Respond with ONLY the action in the format above, nothing else.
             
             # Appel à l'API OpenAI
             logger.info(f"Calling OpenAI API with: {user_message}")
-            response = self.openai_client.chat.completions.create(
+            response = await create_chat_completion(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": system_prompt},
@@ -108,7 +111,7 @@ Respond with ONLY the action in the format above, nothing else.
                 'reasoning': f"Interpreted '{user_message}' as: {action}"
             }
             
-        except openai.OpenAIError as e:
+        except (openai.OpenAIError, CircuitOpenError) as e:
             logger.error(f"OpenAI API error: {e}")
             return {
                 'action': None,
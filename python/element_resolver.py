@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+ElementResolver - Résolution d'une cible de clic en un seul evaluate
+Le script injecté dans la page score tous les candidats (sélecteur, texte, href, aria-label, rôle, index)
+et marque le gagnant d'un data-bid pour le récupérer en handle
+"""
+
+import logging
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Scores repris du smart link matching du WorkflowPlayer, étendus aux autres indices de contexte.
+# Un gagnant qui ne correspond que partiellement par le texte est signalé (strong: false) et refusé.
+RESOLVER_JS = r"""
+(() => {
+    if (window.__bgResolve) return;
+
+    // Rôles de widgets uniquement : [role=list], [role=dialog], [tabindex]... désignent des conteneurs
+    const INTERACTIVE = 'a[href], button, input:not([type=hidden]), select, textarea, summary, label, '
+        + '[role=button], [role=link], [role=menuitem], [role=menuitemcheckbox], [role=menuitemradio], '
+        + '[role=tab], [role=checkbox], [role=radio], [role=switch], [role=option], [role=combobox], '
+        + '[role=textbox], [role=searchbox], [role=treeitem], [onclick], [contenteditable=true]';
+    // Textes plus courts ("x", "ok") : seulement en correspondance exacte
+    const MIN_PARTIAL_TEXT = 3;
+    const TEXT_SIGNALS = new Set(['text_contains', 'text_partial', 'common_words']);
+    const norm = (s) => (s || '').replace(/\s+/g, ' ').trim().toLowerCase();
+    const words = (s) => ' ' + s.split(/[^\p{L}\p{N}]+/u).filter(Boolean).join(' ') + ' ';
+    // `needle` présent dans `hay` en mots entiers
+    const containsWords = (hay, needle) => needle.length >= MIN_PARTIAL_TEXT && words(hay).includes(words(needle));
+    const host = (url) => { try { return new URL(url, location.href).host.toLowerCase(); } catch (e) { return ''; } };
+    const visible = (el) => {
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) return false;
+        const style = window.getComputedStyle(el);
+        return style.visibility !== 'hidden' && style.display !== 'none';
+    };
+
+    window.__bgResolve = (target) => {
+        let selected = [];
+        if (target.selector) {
+            try { selected = Array.from(document.querySelectorAll(target.selector)); } catch (e) { /* sélecteur invalide */ }
+        }
+        const pool = new Set(selected);
+        for (const el of document.querySelectorAll(INTERACTIVE)) {
+            // Conteneur cliquable d'autres éléments interactifs : ses enfants sont candidats eux-mêmes
+            if (el.querySelector(INTERACTIVE)) continue;
+            pool.add(el);
+        }
+
+        const text = norm(target.text);
+        const href = target.href || '';
+        const domain = href ? host(href) : '';
+        const aria = norm(target.ariaLabel);
+        const results = [];
+
+        for (const el of pool) {
+            if (!visible(el)) continue;
+            let score = 0;
+            const details = [];
+            const add = (points, label) => { score += points; details.push(`${label}=${points}`); };
+
+            if (selected.includes(el)) {
+                add(60, 'selector');
+                // index enregistré = position parmi les frères de l'élément (cf. getElementContext)
+                const siblings = el.parentElement ? Array.from(el.parentElement.children) : [];
+                if (target.index != null && siblings.indexOf(el) === target.index) add(30, 'index');
+            }
+
+            const elText = norm(el.innerText || el.value || el.getAttribute('aria-label') || el.getAttribute('title'));
+            if (text && elText) {
+                if (elText === text) add(100, 'text_exact');
+                else if (containsWords(elText, text)) add(70, 'text_contains');
+                else if (containsWords(text, elText)) add(50, 'text_partial');
+                else {
+                    const words = new Set(text.split(' '));
+                    const common = elText.split(' ').filter((w) => words.has(w));
+                    if (common.length) add(new Set(common).size * 10, 'common_words');
+                }
+            }
+
+            const elHref = el.getAttribute('href');
+            if (elHref) {
+                const elDomain = host(el.href || elHref);
+                if (domain && elDomain) {
+                    if (elDomain === domain) add(100, 'domain_exact');
+                    else if (elDomain.replace('www.', '') === domain.replace('www.', '')) add(90, 'domain_main');
+                    else if (elDomain.endsWith('.' + domain) || domain.endsWith('.' + elDomain)) add(50, 'domain_related');
+                }
+                if (href) {
+                    const absolute = el.href || elHref;
+                    if (elHref === href || absolute === href) add(50, 'href_exact');
+                    else if (absolute.includes(href) || href.includes(absolute)) add(30, 'href_partial');
+                }
+            }
+
+            if (aria) {
+                const elAria = norm(el.getAttribute('aria-label'));
+                if (elAria === aria) add(80, 'aria_exact');
+                else if (elAria && elAria.includes(aria)) add(40, 'aria_contains');
+            }
+            if (target.role && el.getAttribute('role') === target.role) add(20, 'role');
+
+            // Correspondance partielle du texte seule : trop faible pour cliquer
+            const strong = details.some((d) => !TEXT_SIGNALS.has(d.split('=')[0]));
+            if (score > 0) results.push({el, score, details, strong, length: elText.length});
+        }
+
+        // À score égal, le texte le plus court (élément le plus précis) d'abord
+        results.sort((a, b) => (b.strong - a.strong) || (b.score - a.score) || (a.length - b.length));
+        const top = results.slice(0, 5);
+        if (top.length && !top[0].el.hasAttribute('data-bid')) {
+            window.__bgBidSeq = (window.__bgBidSeq || 0) + 1;
+            top[0].el.setAttribute('data-bid', String(window.__bgBidSeq));
+        }
+        return {
+            candidates: results.length,
+            shortlist: top.map((r) => ({
+                score: r.score,
+                strong: r.strong,
+                text: (r.el.innerText || r.el.value || '').trim().slice(0, 50),
+                href: (r.el.getAttribute('href') || '').slice(0, 80),
+                details: r.details.join(', '),
+                bid: r.el.getAttribute('data-bid')
+            }))
+        };
+    };
+})()
+"""
+
+RESOLVE_CALL_JS = "(target) => window.__bgResolve ? window.__bgResolve(target) : null"
+
+# Pages ayant déjà reçu le script pour leurs prochains documents (add_init_script)
+_pages_with_init_script = weakref.WeakSet()
+
+
+@dataclass
+class ResolvedElement:
+    handle: Any  # ElementHandle du gagnant (None si sous le score minimum)
+    score: int
+    candidates: int
+    shortlist: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class ElementResolver:
+    """
+    `resolve({'selector', 'text', 'href', 'ariaLabel', 'role', 'index'})` :
+    un evaluate pour scorer tous les candidats + un query_selector pour le gagnant,
+    quel que soit le nombre de liens sur la page. `index` est la position de l'élément parmi ses frères.
+    Pas de handle si le meilleur candidat ne correspond que partiellement par le texte.
+    """
+
+    MIN_SCORE = 50
+
+    def __init__(self, page):
+        self.page = page
+
+    async def install(self):
+        """Injecter le résolveur dans le document courant et les suivants"""
+        if self.page not in _pages_with_init_script:
+            await self.page.add_init_script(RESOLVER_JS)
+            _pages_with_init_script.add(self.page)
+        await self.page.evaluate(RESOLVER_JS)
+
+    async def resolve(self, target: Dict[str, Any], min_score: Optional[int] = None) -> Optional[ResolvedElement]:
+        min_score = self.MIN_SCORE if min_score is None else min_score
+        target = {key: value for key, value in target.items() if value not in (None, '')}
+
+        result = await self.page.evaluate(RESOLVE_CALL_JS, target)
+        if result is None:
+            # Document chargé avant l'injection (ou page recréée)
+            await self.install()
+            result = await self.page.evaluate(RESOLVE_CALL_JS, target)
+
+        shortlist = result.get('shortlist', []) if result else []
+        if not shortlist:
+            return None
+
+        for i, candidate in enumerate(shortlist):
+            logger.info(f"     #{i+1} [score={candidate['score']:3d}] {candidate['text']} → {candidate['href']} ({candidate['details']})")
+
+        best = shortlist[0]
+        handle = None
+        if best['score'] >= min_score and best.get('strong'):
+            handle = await self.page.query_selector(f'[data-bid="{best["bid"]}"]')
+        return ResolvedElement(handle=handle, score=best['score'], candidates=result['candidates'], shortlist=shortlist)
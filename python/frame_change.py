@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+FrameChangeDetector - Supprime les frames identiques à la dernière envoyée
+Hash des octets bruts (blake2b) + keyframe périodique (heartbeat)
+"""
+
+import time
+from typing import Dict, Any, Optional
+
+from frame_protocol import StreamFrame
+
+
+class FrameChangeDetector:
+    """
+    Décide si une frame capturée doit être diffusée.
+    Une frame identique à la précédente n'est renvoyée que comme keyframe,
+    au plus toutes les `keyframe_interval` secondes.
+    """
+
+    def __init__(self, keyframe_interval: float = 5.0):
+        self.keyframe_interval = keyframe_interval
+        self.last_digest: Optional[bytes] = None
+        self.last_frame: Optional[StreamFrame] = None
+        self.last_sent_at = 0.0
+
+        # Compteurs
+        self.frames_captured = 0
+        self.frames_sent = 0
+        self.frames_suppressed = 0
+        self.keyframes_sent = 0
+
+    def is_unchanged(self, digest: bytes) -> bool:
+        """
+        Compter une capture et dire si elle peut être supprimée.
+        Permet de tester l'image brute avant de payer son réencodage.
+        """
+        self.frames_captured += 1
+
+        if digest != self.last_digest:
+            return False
+
+        if not self.keyframe_due():
+            self.frames_suppressed += 1
+            return True
+
+        self.keyframes_sent += 1
+        return False
+
+    def mark_sent(self, frame: StreamFrame, digest: bytes):
+        """La frame (éventuellement réencodée) de cette capture est diffusée"""
+        self.last_digest = digest
+        self._mark_sent(frame)
+
+    def keyframe_due(self) -> bool:
+        return self.last_frame is not None and time.time() - self.last_sent_at >= self.keyframe_interval
+
+    def heartbeat_frame(self, frame_id: int) -> Optional[StreamFrame]:
+        """
+        Keyframe à renvoyer quand aucune frame n'est sortie depuis `keyframe_interval`
+        (page immobile en mode screencast : le compositor n'envoie plus rien)
+        """
+        if not self.keyframe_due():
+            return None
+
+        frame = self.last_frame.refreshed(frame_id)
+        self.keyframes_sent += 1
+        self._mark_sent(frame)
+        return frame
+
+    def _mark_sent(self, frame: StreamFrame):
+        self.last_frame = frame
+        self.last_sent_at = time.time()
+        self.frames_sent += 1
+
+    def reset(self):
+        """Oublier la dernière frame (changement de page / redémarrage du streaming)"""
+        self.last_digest = None
+        self.last_frame = None
+        self.last_sent_at = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'frames_captured': self.frames_captured,
+            'frames_sent': self.frames_sent,
+            'frames_suppressed': self.frames_suppressed,
+            'keyframes_sent': self.keyframes_sent
+        }
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+DeltaEncoder - Encodage "dirty rectangles" du live view
+Compare chaque frame à la dernière keyframe par tuiles et n'envoie que les tuiles modifiées
+Nécessite Pillow (optionnel : sans Pillow, le mode delta est désactivé)
+"""
+
+import io
+import logging
+import time
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from frame_protocol import StreamFrame, DeltaFrame, DeltaTile
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image, ImageChops
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+class DeltaEncoder:
+    """
+    Produit soit une keyframe (StreamFrame complète), soit une DeltaFrame
+    relative à la dernière keyframe. Les deltas sont cumulatifs (toujours
+    par rapport à la keyframe), donc un client peut en sauter sans se désynchroniser.
+    """
+
+    def __init__(
+        self,
+        tile_size: int = 64,
+        pixel_threshold: int = 16,
+        max_changed_ratio: float = 0.4,
+        keyframe_interval: float = 10.0
+    ):
+        self.tile_size = tile_size
+        self.pixel_threshold = pixel_threshold  # Tolérance au bruit JPEG
+        self.max_changed_ratio = max_changed_ratio
+        self.keyframe_interval = keyframe_interval
+
+        self.keyframe: Optional[StreamFrame] = None
+        self._keyframe_image = None
+        self._keyframe_at = 0.0
+
+        # Compteurs
+        self.keyframes = 0
+        self.deltas = 0
+        self.delta_bytes = 0
+        self.full_bytes_saved = 0
+
+    def reset(self):
+        """Forcer une keyframe à la prochaine frame"""
+        self.keyframe = None
+        self._keyframe_image = None
+
+    def encode(self, frame: StreamFrame, force_keyframe: bool = False) -> Union[StreamFrame, DeltaFrame]:
+        """Encoder une frame capturée en keyframe ou en delta"""
+        image = Image.open(io.BytesIO(frame.data)).convert('RGB')
+
+        if force_keyframe or self._keyframe_due(image):
+            return self._set_keyframe(frame, image)
+
+        boxes = self._changed_boxes(image)
+        total_tiles = self._tile_count(image.size)
+        changed_tiles = sum((box[2] - box[0]) * (box[3] - box[1]) for box in boxes) / (self.tile_size ** 2)
+
+        # Trop de changements : une keyframe coûte moins cher (et réinitialise la base)
+        if changed_tiles / total_tiles > self.max_changed_ratio:
+            return self._set_keyframe(frame, image)
+
+        tile_format = 'png' if frame.format == 'png' else 'jpeg'
+        tiles = [self._encode_tile(image, box, tile_format) for box in boxes]
+        delta = DeltaFrame(full=frame, base=self.keyframe, tiles=tiles, tile_format=tile_format)
+
+        # Delta plus gros que l'image complète (ex: tuiles PNG bruitées) : keyframe
+        if delta.payload_size >= len(frame.data):
+            return self._set_keyframe(frame, image)
+
+        self.deltas += 1
+        self.delta_bytes += delta.payload_size
+        self.full_bytes_saved += len(frame.data) - delta.payload_size
+        return delta
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'keyframes': self.keyframes,
+            'deltas': self.deltas,
+            'delta_bytes': self.delta_bytes,
+            'bytes_saved': self.full_bytes_saved
+        }
+
+    def _keyframe_due(self, image) -> bool:
+        return (
+            self._keyframe_image is None
+            or self._keyframe_image.size != image.size
+            or time.time() - self._keyframe_at >= self.keyframe_interval
+        )
+
+    def _set_keyframe(self, frame: StreamFrame, image) -> StreamFrame:
+        self.keyframe = frame
+        self._keyframe_image = image
+        self._keyframe_at = time.time()
+        self.keyframes += 1
+        return frame
+
+    def _tile_count(self, size: Tuple[int, int]) -> int:
+        width, height = size
+        cols = (width + self.tile_size - 1) // self.tile_size
+        rows = (height + self.tile_size - 1) // self.tile_size
+        return max(cols * rows, 1)
+
+    def _changed_boxes(self, image) -> List[Tuple[int, int, int, int]]:
+        """Tuiles modifiées, fusionnées horizontalement en rectangles (left, top, right, bottom)"""
+        threshold = self.pixel_threshold
+        diff = ImageChops.difference(self._keyframe_image, image).convert('L')
+        mask = diff.point(lambda v: 255 if v > threshold else 0)
+
+        # Rien n'a changé par rapport à la keyframe
+        if not mask.getbbox():
+            return []
+
+        width, height = image.size
+        size = self.tile_size
+        boxes = []
+
+        for top in range(0, height, size):
+            bottom = min(top + size, height)
+            run_start = None
+
+            for left in range(0, width, size):
+                right = min(left + size, width)
+                changed = mask.crop((left, top, right, bottom)).getbbox() is not None
+
+                if changed and run_start is None:
+                    run_start = left
+                elif not changed and run_start is not None:
+                    boxes.append((run_start, top, left, bottom))
+                    run_start = None
+
+            if run_start is not None:
+                boxes.append((run_start, top, width, bottom))
+
+        return boxes
+
+    def _encode_tile(self, image, box: Tuple[int, int, int, int], tile_format: str) -> DeltaTile:
+        buffer = io.BytesIO()
+        tile = image.crop(box)
+        if tile_format == 'jpeg':
+            tile.save(buffer, 'JPEG', quality=80)
+        else:
+            tile.save(buffer, 'PNG')
+
+        left, top, right, bottom = box
+        return DeltaTile(x=left, y=top, width=right - left, height=bottom - top, data=buffer.getvalue())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Protocole binaire pour les frames du live view
+Sous-protocole WebSocket négocié : header fixe + octets bruts de l'image
+Les clients texte (JSON + base64) restent supportés
+"""
+
+import base64
+import hashlib
+import json
+import struct
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+# Sous-protocole à demander dans le handshake WebSocket (Sec-WebSocket-Protocol)
+FRAME_SUBPROTOCOL = 'browsergym.frames.v1'
+
+FRAME_MAGIC = b'BGFR'
+FRAME_VERSION = 1
+
+# magic, version, kind, format, flags, frame_id, timestamp (ms), width, height
+FRAME_HEADER = struct.Struct('!4sBBBBIdHH')
+
+FRAME_KIND_FULL = 0
+FRAME_KIND_DELTA = 1
+
+# Après le header d'une frame delta : base_id, nombre de tuiles
+DELTA_HEADER = struct.Struct('!IH')
+# Pour chaque tuile : x, y, largeur, hauteur, taille des données
+TILE_HEADER = struct.Struct('!HHHHI')
+
+FORMAT_CODES = {'png': 0, 'jpeg': 1, 'webp': 2}
+FORMAT_NAMES = {code: name for name, code in FORMAT_CODES.items()}
+
+
+def frame_digest(payload: bytes) -> bytes:
+    """Empreinte rapide d'une image (détection de frames identiques)"""
+    return hashlib.blake2b(payload, digest_size=16).digest()
+
+
+def image_size(data: bytes, fmt: str) -> Tuple[int, int]:
+    """Lire (largeur, hauteur) depuis l'en-tête PNG/JPEG sans décoder l'image"""
+    try:
+        if fmt == 'png' and data[12:16] == b'IHDR':
+            return struct.unpack('!II', data[16:24])
+
+        if fmt == 'jpeg':
+            # Parcourir les segments jusqu'au SOFn
+            i = 2
+            while i + 9 < len(data):
+                if data[i] != 0xFF:
+                    i += 1
+                    continue
+                marker = data[i + 1]
+                if marker in (0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF):
+                    height, width = struct.unpack('!HH', data[i + 5:i + 9])
+                    return width, height
+                segment_length = struct.unpack('!H', data[i + 2:i + 4])[0]
+                i += 2 + segment_length
+    except (struct.error, IndexError):
+        pass
+
+    return 0, 0
+
+
+@dataclass
+class StreamFrame:
+    """
+    Une frame du live view.
+    Les représentations (octets bruts, base64, message JSON, message binaire)
+    sont calculées à la demande puis mises en cache : une seule conversion
+    par frame, quel que soit le nombre de clients.
+    """
+    frame_id: int
+    format: str = 'png'
+    timestamp: float = field(default_factory=lambda: time.time() * 1000)
+    _data: Optional[bytes] = None
+    _base64: Optional[str] = None
+    _size: Optional[Tuple[int, int]] = None
+    _json_message: Optional[str] = None
+    _binary_message: Optional[bytes] = None
+
+    @classmethod
+    def from_bytes(cls, frame_id: int, data: bytes, fmt: str = 'png') -> 'StreamFrame':
+        return cls(frame_id=frame_id, format=fmt, _data=data)
+
+    @classmethod
+    def from_base64(cls, frame_id: int, data_base64: str, fmt: str = 'png') -> 'StreamFrame':
+        return cls(frame_id=frame_id, format=fmt, _base64=data_base64)
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def data_base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode('ascii')
+        return self._base64
+
+    @property
+    def digest(self) -> bytes:
+        """Empreinte calculée sur la représentation déjà disponible (sans conversion)"""
+        return frame_digest(self._data if self._data is not None else self._base64.encode('ascii'))
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        if self._size is None:
+            self._size = image_size(self.data, self.format)
+        return self._size
+
+    def refreshed(self, frame_id: int) -> 'StreamFrame':
+        """Même image sous un nouvel id/timestamp (keyframe), sans réencodage"""
+        return StreamFrame(
+            frame_id=frame_id,
+            format=self.format,
+            _data=self._data,
+            _base64=self._base64,
+            _size=self._size
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Message 'screenshot' historique (clients texte)"""
+        return {
+            'type': 'screenshot',
+            'data': self.data_base64,
+            'format': self.format,
+            'frame_id': self.frame_id,
+            'timestamp': self.timestamp
+        }
+
+    def to_json_message(self) -> str:
+        if self._json_message is None:
+            self._json_message = json.dumps(self.to_dict())
+        return self._json_message
+
+    def to_binary_message(self) -> bytes:
+        if self._binary_message is None:
+            width, height = self.size
+            header = FRAME_HEADER.pack(
+                FRAME_MAGIC,
+                FRAME_VERSION,
+                FRAME_KIND_FULL,
+                FORMAT_CODES.get(self.format, 0),
+                0,
+                self.frame_id & 0xFFFFFFFF,
+                self.timestamp,
+                min(width, 0xFFFF),
+                min(height, 0xFFFF)
+            )
+            self._binary_message = header + self.data
+        return self._binary_message
+
+
+@dataclass
+class DeltaTile:
+    """Rectangle modifié, encodé comme une petite image"""
+    x: int
+    y: int
+    width: int
+    height: int
+    data: bytes
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'x': self.x,
+            'y': self.y,
+            'w': self.width,
+            'h': self.height,
+            'data': base64.b64encode(self.data).decode('ascii')
+        }
+
+
+@dataclass
+class DeltaFrame:
+    """
+    Frame delta : uniquement les tuiles qui diffèrent de la keyframe `base`.
+    `full` est la frame complète capturée, envoyée aux clients sans mode delta.
+    """
+    full: StreamFrame
+    base: StreamFrame
+    tiles: List[DeltaTile]
+    tile_format: str = 'png'
+    _json_message: Optional[str] = None
+    _binary_message: Optional[bytes] = None
+
+    @property
+    def frame_id(self) -> int:
+        return self.full.frame_id
+
+    @property
+    def timestamp(self) -> float:
+        return self.full.timestamp
+
+    @property
+    def base_id(self) -> int:
+        return self.base.frame_id
+
+    @property
+    def payload_size(self) -> int:
+        return sum(len(tile.data) for tile in self.tiles)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Message 'screenshot_delta' : type distinct, ignoré par les clients qui ne savent pas le décoder"""
+        return {
+            'type': 'screenshot_delta',
+            'format': self.tile_format,
+            'frame_id': self.frame_id,
+            'base_id': self.base_id,
+            'timestamp': self.timestamp,
+            'tiles': [tile.to_dict() for tile in self.tiles]
+        }
+
+    def to_json_message(self) -> str:
+        if self._json_message is None:
+            self._json_message = json.dumps(self.to_dict())
+        return self._json_message
+
+    def to_binary_message(self) -> bytes:
+        if self._binary_message is None:
+            width, height = self.base.size
+            parts = [
+                FRAME_HEADER.pack(
+                    FRAME_MAGIC,
+                    FRAME_VERSION,
+                    FRAME_KIND_DELTA,
+                    FORMAT_CODES.get(self.tile_format, 0),
+                    0,
+                    self.frame_id & 0xFFFFFFFF,
+                    self.timestamp,
+                    min(width, 0xFFFF),
+                    min(height, 0xFFFF)
+                ),
+                DELTA_HEADER.pack(self.base_id & 0xFFFFFFFF, len(self.tiles))
+            ]
+            for tile in self.tiles:
+                parts.append(TILE_HEADER.pack(tile.x, tile.y, tile.width, tile.height, len(tile.data)))
+                parts.append(tile.data)
+            self._binary_message = b''.join(parts)
+        return self._binary_message
+
+
+def decode_frame_header(message: bytes) -> Dict[str, Any]:
+    """Décoder le header d'un message binaire (utile côté client Python / debug)"""
+    magic, version, kind, fmt, flags, frame_id, timestamp, width, height = FRAME_HEADER.unpack_from(message)
+    if magic != FRAME_MAGIC:
+        raise ValueError(f"Invalid frame magic: {magic!r}")
+
+    header = {
+        'version': version,
+        'kind': kind,
+        'format': FORMAT_NAMES.get(fmt, 'png'),
+        'flags': flags,
+        'frame_id': frame_id,
+        'timestamp': timestamp,
+        'width': width,
+        'height': height,
+        'payload_offset': FRAME_HEADER.size
+    }
+
+    if kind == FRAME_KIND_DELTA:
+        base_id, tile_count = DELTA_HEADER.unpack_from(message, FRAME_HEADER.size)
+        offset = FRAME_HEADER.size + DELTA_HEADER.size
+        tiles = []
+        for _ in range(tile_count):
+            x, y, w, h, length = TILE_HEADER.unpack_from(message, offset)
+            offset += TILE_HEADER.size
+            tiles.append({'x': x, 'y': y, 'w': w, 'h': h, 'offset': offset, 'length': length})
+            offset += length
+        header['base_id'] = base_id
+        header['tiles'] = tiles
+
+    return header
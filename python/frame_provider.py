@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+FrameProvider - Bus de screenshots partagé (live view, agent, VLM)
+Une seule capture CDP sert tous les consommateurs qui tolèrent une frame de moins de N ms
+"""
+
+import asyncio
+import base64
+import io
+import logging
+import time
+from typing import Dict, Any, Optional, Tuple
+
+from frame_pyramid import FramePyramid
+from image_workers import ImageWorkerPool, get_image_pool
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+def normalize_format(fmt: str) -> str:
+    return 'jpeg' if fmt in ('jpg', 'jpeg') else 'png'
+
+
+class CapturedFrame:
+    """
+    Un screenshot dans un format donné.
+    Octets bruts et base64 sont convertis à la demande puis gardés en cache.
+    """
+
+    def __init__(
+        self,
+        format: str,
+        data: Optional[bytes] = None,
+        data_base64: Optional[str] = None,
+        full_resolution: bool = True,
+        captured_at: Optional[float] = None
+    ):
+        self.format = format
+        self.full_resolution = full_resolution
+        self.captured_at = captured_at if captured_at is not None else time.monotonic()
+        self._data = data
+        self._base64 = data_base64
+        self.pyramid: Optional[FramePyramid] = None  # Créée par FrameProvider.get_pyramid
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = base64.b64decode(self._base64)
+        return self._data
+
+    @property
+    def base64(self) -> str:
+        if self._base64 is None:
+            self._base64 = base64.b64encode(self._data).decode('utf-8')
+        return self._base64
+
+    async def load_base64(self, workers: ImageWorkerPool) -> str:
+        """Comme `base64`, mais l'encodage éventuel se fait dans le pool (hors event loop)"""
+        if self._base64 is None:
+            self._base64 = await workers.b64encode(self._data)
+        return self._base64
+
+    async def load_data(self, workers: ImageWorkerPool) -> bytes:
+        """Comme `data`, mais le décodage éventuel se fait dans le pool (hors event loop)"""
+        if self._data is None:
+            self._data = await workers.b64decode(self._base64)
+        return self._data
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    @property
+    def age_ms(self) -> float:
+        return (time.monotonic() - self.captured_at) * 1000
+
+
+class FrameProvider:
+    """
+    Fournit des screenshots récents de la page :
+    - cache de la dernière capture (par format)
+    - une capture en cours est partagée entre tous les appelants concurrents
+    - les frames du screencast CDP alimentent aussi le cache
+    """
+
+    def __init__(self, page=None, jpeg_quality: int = 80, workers: Optional[ImageWorkerPool] = None):
+        self.page = page
+        self.jpeg_quality = jpeg_quality
+        self.workers = workers or get_image_pool()
+        self._latest: Dict[str, CapturedFrame] = {}
+        self._inflight: Optional[asyncio.Task] = None
+
+        # Statistiques
+        self.captures = 0
+        self.cache_hits = 0
+        self.shared_waits = 0
+        self.conversions = 0
+        self.pyramids = 0
+
+    def attach(self, page):
+        """Changer de page (reconnexion) : oublier le cache"""
+        self.page = page
+        self.invalidate()
+
+    def invalidate(self):
+        """Les frames en cache ne reflètent plus la page (ex: juste après une action)"""
+        self._latest = {}
+
+    def ingest(self, frame: CapturedFrame):
+        """Ajouter une frame capturée ailleurs (screencast) au cache"""
+        self._latest = {frame.format: frame}
+
+    async def get_frame(
+        self,
+        max_age_ms: float = 200,
+        format: str = 'png',
+        full_resolution: bool = False
+    ) -> CapturedFrame:
+        """
+        Retourner une frame de moins de `max_age_ms` dans le format demandé.
+        `full_resolution=True` exclut les frames réduites du screencast
+        (indispensable pour des coordonnées pixel exactes).
+        """
+        fmt = normalize_format(format)
+
+        frame = await self._cached(fmt, max_age_ms, full_resolution)
+        if frame:
+            self.cache_hits += 1
+            return frame
+
+        if self._inflight is None:
+            self._inflight = asyncio.create_task(self._capture())
+        else:
+            self.shared_waits += 1
+
+        # shield : l'annulation d'un appelant n'annule pas la capture des autres
+        await asyncio.shield(self._inflight)
+
+        frame = await self._cached(fmt, float('inf'), full_resolution)
+        if frame:
+            return frame
+
+        # Conversion impossible (pas de Pillow) : capture directe dans le format demandé
+        data = await self.page.screenshot(type=fmt, **({'quality': self.jpeg_quality} if fmt == 'jpeg' else {}))
+        self.captures += 1
+        return CapturedFrame(fmt, data=data)
+
+    async def get_base64(self, max_age_ms: float = 200, format: str = 'png', full_resolution: bool = False) -> str:
+        frame = await self.get_frame(max_age_ms, format, full_resolution)
+        return await frame.load_base64(self.workers)
+
+    async def get_pyramid(self, max_age_ms: float = 200, full_resolution: bool = False) -> FramePyramid:
+        """
+        Pyramide (full/half/thumb) de la frame courante, dans son format d'origine.
+        Les coordonnées des niveaux se convertissent en pixels CSS de la page.
+        """
+        fmt = next(iter(self._latest)) if self._latest else 'png'
+        frame = await self.get_frame(max_age_ms, fmt, full_resolution)
+        if frame.pyramid is None:
+            frame.pyramid = FramePyramid(frame, await self._page_size(), self.workers, self.jpeg_quality)
+            self.pyramids += 1
+        return frame.pyramid
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'captures': self.captures,
+            'cache_hits': self.cache_hits,
+            'shared_waits': self.shared_waits,
+            'conversions': self.conversions,
+            'pyramids': self.pyramids
+        }
+
+    async def _page_size(self) -> Optional[Tuple[int, int]]:
+        """Taille du viewport en pixels CSS (les screenshots peuvent être en pixels device)"""
+        viewport = self.page.viewport_size
+        if viewport:
+            return viewport['width'], viewport['height']
+        try:
+            # Page connectée via CDP (Electron) : pas de viewport Playwright
+            width, height = await self.page.evaluate('[window.innerWidth, window.innerHeight]')
+            return width, height
+        except Exception as e:
+            logger.debug(f"Could not read viewport size: {e}")
+            return None
+
+    async def _capture(self):
+        try:
+            data = await self.page.screenshot(type='png')
+            self.captures += 1
+            self._latest = {'png': CapturedFrame('png', data=data)}
+        finally:
+            self._inflight = None
+
+    async def _cached(self, fmt: str, max_age_ms: float, full_resolution: bool) -> Optional[CapturedFrame]:
+        if not self._latest:
+            return None
+
+        source = next(iter(self._latest.values()))
+        if source.age_ms > max_age_ms or (full_resolution and not source.full_resolution):
+            return None
+
+        if fmt in self._latest:
+            return self._latest[fmt]
+
+        # PNG → JPEG (ou l'inverse) sans nouvelle capture
+        if not PIL_AVAILABLE:
+            return None
+
+        await source.load_data(self.workers)
+        converted = await self.workers.run(self._convert, source, fmt)
+        if self._latest and next(iter(self._latest.values())) is source:
+            self._latest[fmt] = converted
+        return converted
+
+    def _convert(self, source: CapturedFrame, fmt: str) -> CapturedFrame:
+        image = Image.open(io.BytesIO(source.data))
+        buffer = io.BytesIO()
+        if fmt == 'jpeg':
+            image.convert('RGB').save(buffer, 'JPEG', quality=self.jpeg_quality)
+        else:
+            image.save(buffer, 'PNG')
+
+        self.conversions += 1
+        return CapturedFrame(
+            fmt,
+            data=buffer.getvalue(),
+            full_resolution=source.full_resolution,
+            captured_at=source.captured_at
+        )
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+FramePyramid - Une capture, plusieurs résolutions (full, half, thumb)
+Chaque niveau est calculé à la demande et sait convertir ses coordonnées en pixels de la page
+(y compris une zone recadrée, cf. FramePyramid.region)
+"""
+
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+
+from frame_protocol import image_size
+from image_ops import PIL_AVAILABLE
+from image_workers import ImageWorkerPool, get_image_pool
+
+logger = logging.getLogger(__name__)
+
+# Facteur d'échelle par niveau (thumb : largeur fixe)
+HALF_SCALE = 0.5
+THUMB_WIDTH = 320
+# Zone d'intérêt plus étroite : agrandie jusqu'à cette largeur (au plus ROI_MAX_UPSCALE fois)
+ROI_MIN_WIDTH = 384
+ROI_MAX_UPSCALE = 2.0
+LEVELS = ('full', 'half', 'thumb')
+
+
+class PyramidLevel:
+    """
+    Un niveau de la pyramide : image encodée + mapping de coordonnées.
+    `page_size` est la taille du viewport en pixels CSS (ce qu'attend page.mouse.click).
+    """
+
+    def __init__(self, name: str, format: str, data: bytes, width: int, height: int, page_size: Tuple[int, int]):
+        self.name = name
+        self.format = format
+        self.data = data
+        self.width = width
+        self.height = height
+        self.page_width, self.page_height = page_size
+        self._base64: Optional[str] = None
+
+    @property
+    def mime_type(self) -> str:
+        return f"image/{self.format}"
+
+    async def load_base64(self, workers: ImageWorkerPool) -> str:
+        if self._base64 is None:
+            self._base64 = await workers.b64encode(self.data)
+        return self._base64
+
+    def to_page(self, x: float, y: float) -> Tuple[int, int]:
+        """Coordonnées dans cette image → pixels CSS de la page"""
+        if not self.width or not self.height:
+            return int(x), int(y)
+        return (
+            round(x * self.page_width / self.width),
+            round(y * self.page_height / self.height)
+        )
+
+    def from_page(self, x: float, y: float) -> Tuple[int, int]:
+        """Pixels CSS de la page → coordonnées dans cette image"""
+        if not self.page_width or not self.page_height:
+            return int(x), int(y)
+        return (
+            round(x * self.width / self.page_width),
+            round(y * self.height / self.page_height)
+        )
+
+
+class RegionLevel(PyramidLevel):
+    """
+    Zone `box` (pixels de l'image source) recadrée puis éventuellement agrandie.
+    Les coordonnées sont ramenées à la page entière, comme pour un niveau complet.
+    """
+
+    def __init__(self, source: PyramidLevel, box: Tuple[int, int, int, int], data: bytes, width: int, height: int):
+        super().__init__('roi', 'png', data, width, height, (source.page_width, source.page_height))
+        self.source = source
+        self.box = box
+
+    def to_page(self, x: float, y: float) -> Tuple[int, int]:
+        left, top, right, bottom = self.box
+        return self.source.to_page(left + x * (right - left) / self.width, top + y * (bottom - top) / self.height)
+
+    def from_page(self, x: float, y: float) -> Tuple[int, int]:
+        left, top, right, bottom = self.box
+        source_x, source_y = self.source.from_page(x, y)
+        return (
+            round((source_x - left) * self.width / (right - left)),
+            round((source_y - top) * self.height / (bottom - top))
+        )
+
+
+class FramePyramid:
+    """
+    Niveaux dérivés d'une capture :
+    - full  : l'image source telle quelle (VLM, coordonnées exactes)
+    - half  : JPEG demi-résolution (planner LLM en `detail: low`)
+    - thumb : JPEG de THUMB_WIDTH px de large (miniature UI)
+    Sans Pillow, tous les niveaux retombent sur `full`.
+    """
+
+    def __init__(
+        self,
+        source,
+        page_size: Optional[Tuple[int, int]] = None,
+        workers: Optional[ImageWorkerPool] = None,
+        jpeg_quality: int = 75
+    ):
+        self.source = source  # CapturedFrame
+        self.page_size = page_size
+        self.workers = workers or get_image_pool()
+        self.jpeg_quality = jpeg_quality
+        self._levels: Dict[str, asyncio.Task] = {}
+
+    async def level(self, name: str = 'full') -> PyramidLevel:
+        """Retourner (et calculer au premier appel) le niveau demandé"""
+        if name not in LEVELS:
+            raise ValueError(f"Unknown pyramid level: {name}")
+
+        if name not in self._levels:
+            self._levels[name] = asyncio.ensure_future(self._build(name))
+        return await asyncio.shield(self._levels[name])
+
+    async def _build(self, name: str) -> PyramidLevel:
+        if name != 'full':
+            full = await self.level('full')
+            scale = HALF_SCALE if name == 'half' else THUMB_WIDTH / full.width if full.width else 1.0
+            if not PIL_AVAILABLE or scale >= 1.0:
+                return full
+
+            data, width, height = await self.workers.reencode(full.data, 'jpeg', self.jpeg_quality, scale)
+            return PyramidLevel(name, 'jpeg', data, width, height, (full.page_width, full.page_height))
+
+        data = await self.source.load_data(self.workers)
+        width, height = image_size(data, self.source.format)
+        page_size = self.page_size or (width, height)
+        return PyramidLevel('full', self.source.format, data, width, height, page_size)
+
+    async def region(self, page_box: Tuple[int, int, int, int]) -> Optional[RegionLevel]:
+        """
+        Zone (x, y, largeur, hauteur en pixels CSS) du niveau 'full', agrandie si elle est étroite.
+        None sans Pillow ou si la zone est hors de l'image.
+        """
+        if not PIL_AVAILABLE:
+            return None
+
+        full = await self.level('full')
+        x, y, width, height = page_box
+        left, top = full.from_page(x, y)
+        right, bottom = full.from_page(x + width, y + height)
+        box = (max(0, left), max(0, top), min(full.width, right), min(full.height, bottom))
+        if box[2] - box[0] < 8 or box[3] - box[1] < 8:
+            return None
+
+        crop_width = box[2] - box[0]
+        scale = min(ROI_MAX_UPSCALE, ROI_MIN_WIDTH / crop_width) if crop_width < ROI_MIN_WIDTH else 1.0
+        data, crop_w, crop_h = await self.workers.crop(full.data, box, scale)
+        return RegionLevel(full, box, data, crop_w, crop_h)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+GroundingCache - Réutilisation des coordonnées trouvées par le VLM
+Clé : description normalisée + hash perceptuel (dHash) du screenshot ou de la zone autour de l'élément.
+Un hit n'est utilisé qu'après vérification dans le DOM (elementFromPoint) : quelques ms au lieu
+de plusieurs secondes d'inférence
+"""
+
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from cache_file import CacheFile
+from image_ops import PIL_AVAILABLE
+
+logger = logging.getLogger(__name__)
+
+# À côté du module, quel que soit le répertoire de lancement du serveur (main.js ne fixe pas de cwd)
+DEFAULT_PATH = Path(__file__).parent / "grounding_cache.json"
+
+# Distances de Hamming maximales (sur 64 bits) pour considérer deux images comme identiques
+PAGE_HASH_MAX_DISTANCE = 6
+REGION_HASH_MAX_DISTANCE = 8
+# Zone autour de l'élément (pixels CSS) : retrouve l'élément quand le reste de la page a changé
+REGION_SIZE = (240, 120)
+# En dessous, le hit est ignoré et le VLM est rappelé
+MIN_CONFIDENCE = 0.5
+# Confiance d'une réponse du VLM pas encore confirmée
+INITIAL_CONFIDENCE = 0.8
+
+# Élément interactif sous le point (ou l'élément lui-même) : tag, texte court et attributs d'identification
+ELEMENT_AT_POINT_JS = r"""
+([x, y]) => {
+    const el = document.elementFromPoint(x, y);
+    if (!el || el === document.body || el === document.documentElement) return null;
+    const target = el.closest('a, button, input, select, textarea, label, summary, [role], [onclick]') || el;
+    const clean = (s) => (s || '').replace(/\s+/g, ' ').trim().slice(0, 60);
+    return {
+        tag: target.tagName.toLowerCase(),
+        text: clean(target.innerText),
+        aria: clean(target.getAttribute('aria-label')),
+        placeholder: clean(target.getAttribute('placeholder')),
+        name: clean(target.getAttribute('name')),
+        title: clean(target.getAttribute('title'))
+    };
+}
+"""
+
+# Comparés quand l'élément n'a pas de texte (boutons icônes, champs de saisie)
+SIGNATURE_ATTRIBUTES = ('aria', 'placeholder', 'name', 'title')
+
+
+def normalize_description(text: str) -> str:
+    text = re.sub(r'[\'"“”«»`]', '', text.lower())
+    return ' '.join(text.split())
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def signature_matches(expected: Optional[Dict[str, str]], current: Optional[Dict[str, str]]) -> bool:
+    """
+    Même élément : même tag et même texte non vide ; sans texte, mêmes attributs d'identification
+    (au moins un non vide). Une signature inconnue ne peut pas être vérifiée.
+    """
+    if not expected or not current or current.get('tag') != expected.get('tag'):
+        return False
+    if expected.get('text'):
+        return current.get('text') == expected['text']
+    keys = [key for key in SIGNATURE_ATTRIBUTES if expected.get(key)]
+    return bool(keys) and all(current.get(key) == expected[key] for key in keys)
+
+
+@dataclass
+class GroundingEntry:
+    description: str
+    page_hash: int
+    region_hash: Optional[int]
+    x: int  # Pixels CSS de la page
+    y: int
+    page_size: Tuple[int, int]
+    confidence: float
+    signature: Optional[Dict[str, str]]  # Élément sous le point au moment du stockage
+    hits: int = 0
+    created_at: float = 0.0
+
+
+@dataclass
+class GroundingHit:
+    key: str
+    x: int
+    y: int
+    confidence: float
+    match: str  # 'page' ou 'region'
+
+
+class GroundingCache:
+    """
+    Cache LRU des réponses de grounding du VLM, persisté en JSON si `path` est fourni
+    (écritures regroupées, hors de l'event loop : cf. CacheFile).
+    Sans Pillow, le hash de page est exact (octets du screenshot) et il n'y a pas de hash de zone.
+    """
+
+    def __init__(self, path: Optional[Path] = DEFAULT_PATH, max_entries: int = 500):
+        self.file = CacheFile(Path(path), 'grounding cache', default=asdict) if path else None
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, GroundingEntry]" = OrderedDict()
+
+        # Statistiques
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0  # Hits invalidés par la vérification DOM
+
+        self._load()
+
+    @staticmethod
+    def _region_box(level, x: int, y: int) -> Tuple[int, int, int, int]:
+        """Zone REGION_SIZE centrée sur (x, y) page, en pixels de l'image `level`"""
+        ix, iy = level.from_page(x, y)
+        half_w, half_h = level.from_page(REGION_SIZE[0] / 2, REGION_SIZE[1] / 2)
+        return (
+            max(0, ix - half_w), max(0, iy - half_h),
+            min(level.width or ix + half_w, ix + half_w), min(level.height or iy + half_h, iy + half_h)
+        )
+
+    async def _hashes(self, level, workers, points: List[Tuple[int, int]]) -> Tuple[int, List[Optional[int]]]:
+        if not PIL_AVAILABLE:
+            digest = hashlib.blake2b(level.data, digest_size=8).digest()
+            return int.from_bytes(digest, 'big'), [None] * len(points)
+        hashes = await workers.perceptual_hashes(level.data, [self._region_box(level, x, y) for x, y in points])
+        return hashes[0], hashes[1:]
+
+    async def lookup(self, description: str, level, workers) -> Optional[GroundingHit]:
+        """Meilleure entrée pour cette description sur une image semblable (niveau 'full' de la pyramide)"""
+        description = normalize_description(description)
+        candidates = [(key, entry) for key, entry in self.entries.items() if entry.description == description]
+        if not candidates:
+            self.misses += 1
+            return None
+
+        page_hash, region_hashes = await self._hashes(level, workers, [(e.x, e.y) for _, e in candidates])
+
+        best: Optional[GroundingHit] = None
+        for (key, entry), region_hash in zip(candidates, region_hashes):
+            distance = hamming(page_hash, entry.page_hash)
+            if distance <= PAGE_HASH_MAX_DISTANCE:
+                match = 'page'
+            elif region_hash is not None and entry.region_hash is not None:
+                distance = hamming(region_hash, entry.region_hash)
+                if distance > REGION_HASH_MAX_DISTANCE:
+                    continue
+                match = 'region'
+            else:
+                continue
+
+            confidence = entry.confidence * (1 - distance / 64)
+            if confidence >= MIN_CONFIDENCE and (best is None or confidence > best.confidence):
+                best = GroundingHit(key, entry.x, entry.y, round(confidence, 3), match)
+
+        if best is None:
+            self.misses += 1
+        return best
+
+    async def validate(self, page, hit: GroundingHit) -> bool:
+        """Vérifier dans le DOM que l'élément attendu est toujours sous le point ; sinon invalider l'entrée"""
+        entry = self.entries.get(hit.key)
+        if entry is None:
+            return False
+
+        try:
+            current = await page.evaluate(ELEMENT_AT_POINT_JS, [hit.x, hit.y])
+        except Exception as e:
+            logger.debug(f"Grounding validation failed: {e}")
+            current = None
+
+        expected = entry.signature
+        if not signature_matches(expected, current):
+            self.rejected += 1
+            self.invalidate(hit.key)
+            logger.info(f"👁️ Grounding cache hit rejected: expected {expected}, found {current}")
+            return False
+
+        entry.hits += 1
+        entry.confidence = min(1.0, entry.confidence + 0.05)
+        self.entries.move_to_end(hit.key)
+        self.hits += 1
+        logger.info(f"👁️ Grounding cache hit ({hit.match}, confidence {hit.confidence}) → ({hit.x}, {hit.y})")
+        return True
+
+    async def store(self, description: str, level, workers, coords: Tuple[int, int], page=None,
+                    confidence: float = INITIAL_CONFIDENCE) -> str:
+        x, y = coords
+        page_hash, (region_hash,) = await self._hashes(level, workers, [(x, y)])
+
+        signature = None
+        if page is not None:
+            try:
+                signature = await page.evaluate(ELEMENT_AT_POINT_JS, [x, y])
+            except Exception as e:
+                logger.debug(f"Grounding signature failed: {e}")
+
+        description = normalize_description(description)
+        key = hashlib.blake2b(f"{description}|{page_hash:016x}".encode('utf-8'), digest_size=12).hexdigest()
+        self.entries[key] = GroundingEntry(
+            description=description,
+            page_hash=page_hash,
+            region_hash=region_hash,
+            x=x,
+            y=y,
+            page_size=(level.page_width, level.page_height),
+            confidence=confidence,
+            signature=signature,
+            created_at=time.time()
+        )
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        self._save()
+        return key
+
+    def invalidate(self, key: str):
+        if self.entries.pop(key, None) is not None:
+            self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses + self.rejected
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'rejected': self.rejected,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _load(self):
+        entries = self.file.load() if self.file else None
+        if not entries:
+            return
+        try:
+            for key, data in entries.items():
+                data['page_size'] = tuple(data['page_size'])
+                self.entries[key] = GroundingEntry(**data)
+            logger.info(f"👁️ Grounding cache loaded: {len(self.entries)} entries")
+        except (AttributeError, TypeError, KeyError) as e:
+            logger.warning(f"⚠️ Could not load grounding cache {self.file.path}: {e}")
+
+    def _save(self):
+        if self.file:
+            self.file.schedule(lambda: dict(self.entries))
+
+    async def flush(self):
+        """Écrire les modifications en attente (arrêt du serveur)"""
+        if self.file:
+            await self.file.flush()
@@ -4,12 +4,23 @@ Agent hybride BrowserGym + BrowserOS
 Combine les observations riches de BrowserGym avec le planning de BrowserOS
 """
 
+import asyncio
 import logging
-import openai
-import base64
 import json
-from typing import Dict, Any, Optional, List
-from dataclasses import dataclass
+import time
+from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass, asdict
+
+from frame_provider import CapturedFrame
+from frame_pyramid import FramePyramid
+from llm_client import create_chat_completion, get_llm_client
+from plan_stream import PlanStream, ProposedActionsParser
+from speculative_plan import SpeculativePlanner
+from page_fingerprint import PageFingerprint
+from plan_cache import PlanCache
+from page_observation import PageObserver, PageSnapshot, diff_snapshots
+from agent_memory import AgentMemory
+from prompt_builder import PromptBuilder, PromptReport, PromptUsage
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +34,15 @@ except ImportError:
 @dataclass
 class RichObservation:
     """Observation riche à la BrowserGym"""
-    screenshot_base64: Optional[str] = None
+    screenshot_base64: Optional[str] = None  # Niveau envoyé au planner (cf. PLANNER_IMAGE_LEVEL)
+    screenshot_format: str = 'png'
+    screenshot_pyramid: Optional[FramePyramid] = None  # Autres résolutions de la même capture
     url: str = ""
     title: str = ""
-    axtree_summary: Optional[str] = None
+    axtree_summary: Optional[str] = None  # Snapshot de référence sérialisé (budget de tokens)
+    axtree_diff: Optional[str] = None  # Changements depuis ce snapshot (None : snapshot à jour)
     visible_elements: List[Dict] = None
+    page_snapshot: Optional[PageSnapshot] = None
     last_action: Optional[str] = None
     last_action_error: Optional[str] = None
     
@@ -54,6 +69,13 @@ class ExecutionPlan:
     proposed_actions: List[Dict[str, str]]  # [{action: str, reasoning: str}]
     task_complete: bool = False
     final_answer: str = ""
+    source: str = "llm"  # 'llm', 'fallback' ou 'cache'
+    cache_key: Optional[str] = None  # Entrée du PlanCache dont provient le plan
+    
+    def to_cache_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        del data['source'], data['cache_key']
+        return data
 
 
 class HybridBrowserAgent:
@@ -63,21 +85,44 @@ class HybridBrowserAgent:
     - Planning multi-étapes (BrowserOS) : Plan → Execute → Validate → Replan
     """
     
+    # Niveau de la pyramide envoyé au planner (image en detail: low)
+    PLANNER_IMAGE_LEVEL = 'half'
+    # Budget de l'observation textuelle dans le prompt du planner
+    OBSERVATION_TOKEN_BUDGET = 1500
+    # Au-delà de cette part d'éléments modifiés, un snapshot complet est plus utile qu'un diff
+    MAX_DIFF_RATIO = 0.5
+    
     def __init__(self, model_name: str = "gpt-4o-mini", max_iterations: int = 30):
         self.model_name = model_name
         self.max_iterations = max_iterations
-        self.openai_client = openai.OpenAI()
+        # Créé d'emblée : sans OPENAI_API_KEY l'agent ne s'initialise pas et le serveur garde son fallback sans LLM
+        self.openai_client = get_llm_client()  # Async : ne bloque pas l'event loop
         
         # État de l'agent
         self.current_plan: Optional[ExecutionPlan] = None
-        self.execution_history: List[str] = []
-        self.action_history: List[Dict] = []
+        self.memory = AgentMemory()  # Étapes récentes + digest des plus anciennes (borné)
         self.iteration = 0
         
         # NOUVEAU: Support pause/resume
         self.paused: bool = False
         self.pause_checkpoint: Optional[Dict] = None
         
+        # Plan suivant calculé pendant la stabilisation de la page
+        self.speculation = SpeculativePlanner(self)
+        
+        # Plans réutilisés pour les tâches répétées sur les mêmes pages
+        self.plan_cache = PlanCache()
+        
+        # Observation textuelle (éléments interactifs + arbre d'accessibilité)
+        # Snapshot de référence (préfixe stable, repris après une navigation) + diff des changements depuis
+        self.observer = PageObserver()
+        self.observation_base: Optional[PageSnapshot] = None
+        self.observation_base_text = ""
+        self.observation_stats = {'full': 0, 'diff': 0}
+        
+        # Tokens envoyés / mis en cache par le fournisseur, par type d'appel
+        self.prompt_usage = PromptUsage()
+        
         # Configuration
         self.PLAN_EVERY_N_STEPS = 5
         self.VALIDATE_EVERY_N_STEPS = 3
@@ -92,48 +137,139 @@ class HybridBrowserAgent:
         
         logger.info(f"HybridBrowserAgent initialized with {model_name}")
     
-    async def get_rich_observation(self, page) -> RichObservation:
+    def start_task(self, user_task: str):
+        """Nouveau message utilisateur : repartir d'un historique et d'un plan vides"""
+        self.memory.start_task(user_task)
+        self.current_plan = None
+        self.iteration = 0
+        self.speculation.discard()
+        # La page de la tâche précédente ne sert pas de référence au diff
+        self.observation_base = None
+        self.observation_base_text = ""
+    
+    async def get_rich_observation(self, page, frame_provider=None, track: bool = True) -> RichObservation:
         """
         Obtenir une observation riche à la BrowserGym
+        Le texte (éléments interactifs + AX tree) suffit en général ; le screenshot n'est joint
+        que si la page est graphique ou après une erreur.
+        Avec un FrameProvider, le screenshot récent du live view est réutilisé.
+        `track=False` (spéculation) : ni la référence du diff ni les statistiques d'observation ne sont modifiées
         """
         obs = RichObservation()
         
         try:
-            # Screenshot
-            screenshot_bytes = await page.screenshot(type='png')
-            obs.screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-            
-            # URL et titre
             obs.url = page.url
-            obs.title = await page.title()
-            
-            # AXTree summary (simplified)
-            # TODO: Implémenter extraction AXTree complète si besoin
-            obs.axtree_summary = f"Page: {obs.title} at {obs.url}"
             
-            # Éléments visibles (simplified)
-            # TODO: Extraire les éléments interactifs
-            obs.visible_elements = []
+            # Éléments interactifs (data-bid) + plan de la page
+            needs_screenshot = True
+            try:
+                snapshot = await self.observer.snapshot(page)
+                obs.page_snapshot = snapshot
+                obs.title = snapshot.title
+                obs.axtree_summary, obs.axtree_diff = self._describe_page(snapshot, track)
+                obs.visible_elements = [asdict(e) for e in snapshot.elements if e.in_viewport]
+                needs_screenshot = snapshot.needs_screenshot()
+            except Exception as e:
+                logger.warning(f"⚠️ Page snapshot failed, falling back to screenshot: {e}")
+                obs.title = await page.title()
+                obs.axtree_summary = f"Page: {obs.title} at {obs.url}"
+                obs.visible_elements = []
             
             # Historique
-            if self.action_history:
-                last = self.action_history[-1]
+            last = self.memory.last()
+            if last:
                 obs.last_action = last.get('action')
                 obs.last_action_error = last.get('error')
             
+            # Screenshot : le planner (detail low) n'a pas besoin de la pleine résolution
+            if needs_screenshot or obs.last_action_error:
+                if frame_provider:
+                    pyramid = await frame_provider.get_pyramid(max_age_ms=250)
+                else:
+                    viewport = page.viewport_size
+                    pyramid = FramePyramid(
+                        CapturedFrame('png', data=await page.screenshot(type='png')),
+                        (viewport['width'], viewport['height']) if viewport else None
+                    )
+                level = await pyramid.level(self.PLANNER_IMAGE_LEVEL)
+                obs.screenshot_pyramid = pyramid
+                obs.screenshot_base64 = await level.load_base64(pyramid.workers)
+                obs.screenshot_format = level.format
+            
         except Exception as e:
             logger.error(f"Error getting observation: {e}")
         
         return obs
     
-    async def create_plan(self, user_task: str, observation: RichObservation) -> ExecutionPlan:
+    def _describe_page(self, snapshot: PageSnapshot, track: bool = True) -> Tuple[str, Optional[str]]:
+        """
+        (snapshot de référence, diff) : la référence est reprise après une navigation ou un diff trop gros
+        (diff None), sinon le planner reçoit la référence inchangée suivie du diff par rapport à elle
+        """
+        base = self.observation_base
+        if base is not None and base.url == snapshot.url:
+            diff = diff_snapshots(base, snapshot)
+            if diff.size <= max(10, len(base.elements) * self.MAX_DIFF_RATIO):
+                if track:
+                    self.observation_stats['diff'] += 1
+                return self.observation_base_text, diff.to_text()
+        
+        text = snapshot.to_text(self.OBSERVATION_TOKEN_BUDGET)
+        if track:
+            self.observation_base = snapshot
+            self.observation_base_text = text
+            self.observation_stats['full'] += 1
+        return text, None
+    
+    def start_plan(
+        self,
+        user_task: str,
+        observation: RichObservation,
+        fingerprint: Optional[PageFingerprint] = None
+    ) -> PlanStream:
+        """
+        Lancer la planification en streaming : la première action peut être exécutée
+        (PlanStream.first_action) pendant que le reste du plan est généré.
+        Avec `fingerprint`, le plan obtenu est mis en cache pour cette page.
+        """
+        stream = PlanStream()
+        stream.task = asyncio.create_task(self._streamed_plan(user_task, observation, stream, fingerprint))
+        return stream
+    
+    async def _streamed_plan(
+        self,
+        user_task: str,
+        observation: RichObservation,
+        stream: PlanStream,
+        fingerprint: Optional[PageFingerprint]
+    ) -> ExecutionPlan:
+        try:
+            plan = await self.create_plan(user_task, observation, stream)
+        finally:
+            stream.finish()
+        
+        if fingerprint and plan.source == 'llm' and plan.proposed_actions and not plan.task_complete:
+            plan.cache_key = self.plan_cache.store(user_task, fingerprint, plan.to_cache_dict())
+        return plan
+    
+    def cached_plan(self, user_task: str, fingerprint: PageFingerprint) -> Optional[ExecutionPlan]:
+        """Plan déjà calculé pour cette tâche (aux slots près) sur une page de même structure"""
+        found = self.plan_cache.lookup(user_task, fingerprint)
+        if not found:
+            return None
+        
+        key, data = found
+        return ExecutionPlan(**data, source='cache', cache_key=key)
+    
+    async def create_plan(self, user_task: str, observation: RichObservation, stream: Optional[PlanStream] = None) -> ExecutionPlan:
         """
         Créer un plan multi-étapes avec raisonnement à la BrowserOS
+        Avec `stream`, chaque action est publiée dès qu'elle est complète dans la réponse
         """
         logger.info("🧠 Creating multi-step plan...")
         
         # Construire le contexte
-        history_summary = "\n".join(self.execution_history[-10:]) if self.execution_history else "No previous actions"
+        history_summary = self.memory.to_prompt()
         
         challenges = []
         if observation.last_action_error:
@@ -172,51 +308,39 @@ Available actions:
 - click(element_desc): Click element
 - send_msg_to_user(message): Send message to user
 - done(summary): Mark task complete
+
+Page elements are listed as [N] role "label". Target them by id: click('12'), fill('7', 'text').
+Only describe an element in words if it is not listed.
 """
         
-        user_prompt = f"""Task: {user_task}
-
-Current State:
+        # Sections stables (tâche, snapshot de référence) en tête pour le cache de préfixe, changements récents à la fin :
+        # chaque appel est indépendant, le snapshot de référence est donc toujours envoyé (ids et structure de la page).
+        # Hors budget : l'historique est résumé puis retiré, puis le screenshot
+        planner_model = self.model_name if "vision" in self.model_name or "gpt-4" in self.model_name else "gpt-4o"
+        
+        builder = PromptBuilder('plan', planner_model).system(system_prompt)
+        builder.add('task', f"Task: {user_task}", stable=True)
+        snapshot_summary = None
+        if observation.page_snapshot:
+            snapshot_summary = f"Page elements (snapshot, truncated):\n{observation.page_snapshot.to_text(self.OBSERVATION_TOKEN_BUDGET // 3)}"
+        builder.add('snapshot', f"Page elements (snapshot):\n{observation.axtree_summary}", priority=1, stable=True,
+                    summary=snapshot_summary)
+        builder.add('state', f"""Current State:
 - URL: {observation.url}
 - Title: {observation.title}
-- Has screenshot: {bool(observation.screenshot_base64)}
-
-Execution History:
-{history_summary}
-
-Challenges:
-{challenges_text}
-
-Create a detailed plan to accomplish this task."""
+- Has screenshot: {bool(observation.screenshot_base64)}""")
+        builder.add('history', f"Execution History:\n{history_summary}", priority=3,
+                    summary="Execution History (latest):\n" + "\n".join(history_summary.splitlines()[-6:]))
+        builder.add('challenges', f"Challenges:\n{challenges_text}")
+        if observation.axtree_diff:
+            builder.add('changes', "Changes on the page since the snapshot above (unchanged elements keep their ids):\n"
+                        f"{observation.axtree_diff}", priority=1)
+        builder.add('instruction', "Create a detailed plan to accomplish this task.")
+        builder.add_image('screenshot', observation.screenshot_base64, observation.screenshot_format, detail='low', priority=2)
         
         try:
-            # Appel OpenAI avec vision si screenshot disponible
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": [
-                    {"type": "text", "text": user_prompt}
-                ]}
-            ]
-            
-            # Ajouter screenshot si disponible
-            if observation.screenshot_base64:
-                messages[1]["content"].append({
-                    "type": "image_url",
-                    "image_url": {
-                        "url": f"data:image/png;base64,{observation.screenshot_base64}",
-                        "detail": "low"  # ou "high" pour plus de détails
-                    }
-                })
-            
-            response = self.openai_client.chat.completions.create(
-                model=self.model_name if "vision" in self.model_name or "gpt-4" in self.model_name else "gpt-4o",
-                messages=messages,
-                temperature=0.3,
-                max_tokens=1500,
-                response_format={"type": "json_object"}
-            )
-            
-            plan_data = json.loads(response.choices[0].message.content)
+            messages, report = builder.build()
+            plan_data = json.loads(await self._request_plan(messages, report, stream))
             
             plan = ExecutionPlan(
                 user_task=plan_data.get('user_task', user_task),
@@ -247,37 +371,79 @@ Create a detailed plan to accomplish this task."""
                     "action": f"goto('{observation.url}')",
                     "reasoning": "Fallback action"
                 }],
-                task_complete=False
+                task_complete=False,
+                source="fallback"
             )
     
+    async def _request_plan(self, messages: List[Dict], report: PromptReport, stream: Optional[PlanStream]) -> str:
+        """Appel LLM du planner ; en streaming, publier les actions au fil des tokens"""
+        params = dict(
+            model=report.model,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=1500,
+            response_format={"type": "json_object"}
+        )
+        started = time.perf_counter()
+        
+        if stream is None:
+            response = await create_chat_completion(**params)
+            self.prompt_usage.record(report, response.usage, (time.perf_counter() - started) * 1000)
+            return response.choices[0].message.content
+        
+        parser = ProposedActionsParser()
+        usage = None
+        # include_usage : le dernier chunk (sans choices) porte l'usage, cache de préfixe compris
+        response = await create_chat_completion(
+            stream=True, stream_options={"include_usage": True}, **params
+        )
+        async for chunk in response:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices or not chunk.choices[0].delta.content:
+                continue
+            for action in parser.feed(chunk.choices[0].delta.content):
+                if len(parser.actions) == 1:
+                    logger.info(f"⚡ First action streamed: {action['action']}")
+                stream.publish(action, parser.header())
+        
+        self.prompt_usage.record(report, usage, (time.perf_counter() - started) * 1000)
+        return parser.text
+    
     async def validate_progress(self, user_task: str, observation: RichObservation) -> Dict[str, Any]:
         """
         Valider la progression vers l'objectif
         """
         logger.info("🔍 Validating progress...")
         
-        try:
-            prompt = f"""Task: {user_task}
-
-Current State:
-- URL: {observation.url}
-- Title: {observation.title}
-
-Is the task complete? Respond with JSON:
-{{
+        # Consignes en message système (préfixe stable) ; même historique compact que le planner
+        builder = PromptBuilder('validate', 'gpt-4o-mini', budget=2000).system("""You check whether a web automation task is complete.
+Respond with JSON:
+{
   "is_complete": true/false,
   "progress_percentage": 0-100,
   "next_needed": "What still needs to be done"
-}}
-"""
-            
-            response = self.openai_client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
+}""")
+        builder.add('task', f"Task: {user_task}", stable=True)
+        builder.add('state', f"""Current State:
+- URL: {observation.url}
+- Title: {observation.title}""")
+        history = self.memory.to_prompt()
+        builder.add('history', f"Execution History:\n{history}", priority=1,
+                    summary="Execution History (latest):\n" + "\n".join(history.splitlines()[-4:]))
+        builder.add('instruction', "Is the task complete?")
+        
+        try:
+            messages, report = builder.build()
+            started = time.perf_counter()
+            response = await create_chat_completion(
+                model=report.model,
+                messages=messages,
                 temperature=0.1,
                 max_tokens=200,
                 response_format={"type": "json_object"}
             )
+            self.prompt_usage.record(report, response.usage, (time.perf_counter() - started) * 1000)
             
             validation = json.loads(response.choices[0].message.content)
             logger.info(f"Progress: {validation.get('progress_percentage', 0)}%")
@@ -292,11 +458,11 @@ Is the task complete? Respond with JSON:
         """
         Détecter si l'agent est coincé dans une boucle
         """
-        if len(self.action_history) < 4:
+        if len(self.memory.steps) < 4:
             return False
         
         # Vérifier les 4 dernières actions
-        recent = [a.get('action') for a in self.action_history[-4:]]
+        recent = self.memory.recent_actions(4)
         
         # Si 3 actions identiques consécutives
         if len(set(recent[-3:])) == 1:
@@ -305,12 +471,18 @@ Is the task complete? Respond with JSON:
         
         return False
     
-    def should_replan(self, observation: RichObservation) -> bool:
+    def should_replan(self, observation: Optional[RichObservation] = None) -> bool:
         """
         Décider si il faut re-planifier
+        Sans observation (spéculation, avant toute extraction), l'erreur de la dernière action est lue dans la mémoire
         """
         # Replan si erreur
-        if observation.last_action_error:
+        if observation is not None:
+            last_error = observation.last_action_error
+        else:
+            last = self.memory.last()
+            last_error = last.get('error') if last else None
+        if last_error:
             return True
         
         # Replan si boucle détectée
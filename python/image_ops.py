@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Transformations d'images (Pillow) partagées par le streaming et les consommateurs de screenshots
+Sans Pillow, PIL_AVAILABLE = False et les appelants gardent l'image d'origine
+"""
+
+import io
+from typing import List, Tuple
+
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    PIL_AVAILABLE = False
+
+
+def reencode_image(data: bytes, fmt: str = 'jpeg', quality: int = 75, scale: float = 1.0) -> Tuple[bytes, int, int]:
+    """
+    Réencoder (et éventuellement réduire) une image.
+    Retourne (octets, largeur, hauteur).
+    """
+    image = Image.open(io.BytesIO(data))
+
+    if scale < 1.0:
+        width = max(1, int(image.width * scale))
+        height = max(1, int(image.height * scale))
+        image = image.resize((width, height), Image.BILINEAR)
+
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=quality)
+    else:
+        image.save(buffer, 'PNG')
+
+    return buffer.getvalue(), image.width, image.height
+
+
+def crop_image(data: bytes, box: Tuple[int, int, int, int], scale: float = 1.0, fmt: str = 'png',
+               quality: int = 85) -> Tuple[bytes, int, int]:
+    """
+    Recadrer `box` (left, top, right, bottom) puis redimensionner (scale > 1 : agrandir).
+    Retourne (octets, largeur, hauteur).
+    """
+    image = Image.open(io.BytesIO(data)).crop(box)
+
+    if scale != 1.0:
+        width = max(1, int(image.width * scale))
+        height = max(1, int(image.height * scale))
+        image = image.resize((width, height), Image.BICUBIC)
+
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.convert('RGB').save(buffer, 'JPEG', quality=quality)
+    else:
+        image.save(buffer, 'PNG')
+
+    return buffer.getvalue(), image.width, image.height
+
+
+def perceptual_hashes(data: bytes, boxes: List[Tuple[int, int, int, int]] = (), size: int = 8) -> List[int]:
+    """
+    dHash 64 bits de l'image entière puis de chaque zone `boxes` (left, top, right, bottom),
+    en un seul décodage. Deux images proches ont des hashes à faible distance de Hamming.
+    """
+    image = Image.open(io.BytesIO(data)).convert('L')
+    return [_dhash(image, size)] + [_dhash(image.crop(box), size) for box in boxes]
+
+
+def _dhash(image, size: int) -> int:
+    pixels = list(image.resize((size + 1, size), Image.BILINEAR).getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            offset = row * (size + 1) + col
+            bits = (bits << 1) | (pixels[offset] > pixels[offset + 1])
+    return bits
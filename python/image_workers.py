@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+ImageWorkerPool - Transformations d'images hors de l'event loop asyncio
+Resize, réencodage, hash, base64 dans un pool de threads borné
+(Pillow et hashlib relâchent le GIL pendant le gros du travail)
++ EventLoopLagMonitor pour vérifier que la boucle reste réactive
+"""
+
+import asyncio
+import base64
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Callable, List, Optional, Tuple, TypeVar
+
+from frame_protocol import frame_digest
+from image_ops import crop_image, perceptual_hashes, reencode_image
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class ImageWorkerPool:
+    """
+    Pool de threads avec une file bornée : au-delà de `max_pending` tâches,
+    les appelants attendent (backpressure) au lieu d'empiler du travail.
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: Optional[int] = None):
+        self.max_workers = max_workers
+        self.max_pending = max_pending or max_workers * 4
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-worker')
+        self._slots: Optional[asyncio.Semaphore] = None
+
+        # Statistiques
+        self.tasks = 0
+        self.in_flight = 0
+        self.total_ms = 0.0
+
+    async def run(self, fn: Callable[..., T], *args) -> T:
+        """Exécuter fn(*args) dans le pool"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        async with self._slots:
+            self.in_flight += 1
+            start = time.perf_counter()
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+            finally:
+                self.in_flight -= 1
+                self.tasks += 1
+                self.total_ms += (time.perf_counter() - start) * 1000
+
+    async def b64encode(self, data: bytes) -> str:
+        return await self.run(_b64encode, data)
+
+    async def b64decode(self, data_base64: str) -> bytes:
+        return await self.run(base64.b64decode, data_base64)
+
+    async def digest(self, data: bytes) -> bytes:
+        return await self.run(frame_digest, data)
+
+    async def reencode(self, data: bytes, fmt: str = 'jpeg', quality: int = 75, scale: float = 1.0) -> Tuple[bytes, int, int]:
+        return await self.run(reencode_image, data, fmt, quality, scale)
+
+    async def crop(self, data: bytes, box: Tuple[int, int, int, int], scale: float = 1.0, fmt: str = 'png') -> Tuple[bytes, int, int]:
+        return await self.run(crop_image, data, box, scale, fmt)
+
+    async def perceptual_hashes(self, data: bytes, boxes: List[Tuple[int, int, int, int]] = ()) -> List[int]:
+        return await self.run(perceptual_hashes, data, list(boxes))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_workers': self.max_workers,
+            'tasks': self.tasks,
+            'in_flight': self.in_flight,
+            'avg_ms': round(self.total_ms / self.tasks, 2) if self.tasks else 0.0
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode('utf-8')
+
+
+_default_pool: Optional[ImageWorkerPool] = None
+
+
+def get_image_pool() -> ImageWorkerPool:
+    """Pool partagé par le serveur, le FrameProvider, l'agent et le WorkflowPlayer"""
+    global _default_pool
+    if _default_pool is None:
+        _default_pool = ImageWorkerPool(max_workers=int(os.getenv('IMAGE_WORKERS', '2')))
+    return _default_pool
+
+
+class EventLoopLagMonitor:
+    """
+    Mesure le retard de l'event loop : une tâche dort `interval` secondes
+    et mesure de combien elle se réveille en retard.
+    """
+
+    def __init__(self, interval: float = 0.1, window: int = 200, warn_ms: float = 100.0):
+        self.interval = interval
+        self.warn_ms = warn_ms
+        self.samples: deque = deque(maxlen=window)
+        self.max_lag_ms = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if not self._task:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.monotonic() - start - self.interval) * 1000)
+            self.samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms > self.warn_ms:
+                logger.warning(f"⚠️ Event loop lag: {lag_ms:.0f}ms")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.samples:
+            return {'lag_ms': 0.0, 'avg_lag_ms': 0.0, 'p95_lag_ms': 0.0, 'max_lag_ms': 0.0}
+
+        ordered = sorted(self.samples)
+        return {
+            'lag_ms': round(self.samples[-1], 1),
+            'avg_lag_ms': round(sum(ordered) / len(ordered), 1),
+            'p95_lag_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 1),
+            'max_lag_ms': round(self.max_lag_ms, 1)
+        }
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+LLM client - Client OpenAI async partagé par les agents
+Connexions HTTP poolées (keep-alive) et timeouts configurables par variables d'environnement
+create_chat_completion() : coalescence, circuit breaker et endpoint secondaire optionnel
+"""
+
+import hashlib
+import json
+import logging
+import os
+from typing import Any, Dict, Optional
+
+import httpx
+import openai
+
+from resilience import ResilientCaller
+
+logger = logging.getLogger(__name__)
+
+# Timeouts (secondes) et taille du pool
+LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', '60'))
+LLM_CONNECT_TIMEOUT = float(os.getenv('LLM_CONNECT_TIMEOUT', '10'))
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', '10'))
+LLM_MAX_RETRIES = int(os.getenv('LLM_MAX_RETRIES', '2'))
+
+# Circuit breaker : échecs (ou réponses plus lentes que LLM_SLOW_CALL) consécutifs avant d'écarter l'endpoint
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', '3'))
+LLM_BREAKER_COOLDOWN = float(os.getenv('LLM_BREAKER_COOLDOWN', '30'))
+LLM_SLOW_CALL = float(os.getenv('LLM_SLOW_CALL', '45'))
+# Endpoint secondaire compatible OpenAI (optionnel) ; 0 : utilisé seulement si le principal échoue
+LLM_SECONDARY_BASE_URL = os.getenv('LLM_SECONDARY_BASE_URL')
+LLM_SECONDARY_MODEL = os.getenv('LLM_SECONDARY_MODEL')
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', '0'))
+
+_client: Optional[openai.AsyncOpenAI] = None
+_secondary_client: Optional[openai.AsyncOpenAI] = None
+_resilience = ResilientCaller('llm', LLM_BREAKER_FAILURES, LLM_BREAKER_COOLDOWN, LLM_SLOW_CALL, LLM_HEDGE_DELAY)
+
+
+def _http_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_CONNECTIONS,
+            keepalive_expiry=30.0
+        )
+    )
+
+
+def get_llm_client() -> openai.AsyncOpenAI:
+    """
+    Client async partagé : une seule connexion TLS réutilisée entre les appels.
+    Annuler la tâche qui attend une réponse annule la requête HTTP en cours.
+    """
+    global _client
+    if _client is None:
+        _client = openai.AsyncOpenAI(http_client=_http_client(), max_retries=LLM_MAX_RETRIES)
+        logger.info(f"LLM client ready (timeout {LLM_TIMEOUT}s, pool {LLM_MAX_CONNECTIONS})")
+    return _client
+
+
+def get_secondary_llm_client() -> Optional[openai.AsyncOpenAI]:
+    """Client de l'endpoint secondaire (LLM_SECONDARY_BASE_URL, clé LLM_SECONDARY_API_KEY), None si non configuré"""
+    global _secondary_client
+    if _secondary_client is None and LLM_SECONDARY_BASE_URL:
+        _secondary_client = openai.AsyncOpenAI(
+            base_url=LLM_SECONDARY_BASE_URL,
+            api_key=os.getenv('LLM_SECONDARY_API_KEY') or os.getenv('OPENAI_API_KEY', 'dummy'),
+            http_client=_http_client(),
+            # Le breaker bascule sur l'autre endpoint : ne pas insister sur celui-ci
+            max_retries=0
+        )
+        logger.info(f"LLM secondary endpoint ready: {LLM_SECONDARY_BASE_URL}")
+    return _secondary_client
+
+
+async def create_chat_completion(**params) -> Any:
+    """
+    chat.completions.create() à travers la couche de résilience :
+    - requêtes identiques en vol coalescées (hors streaming)
+    - CircuitOpenError immédiate quand aucun endpoint n'est disponible (au lieu d'attendre le timeout)
+    - endpoint secondaire en secours, ou en parallèle après LLM_HEDGE_DELAY (hors streaming)
+    En streaming, le breaker ne voit que l'ouverture du flux (erreurs HTTP, délai avant les en-têtes).
+    """
+    primary = get_llm_client()
+    secondary_client = get_secondary_llm_client()
+
+    secondary = None
+    if secondary_client is not None:
+        secondary_params = {**params, 'model': LLM_SECONDARY_MODEL} if LLM_SECONDARY_MODEL else params
+        secondary = lambda: secondary_client.chat.completions.create(**secondary_params)
+
+    stream = bool(params.get('stream'))
+    key = None
+    if not stream:
+        key = hashlib.blake2b(json.dumps(params, sort_keys=True, default=str).encode('utf-8'), digest_size=16).hexdigest()
+    return await _resilience.call(key, lambda: primary.chat.completions.create(**params), secondary, hedge=not stream)
+
+
+def llm_resilience_stats() -> Dict[str, Any]:
+    return _resilience.stats()
+
+
+async def close_llm_client():
+    """Fermer les connexions du pool (arrêt du serveur)"""
+    global _client, _secondary_client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+    if _secondary_client is not None:
+        client, _secondary_client = _secondary_client, None
+        await client.close()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+PageFingerprint - Empreinte compacte de l'état d'une page
+URL + hash de structure (éléments interactifs, titres) + hash de contenu, en un seul evaluate
+"""
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Éléments interactifs et titres visibles : tag, rôle, type, libellé court
+FINGERPRINT_JS = """
+() => {
+    const selector = 'a, button, input, select, textarea, [role], [contenteditable="true"], h1, h2, h3';
+    const parts = [];
+    for (const el of document.querySelectorAll(selector)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width === 0 && rect.height === 0) continue;
+        const label = (el.getAttribute('aria-label') || el.innerText || el.value || el.placeholder || '').trim().slice(0, 40);
+        parts.push([el.tagName, el.getAttribute('role') || '', el.type || '', label].join('|'));
+        if (parts.length >= 500) break;
+    }
+    const text = document.body ? document.body.innerText : '';
+    return {structure: parts.join('\\n'), content: text.slice(0, 20000), title: document.title};
+}
+"""
+
+
+@dataclass(frozen=True)
+class PageFingerprint:
+    url: str
+    structure: str  # Hash des éléments interactifs (stable face aux compteurs, horloges...)
+    content: str  # Hash du texte visible
+
+    def matches(self, other: Optional['PageFingerprint']) -> bool:
+        """Même page, mêmes éléments actionnables (le texte peut avoir bougé)"""
+        return bool(other) and self.url == other.url and self.structure == other.structure
+
+
+def _hash(text: str) -> str:
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=8).hexdigest()
+
+
+async def page_fingerprint(page) -> Optional[PageFingerprint]:
+    """Calculer l'empreinte de la page (None si la page est en cours de navigation)"""
+    try:
+        data = await page.evaluate(FINGERPRINT_JS)
+    except Exception as e:
+        logger.debug(f"Fingerprint failed: {e}")
+        return None
+
+    return PageFingerprint(
+        url=page.url,
+        structure=_hash(data['title'] + '\n' + data['structure']),
+        content=_hash(data['content'])
+    )
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+PageObserver - Observation textuelle de la page pour le planner
+Éléments interactifs (ids stables via l'attribut data-bid) + plan de la page (arbre d'accessibilité CDP),
+sérialisés de façon compacte dans un budget de tokens
+"""
+
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+BID_ATTRIBUTE = 'data-bid'
+
+# Rôles AX retenus pour le plan de la page (le reste est élagué)
+OUTLINE_ROLES = {
+    'heading', 'banner', 'navigation', 'main', 'search', 'form', 'region',
+    'complementary', 'contentinfo', 'dialog', 'alertdialog', 'alert', 'status',
+    'table', 'list', 'StaticText'
+}
+MAX_TEXT_CHARS = 80
+
+# Lignes du plan de la page signalées explicitement quand elles apparaissent
+POPUP_PREFIXES = ('dialog', 'alertdialog', 'alert')
+
+# Éléments interactifs visibles, marqués d'un data-bid qui reste le même tant que l'élément existe
+EXTRACT_ELEMENTS_JS = """
+() => {
+    const selector = [
+        'a[href]', 'button', 'input:not([type=hidden])', 'select', 'textarea', 'summary',
+        '[role=button]', '[role=link]', '[role=checkbox]', '[role=radio]', '[role=tab]',
+        '[role=menuitem]', '[role=option]', '[role=combobox]', '[role=textbox]',
+        '[role=searchbox]', '[role=switch]', '[contenteditable=true]', '[onclick]'
+    ].join(',');
+    window.__bgBidSeq = window.__bgBidSeq || 0;
+    const vw = window.innerWidth, vh = window.innerHeight;
+    const elements = [];
+    for (const el of document.querySelectorAll(selector)) {
+        const rect = el.getBoundingClientRect();
+        if (rect.width < 1 || rect.height < 1) continue;
+        const style = window.getComputedStyle(el);
+        if (style.visibility === 'hidden' || style.display === 'none' || parseFloat(style.opacity) === 0) continue;
+        if (!el.hasAttribute('data-bid')) el.setAttribute('data-bid', String(++window.__bgBidSeq));
+        const label = el.getAttribute('aria-label') || el.getAttribute('title') || el.getAttribute('alt')
+            || (el.labels && el.labels[0] && el.labels[0].innerText) || el.innerText || '';
+        elements.push({
+            bid: el.getAttribute('data-bid'),
+            tag: el.tagName.toLowerCase(),
+            role: el.getAttribute('role') || '',
+            type: el.getAttribute('type') || '',
+            name: label.replace(/\\s+/g, ' ').trim().slice(0, 80),
+            value: (el.value !== undefined && el.tagName !== 'BUTTON') ? String(el.value).slice(0, 80) : '',
+            placeholder: el.getAttribute('placeholder') || '',
+            href: el.getAttribute('href') || '',
+            disabled: !!el.disabled || el.getAttribute('aria-disabled') === 'true',
+            checked: !!el.checked,
+            in_viewport: rect.bottom > 0 && rect.right > 0 && rect.top < vh && rect.left < vw,
+            x: Math.round(rect.x), y: Math.round(rect.y), width: Math.round(rect.width), height: Math.round(rect.height)
+        });
+        if (elements.length >= 400) break;
+    }
+    return {
+        elements,
+        scroll_y: Math.round(window.scrollY),
+        scroll_height: document.documentElement.scrollHeight,
+        viewport_height: vh,
+        canvas_count: document.querySelectorAll('canvas').length,
+        iframe_count: document.querySelectorAll('iframe').length,
+        text_length: document.body ? document.body.innerText.length : 0
+    };
+}
+"""
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximation grossière : ~4 caractères par token"""
+    return len(text) // 4 + 1
+
+
+@dataclass
+class PageElement:
+    bid: str
+    tag: str
+    role: str = ''
+    type: str = ''
+    name: str = ''
+    value: str = ''
+    placeholder: str = ''
+    href: str = ''
+    disabled: bool = False
+    checked: bool = False
+    in_viewport: bool = True
+    x: int = 0
+    y: int = 0
+    width: int = 0
+    height: int = 0
+
+    @property
+    def selector(self) -> str:
+        return f'[{BID_ATTRIBUTE}="{self.bid}"]'
+
+    @property
+    def kind(self) -> str:
+        if self.role:
+            return self.role
+        if self.tag == 'input':
+            return f"input:{self.type or 'text'}"
+        return {'a': 'link', 'select': 'combobox', 'textarea': 'textbox'}.get(self.tag, self.tag)
+
+    def to_line(self) -> str:
+        parts = [f"[{self.bid}] {self.kind}"]
+        if self.name:
+            parts.append(f'"{self.name}"')
+        if self.placeholder and self.placeholder != self.name:
+            parts.append(f'placeholder="{self.placeholder[:40]}"')
+        if self.value and self.type not in ('password', 'submit', 'button'):
+            parts.append(f'value="{self.value[:40]}"')
+        if self.tag == 'a' and self.href and not self.name:
+            parts.append(f'href="{self.href[:60]}"')
+        if self.checked:
+            parts.append('checked')
+        if self.disabled:
+            parts.append('disabled')
+        return ' '.join(parts)
+
+
+@dataclass
+class PageSnapshot:
+    url: str
+    title: str
+    elements: List[PageElement] = field(default_factory=list)
+    outline: List[str] = field(default_factory=list)  # Lignes "heading: ...", "text: ..."
+    scroll_y: int = 0
+    scroll_height: int = 0
+    viewport_height: int = 0
+    canvas_count: int = 0
+    iframe_count: int = 0
+    text_length: int = 0
+
+    def element(self, bid: str) -> Optional[PageElement]:
+        return next((e for e in self.elements if e.bid == str(bid)), None)
+
+    def needs_screenshot(self) -> bool:
+        """Le texte ne suffit pas : page graphique (canvas), vide, ou contenu dans des iframes"""
+        if self.canvas_count > 0:
+            return True
+        if len(self.elements) < 3 and self.text_length < 200:
+            return True
+        return self.iframe_count > 0 and len(self.elements) < 10
+
+    def to_text(self, budget_tokens: int = 1500) -> str:
+        """
+        Sérialisation compacte dans `budget_tokens` :
+        éléments visibles d'abord, puis plan de la page, puis éléments hors écran
+        """
+        lines = [f"URL: {self.url}", f"Title: {self.title}"]
+        if self.scroll_height > self.viewport_height:
+            lines.append(f"Scroll: {self.scroll_y}/{self.scroll_height - self.viewport_height}px")
+        used = sum(estimate_tokens(line) for line in lines)
+
+        sections = [
+            ("Interactive elements (visible):", [e.to_line() for e in self.elements if e.in_viewport]),
+            ("Page outline:", self.outline),
+            ("Interactive elements (off-screen):", [e.to_line() for e in self.elements if not e.in_viewport]),
+        ]
+        omitted = 0
+        for title, section_lines in sections:
+            if not section_lines:
+                continue
+            if used + estimate_tokens(title) > budget_tokens:
+                omitted += len(section_lines)
+                continue
+            lines.append(title)
+            used += estimate_tokens(title)
+            for i, line in enumerate(section_lines):
+                cost = estimate_tokens(line)
+                if used + cost > budget_tokens:
+                    omitted += len(section_lines) - i
+                    break
+                lines.append(line)
+                used += cost
+
+        if omitted:
+            lines.append(f"({omitted} more lines omitted)")
+        return '\n'.join(lines)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+@dataclass
+class SnapshotDiff:
+    """Différences entre un snapshot de référence et l'état courant"""
+    url_changed: bool = False
+    title: Optional[str] = None  # Nouveau titre s'il a changé
+    added: List[PageElement] = field(default_factory=list)
+    removed: List[PageElement] = field(default_factory=list)
+    changed: List[PageElement] = field(default_factory=list)
+    popups: List[str] = field(default_factory=list)  # Nouveaux dialogs/alerts
+    scroll_y: Optional[int] = None
+
+    @property
+    def size(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed) + len(self.popups)
+
+    def is_empty(self) -> bool:
+        return not self.size and self.title is None and self.scroll_y is None
+
+    def to_text(self, budget_tokens: int = 800) -> str:
+        if self.is_empty():
+            return "No changes."
+
+        lines = []
+        if self.title is not None:
+            lines.append(f"Title is now: {self.title}")
+        if self.scroll_y is not None:
+            lines.append(f"Scrolled to: {self.scroll_y}px")
+        lines += [f"New {popup}" for popup in self.popups]
+        lines += [f"+ {e.to_line()}" for e in self.added]
+        lines += [f"~ {e.to_line()}" for e in self.changed]
+        lines += [f"- [{e.bid}] (removed)" for e in self.removed]
+
+        kept, used = [], 0
+        for line in lines:
+            used += estimate_tokens(line)
+            if used > budget_tokens:
+                kept.append(f"({len(lines) - len(kept)} more changes omitted)")
+                break
+            kept.append(line)
+        return '\n'.join(kept)
+
+
+def diff_snapshots(base: PageSnapshot, current: PageSnapshot) -> SnapshotDiff:
+    """Éléments ajoutés/retirés/modifiés (par data-bid), titre, scroll et nouveaux dialogs"""
+    diff = SnapshotDiff(url_changed=base.url != current.url)
+    if current.title != base.title:
+        diff.title = current.title
+    if current.scroll_y != base.scroll_y:
+        diff.scroll_y = current.scroll_y
+
+    before = {e.bid: e for e in base.elements}
+    after = {e.bid: e for e in current.elements}
+    for bid, element in after.items():
+        previous = before.get(bid)
+        if previous is None:
+            diff.added.append(element)
+        elif previous.to_line() != element.to_line() or previous.in_viewport != element.in_viewport:
+            diff.changed.append(element)
+    diff.removed = [e for bid, e in before.items() if bid not in after]
+
+    base_outline = set(base.outline)
+    diff.popups = [line for line in current.outline if line.startswith(POPUP_PREFIXES) and line not in base_outline]
+    return diff
+
+
+class PageObserver:
+    """
+    Construit un PageSnapshot en deux appels :
+    - un evaluate pour les éléments interactifs (et leur data-bid)
+    - Accessibility.getFullAXTree via une session CDP réutilisée pour le plan de la page
+    """
+
+    def __init__(self, max_outline_lines: int = 150):
+        self.max_outline_lines = max_outline_lines
+        self._session = None
+        self._session_page = None
+
+    async def snapshot(self, page) -> PageSnapshot:
+        snapshot = PageSnapshot(url=page.url, title=await page.title())
+
+        data = await page.evaluate(EXTRACT_ELEMENTS_JS)
+        snapshot.elements = [PageElement(**e) for e in data.pop('elements')]
+        for key, value in data.items():
+            setattr(snapshot, key, value)
+
+        try:
+            snapshot.outline = await self._outline(page, {e.name for e in snapshot.elements})
+        except Exception as e:
+            # Pas bloquant : les éléments interactifs suffisent pour agir
+            logger.debug(f"AX tree unavailable: {e}")
+            self._session = None
+
+        return snapshot
+
+    async def _outline(self, page, element_names: set) -> List[str]:
+        if self._session is None or self._session_page is not page:
+            self._session = await page.context.new_cdp_session(page)
+            self._session_page = page
+
+        result = await self._session.send('Accessibility.getFullAXTree')
+        lines: List[str] = []
+        seen_text = set(element_names)
+
+        for node in result.get('nodes', []):
+            if node.get('ignored'):
+                continue
+            role = node.get('role', {}).get('value', '')
+            if role not in OUTLINE_ROLES:
+                continue
+
+            name = ' '.join(str(node.get('name', {}).get('value', '')).split())[:MAX_TEXT_CHARS]
+            if role == 'StaticText':
+                # Texte court et non répété (les libellés des éléments interactifs sont déjà listés)
+                if len(name) < 3 or name in seen_text:
+                    continue
+                seen_text.add(name)
+                lines.append(f"text: {name}")
+            elif role == 'heading':
+                level = next((p['value']['value'] for p in node.get('properties', []) if p.get('name') == 'level'), '')
+                lines.append(f"heading{level}: {name}")
+            else:
+                lines.append(f"{role}: {name}" if name else role)
+
+            if len(lines) >= self.max_outline_lines:
+                break
+
+        return lines
@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+PageSettle - Attendre que la page soit stable après une action
+Remplace les sleeps fixes et networkidle (qui expire sur les sites en long-polling) :
+DOM calme pendant une fenêtre (MutationObserver), ni layout shift ni animation finie en cours,
+aucune requête réseau en vol (hors connexions longues), le tout borné par un plafond dur
+"""
+
+import asyncio
+import logging
+import re
+import time
+from dataclasses import dataclass
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Connexions qui ne se terminent jamais (ou très tard) : ne pas les attendre
+LONG_LIVED_RESOURCE_TYPES = {'websocket', 'eventsource'}
+LONG_LIVED_URL_PATTERN = re.compile(
+    r'long-?poll|/poll(?:ing)?\b|/socket\.io/|/sockjs/|/signalr/|/stream\b|/events?\b|'
+    r'/realtime|/comet|/subscribe|/heartbeat|/beacon|/collect\b',
+    re.IGNORECASE
+)
+
+# Installé une fois par document : horodatage du dernier changement visible
+SETTLE_JS = r"""
+(() => {
+    if (window.__bgSettle) return;
+
+    const state = {lastChange: performance.now()};
+    const touch = () => { state.lastChange = performance.now(); };
+
+    // Les data-bid posés par l'observation / le résolveur ne comptent pas comme des changements
+    new MutationObserver((records) => {
+        if (records.some((r) => r.type !== 'attributes' || r.attributeName !== 'data-bid')) touch();
+    }).observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+
+    try {
+        new PerformanceObserver((list) => {
+            if (list.getEntries().some((entry) => !entry.hadRecentInput)) touch();
+        }).observe({type: 'layout-shift'});
+    } catch (e) { /* layout-shift non supporté */ }
+
+    // Animations/transitions finies en cours (les spinners infinis sont ignorés)
+    const animating = () => document.getAnimations && document.getAnimations().some((a) =>
+        a.playState === 'running' && a.effect && isFinite(a.effect.getComputedTiming().endTime));
+
+    window.__bgSettle = (quietMs, timeoutMs) => new Promise((resolve) => {
+        const start = performance.now();
+        const check = () => {
+            const now = performance.now();
+            if (now - Math.max(state.lastChange, start) >= quietMs && !animating()) return resolve(true);
+            if (now - start >= timeoutMs) return resolve(false);
+            setTimeout(check, Math.min(quietMs, 50));
+        };
+        check();
+    });
+})()
+"""
+
+SETTLE_CALL_JS = "([quietMs, timeoutMs]) => window.__bgSettle ? window.__bgSettle(quietMs, timeoutMs) : null"
+
+
+@dataclass
+class SettleResult:
+    settled: bool  # False : plafond atteint
+    elapsed_ms: float
+    pending_requests: int = 0
+
+
+class PageSettle:
+    """
+    `await settle.wait()` après une action : retourne dès que la page est calme
+    (~quiet_ms dans le cas courant), au plus tard après timeout_ms.
+    """
+
+    QUIET_MS = 150
+    TIMEOUT_MS = 5000
+    LONG_REQUEST_S = 3.0  # Requête en vol depuis plus longtemps : considérée comme longue (long-polling)
+
+    def __init__(self, page=None):
+        self.page = None
+        self._script_installed = False
+        self._inflight: Dict[Any, float] = {}
+        self._changed = asyncio.Event()
+
+        # Statistiques
+        self.waits = 0
+        self.timeouts = 0
+        self.total_ms = 0.0
+
+        if page:
+            self.attach(page)
+
+    def attach(self, page):
+        """Suivre les requêtes d'une (nouvelle) page"""
+        self.detach()
+        self.page = page
+        page.on('request', self._on_request)
+        page.on('requestfinished', self._on_request_done)
+        page.on('requestfailed', self._on_request_done)
+
+    def detach(self):
+        if self.page:
+            self.page.remove_listener('request', self._on_request)
+            self.page.remove_listener('requestfinished', self._on_request_done)
+            self.page.remove_listener('requestfailed', self._on_request_done)
+        self.page = None
+        self._script_installed = False
+        self._inflight.clear()
+
+    def _on_request(self, request):
+        if request.resource_type in LONG_LIVED_RESOURCE_TYPES or LONG_LIVED_URL_PATTERN.search(request.url):
+            return
+        self._inflight[request] = time.monotonic()
+        self._changed.set()
+
+    def _on_request_done(self, request):
+        if self._inflight.pop(request, None) is not None:
+            self._changed.set()
+
+    def _pending(self) -> list:
+        now = time.monotonic()
+        return [started for started in self._inflight.values() if now - started < self.LONG_REQUEST_S]
+
+    async def _network_quiet(self, deadline: float) -> bool:
+        """Attendre la fin des requêtes en vol (réveillé par les événements réseau)"""
+        while True:
+            pending = self._pending()
+            if not pending:
+                return True
+            now = time.monotonic()
+            # Se réveiller au plus tard quand la plus ancienne devient "longue"
+            delay = min(min(pending) + self.LONG_REQUEST_S - now, deadline - now)
+            if delay <= 0:
+                return False
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _dom_quiet(self, quiet_ms: float, timeout_ms: float) -> bool:
+        result = await self.page.evaluate(SETTLE_CALL_JS, [quiet_ms, timeout_ms])
+        if result is None:
+            # Premier appel sur ce document : installer le détecteur (et pour les documents suivants)
+            if not self._script_installed:
+                await self.page.add_init_script(SETTLE_JS)
+                self._script_installed = True
+            await self.page.evaluate(SETTLE_JS)
+            result = await self.page.evaluate(SETTLE_CALL_JS, [quiet_ms, timeout_ms])
+        return bool(result)
+
+    async def wait(self, quiet_ms: Optional[float] = None, timeout_ms: Optional[float] = None) -> SettleResult:
+        quiet_ms = self.QUIET_MS if quiet_ms is None else quiet_ms
+        timeout_ms = self.TIMEOUT_MS if timeout_ms is None else timeout_ms
+        start = time.monotonic()
+        deadline = start + timeout_ms / 1000
+        settled = False
+
+        while self.page and time.monotonic() < deadline:
+            if not await self._network_quiet(deadline):
+                break
+            remaining_ms = (deadline - time.monotonic()) * 1000
+            try:
+                dom_quiet = await self._dom_quiet(quiet_ms, remaining_ms)
+            except Exception as e:
+                # Navigation pendant l'attente (contexte détruit) : attendre le nouveau document
+                logger.debug(f"Settle interrupted ({e}), waiting for the new document")
+                try:
+                    await self.page.wait_for_load_state('domcontentloaded', timeout=max(remaining_ms, 1))
+                except Exception:
+                    break
+                continue
+            # Des requêtes ont pu partir pendant la fenêtre de calme
+            if dom_quiet and not self._pending():
+                settled = True
+                break
+            if not dom_quiet:
+                break
+
+        elapsed_ms = (time.monotonic() - start) * 1000
+        self.waits += 1
+        self.total_ms += elapsed_ms
+        if not settled:
+            self.timeouts += 1
+            logger.debug(f"Page not settled after {elapsed_ms:.0f}ms ({len(self._pending())} requests pending)")
+        return SettleResult(settled=settled, elapsed_ms=elapsed_ms, pending_requests=len(self._pending()))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'waits': self.waits,
+            'timeouts': self.timeouts,
+            'avg_ms': round(self.total_ms / self.waits, 1) if self.waits else 0.0,
+            'pending_requests': len(self._pending())
+        }
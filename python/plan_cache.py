@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+PlanCache - Réutilisation des plans pour les tâches répétées
+Clé : tâche normalisée (avec slots) + motif d'URL + empreinte structurelle de la page
+"search for A" réutilise le plan de "search for B" en remplaçant ${slot0}
+"""
+
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+from urllib.parse import quote, quote_plus, urlsplit
+
+from cache_file import CacheFile
+from page_fingerprint import PageFingerprint
+
+logger = logging.getLogger(__name__)
+
+# À côté du module, quel que soit le répertoire de lancement du serveur (main.js ne fixe pas de cwd)
+DEFAULT_PATH = Path(__file__).parent / "plan_cache.json"
+
+# Parties variables d'une tâche : texte entre guillemets, objet d'une recherche
+SLOT_PATTERNS = [
+    re.compile(r'["“«\'](.+?)["”»\']'),
+    re.compile(
+        r'\b(?:search|find|look up|cherche[rz]?|recherche[rz]?)\s+(?:for\s+|pour\s+)?(.+?)'
+        r'(?=\s+(?:on|in|sur|dans)\s+\S+$|$)',
+        re.IGNORECASE
+    ),
+]
+
+# Formes sous lesquelles un slot peut apparaître dans une action (texte brut, URL)
+SLOT_ENCODINGS = [
+    ('', lambda value: value),
+    (':plus', quote_plus),
+    (':url', quote),
+]
+
+# Plus court, un slot ("go", "js") se retrouve dans des mots sans rapport : la tâche reste littérale
+MIN_SLOT_LENGTH = 3
+
+# Argument entre guillemets d'une action : goto('...'), fill('12', "...")
+QUOTED_ARGUMENT = re.compile(r"""(['"])((?:\\.|(?!\1).)*)\1""")
+# Caractères qui casseraient la syntaxe d'une action une fois le slot réinjecté
+UNSAFE_SLOT_CHARS = re.compile(r"""['"\\]""")
+# Action ciblant un id data-bid : click('12'), fill('[data-bid="7"]', ...). Ces ids sont numérotés par document
+# (PageObserver) : rejoués sur un autre chargement de la page, ils peuvent désigner un autre élément sans erreur
+BID_ACTION = re.compile(
+    r"""^\s*(?:click|dblclick|fill|hover|focus|press|select_option|check|uncheck|clear)\(\s*(['"]?)\s*"""
+    r"""(?:\[data-bid=["']?\d+["']?\]|\d+)\s*\1\s*[,)]"""
+)
+
+
+def extract_slots(task: str) -> Tuple[str, List[str]]:
+    """Retourner (tâche normalisée avec ${slotN}, valeurs des slots)"""
+    text = ' '.join(task.strip().split())
+    slots: List[str] = []
+
+    for pattern in SLOT_PATTERNS:
+        def replace(match):
+            value = match.group(1).strip()
+            if len(value) < MIN_SLOT_LENGTH or '${slot' in value:
+                return match.group(0)
+            slots.append(value)
+            start, end = match.span(1)
+            whole = match.group(0)
+            offset = match.start(0)
+            return whole[:start - offset] + f"${{slot{len(slots) - 1}}}" + whole[end - offset:]
+        text = pattern.sub(replace, text)
+
+    return text.lower(), slots
+
+
+def url_pattern(url: str) -> str:
+    """Hôte + chemin, nombres et identifiants remplacés par * (la query est ignorée)"""
+    parts = urlsplit(url)
+    path = re.sub(r'/[0-9a-f]{8,}|/\d+', '/*', parts.path.rstrip('/'))
+    return f"{parts.netloc.lower()}{path}"
+
+
+def _token_pattern(text: str) -> re.Pattern:
+    """`text` seulement s'il n'est pas collé à une lettre ou un chiffre ("go" ne matche ni "goto" ni "duckduckgo")"""
+    return re.compile(r'(?<!\w)' + re.escape(text) + r'(?!\w)')
+
+
+def _templatize(text: str, slots: List[str]) -> str:
+    for i, value in enumerate(slots):
+        for suffix, encode in SLOT_ENCODINGS:
+            placeholder = f"${{slot{i}{suffix}}}"
+            text = _token_pattern(encode(value)).sub(lambda _: placeholder, text)
+    return text
+
+
+def _templatize_action(action: str, slots: List[str]) -> Optional[str]:
+    """
+    Slots remplacés uniquement dans les arguments entre guillemets ;
+    None si un slot apparaît ailleurs (nom d'action, bid...) : le plan ne doit pas être généralisé
+    """
+    outside = QUOTED_ARGUMENT.sub('', action)
+    for value in slots:
+        for _, encode in SLOT_ENCODINGS:
+            if _token_pattern(encode(value)).search(outside):
+                return None
+    return QUOTED_ARGUMENT.sub(lambda m: m.group(1) + _templatize(m.group(2), slots) + m.group(1), action)
+
+
+def _fill(text: str, slots: List[str]) -> str:
+    for i, value in enumerate(slots):
+        for suffix, encode in SLOT_ENCODINGS:
+            text = text.replace(f"${{slot{i}{suffix}}}", encode(value))
+    return text
+
+
+def _map_strings(plan: Dict[str, Any], fn, action_fn=None) -> Dict[str, Any]:
+    """`fn` sur les textes du plan, `action_fn` (par défaut `fn`) sur les chaînes d'action"""
+    action_fn = action_fn or fn
+    result = {key: fn(value) if isinstance(value, str) else value for key, value in plan.items()}
+    result['proposed_actions'] = [
+        {key: (action_fn if key == 'action' else fn)(value) if isinstance(value, str) else value
+         for key, value in action.items()}
+        for action in plan.get('proposed_actions', [])
+    ]
+    return result
+
+
+def targets_bids(plan: Dict[str, Any]) -> bool:
+    """Le plan désigne au moins un élément par son id data-bid (non réutilisable d'un chargement à l'autre)"""
+    return any(
+        isinstance(action.get('action'), str) and BID_ACTION.match(action['action'])
+        for action in plan.get('proposed_actions', [])
+    )
+
+
+def templatize_plan(plan: Dict[str, Any], slots: List[str]) -> Optional[Dict[str, Any]]:
+    """Plan avec ${slotN} à la place des valeurs de la tâche, ou None s'il ne peut pas être généralisé sans risque"""
+    if not slots:
+        return plan
+
+    template = _map_strings(plan, lambda text: _templatize(text, slots),
+                            lambda action: _templatize_action(action, slots))
+    if any(action.get('action') is None for action in template['proposed_actions']):
+        return None
+
+    # Les actions doivent se reconstruire à l'identique avec les slots d'origine
+    original = [action.get('action') for action in plan.get('proposed_actions', [])]
+    rebuilt = [action.get('action') for action in _map_strings(template, lambda text: _fill(text, slots))['proposed_actions']]
+    if rebuilt != original:
+        return None
+    return template
+
+
+class PlanCache:
+    """
+    Cache LRU + TTL des plans, persisté en JSON (écritures regroupées, hors de l'event loop : cf. CacheFile).
+    Un plan dont une action échoue est invalidé (cf. invalidate) ; un plan qui cible des ids data-bid n'est pas mis en cache.
+    """
+
+    def __init__(self, path: Path = DEFAULT_PATH, max_entries: int = 200, ttl: float = 7 * 24 * 3600):
+        self.file = CacheFile(Path(path), 'plan cache')
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+        # Statistiques
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+        self._load()
+
+    @staticmethod
+    def make_key(template: str, fingerprint: PageFingerprint) -> str:
+        raw = f"{template}|{url_pattern(fingerprint.url)}|{fingerprint.structure}"
+        return hashlib.blake2b(raw.encode('utf-8'), digest_size=12).hexdigest()
+
+    def lookup(self, task: str, fingerprint: PageFingerprint) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """Retourner (clé, plan avec les slots de `task`) ou None"""
+        template, slots = extract_slots(task)
+        key = self.make_key(template, fingerprint)
+
+        entry = self.entries.get(key)
+        if entry and time.time() - entry['created_at'] > self.ttl:
+            del self.entries[key]
+            entry = None
+
+        if not entry or len(slots) != entry['slot_count'] or any(UNSAFE_SLOT_CHARS.search(value) for value in slots):
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        entry['hits'] += 1
+        self.hits += 1
+        logger.info(f"📦 Plan cache hit: '{template}' on {url_pattern(fingerprint.url)}")
+        return key, _map_strings(entry['plan'], lambda text: _fill(text, slots))
+
+    def store(self, task: str, fingerprint: PageFingerprint, plan: Dict[str, Any]) -> Optional[str]:
+        """Mettre le plan en cache ; None s'il ne peut pas être généralisé aux autres valeurs des slots"""
+        template, slots = extract_slots(task)
+        key = self.make_key(template, fingerprint)
+
+        if targets_bids(plan):
+            logger.info(f"📦 Plan not cached: it targets element ids that are only valid for this page load ('{template}')")
+            return None
+
+        templated = templatize_plan(plan, slots)
+        if templated is None:
+            logger.info(f"📦 Plan not cached: task values appear outside action arguments ('{template}')")
+            return None
+
+        self.entries[key] = {
+            'template': template,
+            'url_pattern': url_pattern(fingerprint.url),
+            'slot_count': len(slots),
+            'plan': templated,
+            'created_at': time.time(),
+            'hits': 0
+        }
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+        self._save()
+        return key
+
+    def invalidate(self, key: str):
+        """Une action du plan a échoué : ne plus le resservir"""
+        if self.entries.pop(key, None) is not None:
+            self.invalidations += 1
+            logger.info(f"📦 Plan cache entry invalidated: {key}")
+            self._save()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+        }
+
+    def _load(self):
+        entries = self.file.load()
+        if not entries:
+            return
+        now = time.time()
+        for key, entry in sorted(entries.items(), key=lambda item: item[1].get('created_at', 0)):
+            if now - entry.get('created_at', 0) <= self.ttl and not targets_bids(entry.get('plan', {})):
+                self.entries[key] = entry
+        logger.info(f"📦 Plan cache loaded: {len(self.entries)} entries")
+
+    def _save(self):
+        self.file.schedule(lambda: dict(self.entries))
+
+    async def flush(self):
+        """Écrire les modifications en attente (arrêt du serveur)"""
+        await self.file.flush()
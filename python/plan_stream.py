@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Plan streaming - Parsing incrémental du plan JSON pendant sa génération
+Chaque objet de `proposed_actions` est extrait dès que son accolade fermante arrive
+"""
+
+import asyncio
+import json
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ProposedActionsParser:
+    """
+    Reçoit le texte du LLM par morceaux et retourne les actions complètes
+    de `proposed_actions` au fur et à mesure.
+    Le JSON complet est parsé normalement à la fin : ce parser ne sert qu'à gagner du temps.
+    """
+
+    KEY = '"proposed_actions"'
+
+    def __init__(self):
+        self.text = ""
+        self.actions: List[Dict[str, Any]] = []
+        self._pos = 0  # Prochain caractère à analyser
+        self._array_start: Optional[int] = None  # Position du '[' de proposed_actions
+        self._key_start: Optional[int] = None
+        self._array_done = False
+
+        # État du scan dans le tableau
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """Ajouter du texte, retourner les nouvelles actions complètes et valides"""
+        self.text += chunk
+        if self._array_done:
+            return []
+
+        if self._array_start is None and not self._find_array():
+            return []
+
+        completed = []
+        text = self.text
+        while self._pos < len(text):
+            char = text[self._pos]
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == '{':
+                if self._depth == 0:
+                    self._object_start = self._pos
+                self._depth += 1
+            elif char == '}':
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    action = self._parse_action(text[self._object_start:self._pos + 1])
+                    if action:
+                        self.actions.append(action)
+                        completed.append(action)
+                    self._object_start = None
+            elif char == ']' and self._depth == 0:
+                self._array_done = True
+                self._pos += 1
+                break
+
+            self._pos += 1
+
+        return completed
+
+    def header(self) -> Dict[str, Any]:
+        """Champs du plan qui précèdent `proposed_actions` (raisonnement, état...)"""
+        if self._key_start is None:
+            return {}
+
+        prefix = self.text[:self._key_start].rstrip().rstrip(',')
+        try:
+            data = json.loads(prefix + '}')
+            return data if isinstance(data, dict) else {}
+        except json.JSONDecodeError:
+            return {}
+
+    def _find_array(self) -> bool:
+        key_start = self.text.find(self.KEY)
+        if key_start == -1:
+            return False
+
+        bracket = self.text.find('[', key_start + len(self.KEY))
+        if bracket == -1:
+            return False
+
+        self._key_start = key_start
+        self._array_start = bracket
+        self._pos = bracket + 1
+        return True
+
+    @staticmethod
+    def _parse_action(raw: str) -> Optional[Dict[str, Any]]:
+        try:
+            action = json.loads(raw)
+        except json.JSONDecodeError:
+            logger.debug(f"Skipping malformed streamed action: {raw[:100]}")
+            return None
+
+        if not isinstance(action, dict) or not isinstance(action.get('action'), str) or not action['action'].strip():
+            return None
+        action.setdefault('reasoning', '')
+        return action
+
+
+def same_action(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """Même action sur la même cible (la chaîne d'action seule : le reasoning peut différer entre le stream et le plan final)"""
+    return ' '.join(str(a.get('action', '')).split()) == ' '.join(str(b.get('action', '')).split())
+
+
+class PlanStream:
+    """
+    Plan en cours de génération (cf. HybridBrowserAgent.start_plan) :
+    - `first_action()` se résout dès la première action complète (ou None si le plan n'en a pas)
+    - `result()` attend le plan complet
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        self.header: Dict[str, Any] = {}
+        self.early_action: Optional[Dict[str, Any]] = None
+        self._first = asyncio.get_running_loop().create_future()
+
+    def publish(self, action: Dict[str, Any], header: Dict[str, Any]):
+        """Appelé par le planner pour chaque action parsée pendant le streaming"""
+        if not self._first.done():
+            self.early_action = action
+            self.header = header
+            self._first.set_result(action)
+
+    def finish(self):
+        """Fin du streaming (succès ou erreur) : débloquer first_action()"""
+        if not self._first.done():
+            self._first.set_result(None)
+
+    async def first_action(self) -> Optional[Dict[str, Any]]:
+        # Si la tâche échoue avant, ne pas attendre indéfiniment
+        await asyncio.wait([self._first, self.task], return_when=asyncio.FIRST_COMPLETED)
+        return self._first.result() if self._first.done() else None
+
+    async def result(self):
+        return await self.task
+
+    def cancel(self):
+        if self.task and not self.task.done():
+            self.task.cancel()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+PromptBuilder - Assemblage des prompts du planner et du validateur dans un budget de tokens
+Sections comptées (tiktoken si installé, sinon ~4 caractères/token), sections stables en tête
+pour le cache de préfixe du fournisseur, sections les moins utiles résumées ou retirées en premier
+"""
+
+import logging
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Any, List, Optional, Tuple
+
+from page_observation import estimate_tokens
+
+try:
+    import tiktoken
+    TIKTOKEN_AVAILABLE = True
+except ImportError:
+    TIKTOKEN_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Budget d'entrée par modèle (préfixe le plus long qui correspond), LLM_PROMPT_BUDGET pour forcer
+MODEL_PROMPT_BUDGETS = {
+    'gpt-4o-mini': 6000,
+    'gpt-4o': 8000,
+    'gpt-4': 8000,
+}
+DEFAULT_PROMPT_BUDGET = 6000
+
+# Coût d'une image selon le niveau de détail (detail low : forfait)
+IMAGE_TOKENS = {'low': 85, 'high': 765, 'auto': 765}
+
+# Surcoût par message (rôle, séparateurs)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def prompt_budget(model: str) -> int:
+    if os.getenv('LLM_PROMPT_BUDGET'):
+        return int(os.getenv('LLM_PROMPT_BUDGET'))
+    matches = [name for name in MODEL_PROMPT_BUDGETS if model.startswith(name)]
+    return MODEL_PROMPT_BUDGETS[max(matches, key=len)] if matches else DEFAULT_PROMPT_BUDGET
+
+
+@lru_cache(maxsize=8)
+def _encoding(model: str):
+    if not TIKTOKEN_AVAILABLE:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('o200k_base')
+    except Exception as e:
+        # Table de l'encodeur non téléchargeable (hors ligne) : approximation
+        logger.warning(f"⚠️ tiktoken unavailable for {model}, estimating tokens: {e}")
+        return None
+
+
+def count_tokens(text: str, model: str = 'gpt-4o') -> int:
+    encoding = _encoding(model)
+    if encoding is None:
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class PromptSection:
+    name: str
+    text: str
+    priority: int = 0  # 0 : indispensable ; plus la valeur est grande, plus la section est sacrifiée tôt
+    stable: bool = False  # Identique d'un appel à l'autre (placée en tête du prompt)
+    summary: Optional[str] = None  # Version courte utilisée avant de retirer la section
+    image: Optional[Dict[str, Any]] = None  # Partie image_url (texte vide)
+    tokens: int = 0
+
+
+@dataclass
+class PromptReport:
+    """Ce qui a été envoyé : utilisé pour les logs et relié ensuite à l'usage réel"""
+    kind: str
+    model: str
+    budget: int
+    tokens: int = 0
+    sections: Dict[str, int] = field(default_factory=dict)
+    summarized: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+class PromptBuilder:
+    """
+    builder = PromptBuilder('plan', model)
+    builder.system(SYSTEM_PROMPT)
+    builder.add('task', f"Task: {task}", stable=True)
+    builder.add('history', history, priority=2, summary=short_history)
+    messages, report = builder.build()
+    """
+
+    def __init__(self, kind: str, model: str, budget: Optional[int] = None):
+        self.kind = kind
+        self.model = model
+        self.budget = budget or prompt_budget(model)
+        self.system_prompt = ""
+        self.sections: List[PromptSection] = []
+
+    def system(self, text: str) -> 'PromptBuilder':
+        self.system_prompt = text
+        return self
+
+    def add(self, name: str, text: Optional[str], priority: int = 0, stable: bool = False,
+            summary: Optional[str] = None) -> 'PromptBuilder':
+        if text:
+            self.sections.append(PromptSection(name, text, priority, stable, summary))
+        return self
+
+    def add_image(self, name: str, base64_data: Optional[str], image_format: str = 'png',
+                  detail: str = 'low', priority: int = 0) -> 'PromptBuilder':
+        if base64_data:
+            self.sections.append(PromptSection(name, '', priority, image={
+                "type": "image_url",
+                "image_url": {"url": f"data:image/{image_format};base64,{base64_data}", "detail": detail}
+            }))
+        return self
+
+    def _count(self, section: PromptSection) -> int:
+        if section.image:
+            return IMAGE_TOKENS.get(section.image['image_url']['detail'], IMAGE_TOKENS['auto'])
+        return count_tokens(section.text, self.model) + 1
+
+    def build(self) -> Tuple[List[Dict[str, Any]], PromptReport]:
+        report = PromptReport(self.kind, self.model, self.budget)
+        system_tokens = count_tokens(self.system_prompt, self.model) + MESSAGE_OVERHEAD_TOKENS if self.system_prompt else 0
+
+        for section in self.sections:
+            section.tokens = self._count(section)
+        total = system_tokens + MESSAGE_OVERHEAD_TOKENS + sum(s.tokens for s in self.sections)
+
+        # Au-dessus du budget : résumer puis retirer, en commençant par la priorité la plus basse
+        for section in sorted(self.sections, key=lambda s: s.priority, reverse=True):
+            if total <= self.budget or section.priority == 0:
+                break
+            if section.summary:
+                saved = section.tokens
+                section.text, section.summary = section.summary, None
+                section.tokens = self._count(section)
+                total -= saved - section.tokens
+                report.summarized.append(section.name)
+            if total > self.budget:
+                total -= section.tokens
+                section.tokens = 0
+                report.dropped.append(section.name)
+
+        kept = [s for s in self.sections if s.tokens]
+        # Stables d'abord (ordre d'ajout conservé dans chaque groupe) : préfixe identique entre appels
+        ordered = [s for s in kept if s.stable] + [s for s in kept if not s.stable]
+
+        content: List[Dict[str, Any]] = []
+        text = '\n\n'.join(s.text for s in ordered if not s.image)
+        if text:
+            content.append({"type": "text", "text": text})
+        content += [s.image for s in ordered if s.image]
+
+        messages = []
+        if self.system_prompt:
+            messages.append({"role": "system", "content": self.system_prompt})
+        messages.append({"role": "user", "content": content})
+
+        report.tokens = total
+        report.sections = {s.name: s.tokens for s in self.sections}
+        if self.system_prompt:
+            report.sections = {'system': system_tokens, **report.sections}
+        if report.summarized or report.dropped:
+            logger.info(f"✂️ {self.kind} prompt over budget ({self.budget}): "
+                        f"summarized {report.summarized}, dropped {report.dropped}")
+        return messages, report
+
+
+class PromptUsage:
+    """Tokens envoyés/facturés et cache de préfixe par type d'appel (plan, validate...)"""
+
+    def __init__(self):
+        self.calls: Dict[str, Dict[str, float]] = {}
+
+    def record(self, report: PromptReport, usage: Any, elapsed_ms: float):
+        prompt_tokens = getattr(usage, 'prompt_tokens', None) or report.tokens
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        details = getattr(usage, 'prompt_tokens_details', None)
+        cached_tokens = (getattr(details, 'cached_tokens', 0) or 0) if details else 0
+
+        logger.info(
+            f"📏 {report.kind}: {prompt_tokens} prompt tokens (estimated {report.tokens}/{report.budget}, "
+            f"{cached_tokens} cached), {completion_tokens} completion tokens, {elapsed_ms:.0f}ms"
+            + (f", dropped {report.dropped}" if report.dropped else "")
+        )
+
+        calls = self.calls.setdefault(report.kind, {
+            'calls': 0, 'prompt_tokens': 0, 'cached_tokens': 0, 'completion_tokens': 0,
+            'cache_hits': 0, 'trimmed': 0, 'total_ms': 0.0
+        })
+        calls['calls'] += 1
+        calls['prompt_tokens'] += prompt_tokens
+        calls['cached_tokens'] += cached_tokens
+        calls['completion_tokens'] += completion_tokens
+        calls['cache_hits'] += 1 if cached_tokens else 0
+        calls['trimmed'] += 1 if report.summarized or report.dropped else 0
+        calls['total_ms'] += elapsed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        result = {}
+        for kind, calls in self.calls.items():
+            n = calls['calls']
+            result[kind] = {
+                'calls': n,
+                'avg_prompt_tokens': round(calls['prompt_tokens'] / n),
+                'avg_completion_tokens': round(calls['completion_tokens'] / n),
+                'cached_ratio': round(calls['cached_tokens'] / calls['prompt_tokens'], 3) if calls['prompt_tokens'] else 0.0,
+                'cache_hits': calls['cache_hits'],
+                'trimmed': calls['trimmed'],
+                'avg_ms': round(calls['total_ms'] / n, 1)
+            }
+        return result
@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+Resilience - Coalescence, circuit breaker et requêtes couvertes pour les endpoints VLM/LLM
+- SingleFlight : les appels identiques en vol partagent une seule requête
+- CircuitBreaker : après des erreurs ou des réponses trop lentes répétées, échec immédiat pendant un cool-down
+- ResilientCaller : les deux, plus un endpoint secondaire lancé en parallèle si le principal tarde (hedging)
+"""
+
+import asyncio
+import logging
+import time
+from typing import Dict, Any, Awaitable, Callable, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class CircuitOpenError(Exception):
+    """Endpoint écarté par son circuit breaker (aucune requête envoyée)"""
+
+
+class SingleFlight:
+    """
+    `await flights.do(key, fn)` : si un appel de même clé est en vol, attendre son résultat
+    au lieu d'en lancer un second. La requête partagée n'est annulée qu'avec son dernier appelant
+    (pause de l'agent, plan spéculatif abandonné) : les autres continuent d'attendre le résultat.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+        # Statistiques
+        self.calls = 0
+        self.shared = 0
+        self.cancelled = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        self.calls += 1
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = asyncio.ensure_future(fn())
+            self._flights[key] = flight
+            flight.add_done_callback(lambda done: self._finished(key, done))
+        else:
+            self.shared += 1
+            logger.debug(f"Request coalesced with in-flight call {key[:12]}")
+
+        self._waiters[flight] = self._waiters.get(flight, 0) + 1
+        try:
+            # shield : l'annulation d'un appelant ne doit pas annuler la requête des autres
+            return await asyncio.shield(flight)
+        finally:
+            self._waiters[flight] -= 1
+            if not self._waiters[flight]:
+                del self._waiters[flight]
+                if not flight.done():
+                    self.cancelled += 1
+                    flight.cancel()
+
+    def _finished(self, key: str, flight: asyncio.Future):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        # Tous les appelants ont pu être annulés : l'erreur ne doit pas rester "jamais récupérée"
+        if not flight.cancelled():
+            flight.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        return {'calls': self.calls, 'shared': self.shared, 'cancelled': self.cancelled, 'in_flight': len(self._flights)}
+
+
+class CircuitBreaker:
+    """
+    closed → open après `failure_threshold` échecs consécutifs (une réponse plus lente que
+    `slow_call_s` compte comme un échec) ; open → half-open après `cooldown_s` : une seule requête
+    d'essai, qui referme le circuit si elle réussit et le rouvre sinon.
+    `max_in_flight` : requêtes simultanées vers cet endpoint ; l'attente dans cette file locale
+    n'est pas comptée dans la latence de l'endpoint.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown_s: float = 30.0,
+                 slow_call_s: Optional[float] = None, max_in_flight: Optional[int] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown_s = cooldown_s
+        self.slow_call_s = slow_call_s
+        self._limiter = asyncio.Semaphore(max_in_flight) if max_in_flight else None
+
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+        # Statistiques
+        self.successes = 0
+        self.errors = 0
+        self.slow_calls = 0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def is_open(self) -> bool:
+        """Requêtes refusées en ce moment (cool-down en cours, ou essai half-open déjà en vol)"""
+        if self.state == self.OPEN:
+            return time.monotonic() - self.opened_at < self.cooldown_s
+        return self.state == self.HALF_OPEN and self._probing
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.cooldown_s:
+                return False
+            self.state = self.HALF_OPEN
+            logger.info(f"🔌 Circuit {self.name} half-open: sending a probe request")
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                return False
+            self._probing = True
+        return True
+
+    def record_success(self, latency_s: float):
+        self._probing = False
+        if self.slow_call_s and latency_s > self.slow_call_s:
+            self.slow_calls += 1
+            self._failure(f"slow response ({latency_s:.1f}s)")
+            return
+        self.successes += 1
+        self.failures = 0
+        if self.state != self.CLOSED:
+            logger.info(f"🔌 Circuit {self.name} closed")
+            self.state = self.CLOSED
+
+    def record_failure(self, reason: str = 'error'):
+        self._probing = False
+        self.errors += 1
+        self._failure(reason)
+
+    def _failure(self, reason: str):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                self.opened += 1
+                logger.warning(f"🔌 Circuit {self.name} open for {self.cooldown_s:.0f}s after {self.failures} failures ({reason})")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    async def call(self, fn: Callable[[], Awaitable[T]]) -> T:
+        if not self.allow():
+            self.rejected += 1
+            raise CircuitOpenError(f"circuit {self.name} is open")
+        if self._limiter is None:
+            return await self._timed(fn)
+
+        try:
+            await self._limiter.acquire()
+        except asyncio.CancelledError:
+            self._probing = False
+            raise
+        try:
+            return await self._timed(fn)
+        finally:
+            self._limiter.release()
+
+    async def _timed(self, fn: Callable[[], Awaitable[T]]) -> T:
+        started = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Requête abandonnée (hedging, annulation de la tâche) : ni succès ni échec
+            self._probing = False
+            raise
+        except Exception as e:
+            self.record_failure(type(e).__name__)
+            raise
+        self.record_success(time.monotonic() - started)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'successes': self.successes,
+            'errors': self.errors,
+            'slow_calls': self.slow_calls,
+            'rejected': self.rejected,
+            'opened': self.opened
+        }
+
+
+class ResilientCaller:
+    """
+    `await caller.call(key, primary, secondary)` :
+    - `key` : appels identiques coalescés (None pour ne pas coalescer, ex. streaming)
+    - endpoint principal écarté si son circuit est ouvert (bascule sur le secondaire s'il existe)
+    - `hedge_delay_s` : si le principal n'a pas répondu après ce délai, le secondaire est lancé
+      en parallèle et la première réponse réussie gagne (0 : secondaire seulement en cas d'échec)
+    - `max_in_flight` : requêtes simultanées par endpoint (une file pour le principal, une pour le secondaire)
+    Lève CircuitOpenError quand aucun endpoint n'est disponible.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 3, cooldown_s: float = 30.0,
+                 slow_call_s: Optional[float] = None, hedge_delay_s: float = 0.0,
+                 max_in_flight: Optional[int] = None):
+        self.name = name
+        self.hedge_delay_s = hedge_delay_s
+        self.primary = CircuitBreaker(name, failure_threshold, cooldown_s, slow_call_s, max_in_flight)
+        self.secondary = CircuitBreaker(f"{name}-secondary", failure_threshold, cooldown_s, slow_call_s, max_in_flight)
+        self.flights = SingleFlight()
+
+        # Statistiques
+        self.fast_fails = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def available(self, has_secondary: bool = False) -> bool:
+        return not self.primary.is_open or (has_secondary and not self.secondary.is_open)
+
+    async def call(self, key: Optional[str], primary: Callable[[], Awaitable[T]],
+                   secondary: Optional[Callable[[], Awaitable[T]]] = None, hedge: bool = True) -> T:
+        if key is None:
+            return await self._call(primary, secondary, hedge)
+        return await self.flights.do(key, lambda: self._call(primary, secondary, hedge))
+
+    async def _call(self, primary, secondary, hedge: bool):
+        use_primary = not self.primary.is_open
+        use_secondary = secondary is not None and not self.secondary.is_open
+        if not use_primary and not use_secondary:
+            self.fast_fails += 1
+            raise CircuitOpenError(f"no {self.name} endpoint available")
+
+        first = lambda: self.primary.call(primary)
+        second = lambda: self.secondary.call(secondary)
+        if not use_primary:
+            self.failovers += 1
+            return await second()
+        if not use_secondary:
+            return await first()
+        if not hedge or self.hedge_delay_s <= 0:
+            try:
+                return await first()
+            except Exception as e:
+                logger.warning(f"🔀 {self.name} primary failed ({type(e).__name__}), trying secondary")
+                self.failovers += 1
+                return await second()
+        return await self._hedged(first, second)
+
+    def _failure(self, task: asyncio.Future) -> Optional[BaseException]:
+        """
+        Erreur d'une tâche terminée. Annulée de l'intérieur (ex. par son circuit breaker), elle compte comme
+        un échec ordinaire : relever CancelledError annulerait l'appelant
+        """
+        if task.cancelled():
+            return RuntimeError(f"{self.name} request was cancelled")
+        return task.exception()
+
+    async def _hedged(self, first, second):
+        tasks = [asyncio.ensure_future(first())]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay_s)
+            if done and self._failure(tasks[0]) is None:
+                return tasks[0].result()
+
+            hedging = not done
+            if done:
+                logger.warning(f"🔀 {self.name} primary failed ({type(self._failure(tasks[0])).__name__}), trying secondary")
+                self.failovers += 1
+            else:
+                logger.info(f"🔀 {self.name} primary slower than {self.hedge_delay_s}s, hedging on secondary")
+                self.hedges += 1
+            tasks.append(asyncio.ensure_future(second()))
+
+            error: Optional[BaseException] = None
+            pending = {task for task in tasks if not task.done()}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    failure = self._failure(task)
+                    if failure is None:
+                        if hedging and task is tasks[1]:
+                            self.hedge_wins += 1
+                        return task.result()
+                    error = failure
+            raise error or self._failure(tasks[0])
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'primary': self.primary.stats(),
+            'secondary': self.secondary.stats() if self.secondary.successes or self.secondary.errors else None,
+            'coalescing': self.flights.stats(),
+            'fast_fails': self.fast_fails,
+            'failovers': self.failovers,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins
+        }
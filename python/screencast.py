@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+CDPScreencast - Streaming push via Page.startScreencast (Chromium)
+Les frames arrivent uniquement quand le compositor en produit (pas de polling)
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Dict, Any, Optional, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ScreencastConfig:
+    """Paramètres passés à Page.startScreencast"""
+    format: str = 'jpeg'  # 'jpeg' ou 'png'
+    quality: int = 70  # Ignoré pour png
+    max_width: int = 1024
+    max_height: int = 768
+    every_nth_frame: int = 1
+
+    def to_cdp_params(self) -> Dict[str, Any]:
+        params = {
+            'format': self.format,
+            'maxWidth': self.max_width,
+            'maxHeight': self.max_height,
+            'everyNthFrame': self.every_nth_frame,
+        }
+        if self.format == 'jpeg':
+            params['quality'] = self.quality
+        return params
+
+
+class CDPScreencast:
+    """
+    Screencast CDP attaché à une page Playwright.
+    Chaque frame est transmise à `on_frame(data_base64, metadata)` puis acquittée :
+    Chromium n'envoie pas la frame suivante avant l'ack, ce qui régule le débit.
+    """
+
+    def __init__(
+        self,
+        page,
+        on_frame: Callable[[str, Dict[str, Any]], Awaitable[None]],
+        config: Optional[ScreencastConfig] = None
+    ):
+        self.page = page
+        self.on_frame = on_frame
+        self.config = config or ScreencastConfig()
+        self.session = None
+        self.active = False
+        self.failed = False
+        self.frames_received = 0
+
+    async def start(self):
+        """Ouvrir une session CDP et démarrer le screencast"""
+        self.session = await self.page.context.new_cdp_session(self.page)
+        self.session.on('Page.screencastFrame', self._on_screencast_frame)
+        await self.session.send('Page.startScreencast', self.config.to_cdp_params())
+        self.active = True
+        logger.info(f"📡 CDP screencast started ({self.config.format}, max {self.config.max_width}x{self.config.max_height})")
+
+    async def restart(self, config: ScreencastConfig):
+        """Relancer le screencast avec de nouveaux paramètres (même session CDP)"""
+        self.config = config
+        await self.session.send('Page.stopScreencast')
+        await self.session.send('Page.startScreencast', self.config.to_cdp_params())
+        logger.info(f"📡 CDP screencast reconfigured: {self.config.to_cdp_params()}")
+
+    async def stop(self):
+        """Arrêter le screencast et détacher la session"""
+        if not self.session:
+            return
+
+        self.active = False
+        session, self.session = self.session, None
+        try:
+            await session.send('Page.stopScreencast')
+        except Exception as e:
+            logger.debug(f"stopScreencast failed (OK si page fermée): {e}")
+        try:
+            await session.detach()
+        except Exception as e:
+            logger.debug(f"CDP session detach failed: {e}")
+        logger.info(f"🛑 CDP screencast stopped ({self.frames_received} frames)")
+
+    def _on_screencast_frame(self, params: Dict[str, Any]):
+        """Callback synchrone de l'event CDP : déléguer au traitement async"""
+        asyncio.create_task(self._handle_frame(params))
+
+    async def _handle_frame(self, params: Dict[str, Any]):
+        session = self.session
+        if not self.active or not session:
+            return
+
+        self.frames_received += 1
+        metadata = params.get('metadata', {})
+        metadata['format'] = self.config.format
+
+        try:
+            await self.on_frame(params['data'], metadata)
+        except Exception as e:
+            logger.error(f"Screencast frame handler error: {e}")
+        finally:
+            # Toujours acquitter, sinon Chromium arrête d'envoyer des frames
+            try:
+                await session.send('Page.screencastFrameAck', {'sessionId': params['sessionId']})
+            except Exception as e:
+                if self.active:
+                    logger.warning(f"⚠️ Screencast ack failed: {e}")
+                    self.failed = True
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+SpeculativePlanner - Planification anticipée pendant que la page se stabilise
+Le plan suivant est calculé juste après l'action ; il n'est retenu que si la page
+observée ensuite a la même empreinte (URL + structure)
+"""
+
+import asyncio
+import logging
+from typing import Dict, Any, Optional
+
+from page_fingerprint import PageFingerprint, page_fingerprint
+
+logger = logging.getLogger(__name__)
+
+
+class Speculation:
+    def __init__(self, fingerprint: PageFingerprint, task: asyncio.Task):
+        self.fingerprint = fingerprint
+        self.task = task
+
+
+class SpeculativePlanner:
+    """
+    Usage dans la boucle de l'agent :
+    - `start()` après chaque action : si le prochain tour va replanifier, lancer create_plan tout de suite
+    - `take()` au tour suivant : le plan spéculé si la page n'a pas changé entre-temps, sinon None
+    """
+
+    def __init__(self, agent):
+        self.agent = agent  # HybridBrowserAgent
+        self.pending: Optional[Speculation] = None
+
+        # Statistiques
+        self.started = 0
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+
+    async def start(self, user_task: str, page, frame_provider=None):
+        """Spéculer sur l'état actuel (juste après l'action, avant le délai de stabilisation)"""
+        self.discard()
+
+        # Décidé sans extraction : le DOM et l'AX tree ne sont lus que si une spéculation démarre
+        if not self.agent.should_replan():
+            return
+
+        fingerprint = await page_fingerprint(page)
+        if not fingerprint:
+            return
+
+        # Page encore en transition : ne pas en faire la référence des diffs de l'agent
+        observation = await self.agent.get_rich_observation(page, frame_provider, track=False)
+
+        self.started += 1
+        task = asyncio.create_task(self.agent.create_plan(user_task, observation))
+        self.pending = Speculation(fingerprint, task)
+        logger.debug(f"🔮 Speculative plan started at {fingerprint.url}")
+
+    async def take(self, page):
+        """Retourner le plan spéculé si l'état de la page correspond toujours, sinon l'abandonner"""
+        speculation, self.pending = self.pending, None
+        if not speculation:
+            return None
+
+        if speculation.fingerprint.matches(await page_fingerprint(page)):
+            self.hits += 1
+            logger.info(f"🔮 Speculative plan hit ({self.hit_rate():.0%} hit rate)")
+            return await speculation.task
+
+        self.misses += 1
+        speculation.task.cancel()
+        logger.info(f"🔮 Speculative plan miss: page changed ({self.hit_rate():.0%} hit rate)")
+        return None
+
+    def discard(self):
+        """Spéculation devenue inutile (fin de tâche, pause, pas de replanification)"""
+        if self.pending:
+            self.pending.task.cancel()
+            self.pending = None
+            self.discarded += 1
+
+    def hit_rate(self) -> float:
+        checked = self.hits + self.misses
+        return self.hits / checked if checked else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'started': self.started,
+            'hits': self.hits,
+            'misses': self.misses,
+            'discarded': self.discarded,
+            'hit_rate': round(self.hit_rate(), 3)
+        }
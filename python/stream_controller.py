@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+AdaptiveStreamController - Choisit FPS, format, qualité et échelle du live view
+En fonction du coût de capture/encodage, du lag des clients et de l'activité de l'agent
+"""
+
+import logging
+import math
+import time
+from dataclasses import dataclass, asdict, fields
+from typing import Dict, Any
+
+logger = logging.getLogger(__name__)
+
+# Formats de Page.startScreencast (CDP ne propose pas webp)
+SUPPORTED_FORMATS = ('jpeg', 'png')
+# Réglages qui doivent rester strictement positifs
+POSITIVE_KEYS = {'active_fps', 'idle_fps', 'scale', 'min_scale', 'max_capture_share'}
+
+
+@dataclass
+class StreamPolicy:
+    """Réglages exposés via le message 'stream_config'"""
+    active_fps: float = 10.0  # Agent ou workflow en cours
+    idle_fps: float = 1.0  # Personne n'agit sur la page
+    format: str = 'jpeg'  # 'jpeg' ou 'png' (cf. SUPPORTED_FORMATS)
+    quality: int = 75
+    min_quality: int = 40
+    scale: float = 1.0
+    min_scale: float = 0.5
+    lossless: bool = False  # Force PNG pleine résolution
+    max_client_lag_ms: float = 500.0
+    max_capture_share: float = 0.5  # Part max du temps passé à capturer/encoder
+
+
+@dataclass
+class StreamSettings:
+    """Décision courante du contrôleur"""
+    fps: float
+    format: str
+    quality: int
+    scale: float
+
+    @property
+    def interval(self) -> float:
+        return 1.0 / self.fps if self.fps > 0 else 1.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'fps': round(self.fps, 2),
+            'format': self.format,
+            'quality': self.quality,
+            'scale': round(self.scale, 2)
+        }
+
+
+class AdaptiveStreamController:
+    """
+    Boucle de régulation simple :
+    - FPS cible selon l'activité (agent/workflow vs idle)
+    - FPS plafonné par le coût mesuré capture + encodage
+    - Qualité puis échelle réduites si un client accumule du lag, remontées progressivement sinon
+    """
+
+    ADJUST_INTERVAL = 0.5  # Secondes entre deux ajustements qualité/échelle
+
+    def __init__(self, policy: StreamPolicy = None):
+        self.policy = policy or StreamPolicy()
+        self.active = False
+        self.capture_ms = 0.0
+        self.encode_ms = 0.0
+        self.client_lag_ms = 0.0
+
+        # Dégradation courante (ajustée au plus toutes les ADJUST_INTERVAL secondes)
+        self._quality = self.policy.quality
+        self._scale = self.policy.scale
+        self._last_adjust = 0.0
+
+    def set_activity(self, active: bool):
+        if active != self.active:
+            logger.debug(f"Stream activity: {'active' if active else 'idle'}")
+        self.active = active
+
+    def record_capture(self, duration_ms: float):
+        self.capture_ms = self._ema(self.capture_ms, duration_ms)
+
+    def record_encode(self, duration_ms: float):
+        self.encode_ms = self._ema(self.encode_ms, duration_ms)
+
+    def observe_client_lag(self, lag_ms: float):
+        """Pire lag parmi les clients connectés"""
+        self.client_lag_ms = lag_ms
+
+    def decide(self) -> StreamSettings:
+        policy = self.policy
+
+        if policy.lossless:
+            return StreamSettings(fps=self._target_fps(), format='png', quality=100, scale=1.0)
+
+        # Clients en retard : dégrader qualité puis échelle ; sinon récupérer doucement
+        now = time.monotonic()
+        if now - self._last_adjust >= self.ADJUST_INTERVAL:
+            self._last_adjust = now
+            if self.client_lag_ms > policy.max_client_lag_ms:
+                if self._quality > policy.min_quality:
+                    self._quality = max(policy.min_quality, self._quality - 10)
+                else:
+                    self._scale = max(policy.min_scale, self._scale - 0.1)
+            else:
+                self._quality = min(policy.quality, self._quality + 5)
+                self._scale = min(policy.scale, self._scale + 0.05)
+
+        fps = self._target_fps()
+        if self.client_lag_ms > policy.max_client_lag_ms:
+            fps = max(policy.idle_fps, fps / 2)
+
+        return StreamSettings(fps=fps, format=policy.format, quality=self._quality, scale=self._scale)
+
+    def update_policy(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Appliquer un message 'stream_config' (clés inconnues ignorées).
+        Toutes les valeurs sont validées avant d'en appliquer une : ValueError sinon, politique inchangée.
+        """
+        known = {f.name for f in fields(StreamPolicy)}
+        updates = {}
+        for key, value in config.items():
+            if key not in known:
+                logger.warning(f"⚠️ Unknown stream_config key: {key}")
+                continue
+            updates[key] = self._coerce(key, getattr(self.policy, key), value)
+
+        for key, value in updates.items():
+            setattr(self.policy, key, value)
+
+        self.policy.quality = max(1, min(100, self.policy.quality))
+        self.policy.scale = max(0.1, min(1.0, self.policy.scale))
+
+        self._quality = self.policy.quality
+        self._scale = self.policy.scale
+        logger.info(f"🎛️ Stream policy updated: {self.to_dict()['policy']}")
+        return self.to_dict()
+
+    @staticmethod
+    def _coerce(key: str, current: Any, value: Any) -> Any:
+        """Valeur convertie au type du réglage courant, ou ValueError"""
+        if isinstance(current, bool):
+            if not isinstance(value, bool):
+                raise ValueError(f"{key} must be true or false, got {value!r}")
+            return value
+
+        if isinstance(current, (int, float)):
+            if isinstance(value, bool):
+                raise ValueError(f"{key} must be a number, got {value!r}")
+            try:
+                number = type(current)(value)
+            except (TypeError, ValueError):
+                raise ValueError(f"{key} must be a number, got {value!r}")
+            if not math.isfinite(number) or number < 0 or (key in POSITIVE_KEYS and number == 0):
+                raise ValueError(f"{key} out of range: {value!r}")
+            return number
+
+        value = str(value).lower()
+        if key == 'format' and value not in SUPPORTED_FORMATS:
+            raise ValueError(f"Unsupported format {value!r} (supported: {', '.join(SUPPORTED_FORMATS)})")
+        return value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'policy': asdict(self.policy),
+            'active': self.active,
+            'capture_ms': round(self.capture_ms, 1),
+            'encode_ms': round(self.encode_ms, 1),
+            'client_lag_ms': round(self.client_lag_ms, 1)
+        }
+
+    def _target_fps(self) -> float:
+        policy = self.policy
+        fps = policy.active_fps if self.active else policy.idle_fps
+
+        # Ne pas passer plus de max_capture_share du temps à capturer/encoder
+        cost_s = (self.capture_ms + self.encode_ms) / 1000
+        if cost_s > 0:
+            fps = min(fps, policy.max_capture_share / cost_s)
+
+        return max(fps, 0.2)
+
+    @staticmethod
+    def _ema(previous: float, value: float, alpha: float = 0.2) -> float:
+        return value if previous == 0 else previous + alpha * (value - previous)
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# Modules du serveur importés comme le fait browsergym_server.py (répertoire python/ dans le path)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
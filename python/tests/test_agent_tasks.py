@@ -0,0 +1,132 @@
+"""pause_agent doit être traité pendant qu'un plan attend le LLM, et interrompre ce plan"""
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip('openai')
+
+import browsergym_server
+import hybrid_agent
+from browsergym_server import BrowserGymServer
+from hybrid_agent import HybridBrowserAgent
+from page_fingerprint import FINGERPRINT_JS
+from page_observation import EXTRACT_ELEMENTS_JS
+
+
+class FakeWebSocket:
+    """Messages entrants poussés par le test, messages sortants enregistrés"""
+
+    subprotocol = None
+
+    def __init__(self):
+        self.incoming: asyncio.Queue = asyncio.Queue()
+        self.sent = []
+        self.received = asyncio.Event()
+
+    def push(self, message):
+        self.incoming.put_nowait(json.dumps(message))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        message = await self.incoming.get()
+        if message is None:
+            raise StopAsyncIteration
+        return message
+
+    async def send(self, payload):
+        self.sent.append(json.loads(payload))
+        self.received.set()
+
+    async def close(self, code=1000, reason=''):
+        self.incoming.put_nowait(None)
+
+    async def wait_for(self, predicate, timeout=2.0):
+        async def poll():
+            while not predicate(self.sent):
+                self.received.clear()
+                await self.received.wait()
+        await asyncio.wait_for(poll(), timeout)
+
+
+class FakePage:
+    """Page minimale : un formulaire de recherche, sans arbre d'accessibilité"""
+
+    url = 'https://example.com/search'
+    viewport_size = {'width': 1024, 'height': 768}
+
+    async def title(self):
+        return 'Search'
+
+    async def evaluate(self, script, *args):
+        if script == EXTRACT_ELEMENTS_JS:
+            return {
+                'elements': [
+                    {'bid': '1', 'tag': 'input', 'role': 'searchbox', 'placeholder': 'Search'},
+                    {'bid': '2', 'tag': 'button', 'role': 'button', 'name': 'Go'},
+                    {'bid': '3', 'tag': 'a', 'role': 'link', 'name': 'Help', 'href': '/help'},
+                ],
+                'text_length': 500
+            }
+        if script == FINGERPRINT_JS:
+            return {'title': 'Search', 'structure': 'input button a', 'content': ''}
+        raise RuntimeError('unexpected script')
+
+
+def test_pause_agent_serviced_while_plan_in_flight(monkeypatch):
+    monkeypatch.setenv('OPENAI_API_KEY', 'test')
+
+    async def scenario():
+        llm_calls = []
+        llm_started = asyncio.Event()
+        llm_cancelled = asyncio.Event()
+
+        async def slow_completion(**params):
+            # Endpoint qui met 30 s à répondre
+            llm_calls.append(params['messages'])
+            llm_started.set()
+            try:
+                await asyncio.sleep(30)
+            except asyncio.CancelledError:
+                llm_cancelled.set()
+                raise
+            raise AssertionError('the planner call should have been cancelled')
+
+        monkeypatch.setattr(hybrid_agent, 'create_chat_completion', slow_completion)
+
+        server = BrowserGymServer(use_llm=False, use_hybrid=False)
+        # Agent hybride réel sur une page factice (BrowserGym et Playwright ne sont pas nécessaires au planner)
+        monkeypatch.setattr(browsergym_server, 'BROWSERGYM_AVAILABLE', True)
+        server.use_hybrid = True
+        server.hybrid_agent = HybridBrowserAgent()
+        server.page = FakePage()
+        websocket = FakeWebSocket()
+        client = asyncio.create_task(server.handle_client(websocket, '/'))
+
+        try:
+            websocket.push({'type': 'user_message', 'message': 'search for "python tutorial"'})
+            websocket.push({'type': 'user_message', 'message': 'queued task'})
+            await asyncio.wait_for(llm_started.wait(), 2.0)
+
+            # Le plan attend le LLM : la boucle de réception doit quand même traiter la pause
+            websocket.push({'type': 'pause_agent'})
+            await websocket.wait_for(lambda sent: any(m['type'] == 'agent_paused' for m in sent))
+            await asyncio.wait_for(llm_cancelled.wait(), 2.0)
+
+            # Le plan en cours et le message en attente répondent tous deux "interrupted"
+            await websocket.wait_for(
+                lambda sent: sum('interrupted' in m.get('message', '') for m in sent) == 2
+            )
+            await asyncio.sleep(0)
+            assert len(llm_calls) == 1
+            assert 'python tutorial' in json.dumps(llm_calls[0])
+            assert not server.agent_tasks
+        finally:
+            await websocket.close()
+            await asyncio.wait_for(client, 2.0)
+            server.image_workers.shutdown()
+
+    asyncio.run(scenario())
@@ -1,43 +1,168 @@
+import asyncio
 import base64
+import hashlib
 import logging
 import os
 import json
 import aiohttp
-from typing import Dict, Any, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple
+
+from resilience import CircuitOpenError, ResilientCaller
 
 logger = logging.getLogger(__name__)
 
+# Timeouts (secondes), requêtes simultanées et taille du pool de connexions vers le VLM
+VLM_TIMEOUT = float(os.getenv('VLM_TIMEOUT', '30'))
+VLM_CONNECT_TIMEOUT = float(os.getenv('VLM_CONNECT_TIMEOUT', '5'))
+VLM_MAX_IN_FLIGHT = int(os.getenv('VLM_MAX_IN_FLIGHT', '4'))
+VLM_MAX_CONNECTIONS = int(os.getenv('VLM_MAX_CONNECTIONS', '8'))
+# Validation visuelle : plus courte que le grounding, le résultat est facultatif
+VLM_VALIDATE_TIMEOUT = float(os.getenv('VLM_VALIDATE_TIMEOUT', '10'))
+
+# Circuit breaker : échecs (ou réponses plus lentes que VLM_SLOW_CALL) consécutifs avant d'écarter l'endpoint
+VLM_BREAKER_FAILURES = int(os.getenv('VLM_BREAKER_FAILURES', '3'))
+VLM_BREAKER_COOLDOWN = float(os.getenv('VLM_BREAKER_COOLDOWN', '30'))
+VLM_SLOW_CALL = float(os.getenv('VLM_SLOW_CALL', '20'))
+# Endpoint secondaire (optionnel) : lancé si le principal n'a pas répondu après VLM_HEDGE_DELAY
+VLM_HEDGE_DELAY = float(os.getenv('VLM_HEDGE_DELAY', '3'))
+
+
+def _completions_url(url: str) -> str:
+    # Si l'URL ne contient pas le endpoint, on l'ajoute (supposition courante)
+    if "chat/completions" not in url and not url.endswith("/"):
+        return f"{url}/v1/chat/completions"
+    return url
+
+
 class VLMService:
     """
     Service pour interagir avec un Vision Language Model via API compatible OpenAI.
     Utilise les variables d'environnement VLM_URL et VLM_MODEL.
+    Session HTTP créée au premier appel et réutilisée (keep-alive) ; fermée par aclose().
+    Appels identiques en vol coalescés, endpoint écarté par un circuit breaker quand il est lent ou en panne,
+    et endpoint secondaire optionnel (VLM_SECONDARY_URL, VLM_SECONDARY_MODEL) pour les requêtes couvertes.
     """
     
     def __init__(self):
-        self.api_url = os.getenv("VLM_URL", "http://localhost:8000/v1/chat/completions")
+        self.api_url = _completions_url(os.getenv("VLM_URL", "http://localhost:8000/v1/chat/completions"))
         self.model = os.getenv("VLM_MODEL", "gpt-4o-mini")
         self.api_key = os.getenv("OPENAI_API_KEY", "dummy") # Clé dummy si self-hosted
         
-        # Si l'URL ne contient pas le endpoint, on l'ajoute (supposition courante)
-        if "chat/completions" not in self.api_url and not self.api_url.endswith("/"):
-            self.api_url = f"{self.api_url}/v1/chat/completions"
-            
+        self.secondary_url = _completions_url(os.getenv("VLM_SECONDARY_URL")) if os.getenv("VLM_SECONDARY_URL") else None
+        self.secondary_model = os.getenv("VLM_SECONDARY_MODEL", self.model)
+        self.secondary_api_key = os.getenv("VLM_SECONDARY_API_KEY", self.api_key)
+        
         self.enabled = bool(os.getenv("VLM_URL") or os.getenv("OPENAI_API_KEY"))
         
+        self._session: Optional[aiohttp.ClientSession] = None
+        # VLM_MAX_IN_FLIGHT par endpoint : l'attente d'une place n'est pas comptée comme latence par le circuit breaker
+        self.resilience = ResilientCaller(
+            'vlm', VLM_BREAKER_FAILURES, VLM_BREAKER_COOLDOWN, VLM_SLOW_CALL, VLM_HEDGE_DELAY,
+            max_in_flight=VLM_MAX_IN_FLIGHT
+        )
+        
+        # Statistiques
+        self.calls = 0
+        self.in_flight = 0
+        self.timeouts = 0
+        self.errors = 0
+        
         if self.enabled:
             logger.info(f"👁️ VLMService initialized with URL: {self.api_url}, Model: {self.model}")
+            if self.secondary_url:
+                logger.info(f"👁️ VLM secondary endpoint: {self.secondary_url}, Model: {self.secondary_model} (hedge after {VLM_HEDGE_DELAY}s)")
         else:
             logger.warning("⚠️ VLMService disabled: VLM_URL or OPENAI_API_KEY not set")
 
-    async def _call_vlm_api(self, prompt: str, screenshot_base64: str) -> Optional[str]:
-        """Appel générique à l'API VLM"""
-        if not self.enabled:
-            return None
+    def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=VLM_MAX_CONNECTIONS,
+                keepalive_timeout=30,
+                ttl_dns_cache=300
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=VLM_TIMEOUT, connect=VLM_CONNECT_TIMEOUT)
+            )
+        return self._session
+
+    async def aclose(self):
+        """Fermer la session et ses connexions (arrêt du serveur)"""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    @property
+    def available(self) -> bool:
+        """Activé et au moins un endpoint hors cool-down : sinon les fallbacks VLM sont sautés sans attendre"""
+        return self.enabled and self.resilience.available(self.secondary_url is not None)
 
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'calls': self.calls,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+            'in_flight': self.in_flight,
+            'resilience': self.resilience.stats()
+        }
+
+    async def _post(self, url: str, api_key: str, payload: Dict[str, Any], options: Dict[str, Any]) -> Optional[str]:
+        """
+        Une requête vers un endpoint. Les erreurs serveur (5xx, 429) et les timeouts sont levés
+        pour le circuit breaker ; une requête refusée (4xx) retourne None sans le déclencher.
+        """
         headers = {
             "Content-Type": "application/json",
-            "Authorization": f"Bearer {self.api_key}"
+            "Authorization": f"Bearer {api_key}"
         }
+        self.calls += 1
+        self.in_flight += 1
+        try:
+            session = self._get_session()
+            async with session.post(url, headers=headers, json=payload, **options) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"❌ VLM API Error {response.status}: {error_text}")
+                    self.errors += 1
+                    if response.status >= 500 or response.status == 429:
+                        raise aiohttp.ClientResponseError(
+                            response.request_info, response.history,
+                            status=response.status, message=error_text[:200]
+                        )
+                    return None
+                
+                result = await response.json()
+                content = result['choices'][0]['message']['content']
+                return content
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.error(f"❌ VLM request to {url} timed out")
+            raise
+        except aiohttp.ClientResponseError:
+            raise
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ VLM Request Exception: {e}")
+            raise
+        finally:
+            self.in_flight -= 1
+
+    async def _call_vlm_api(
+        self,
+        prompt: str,
+        screenshot_base64: str,
+        image_format: str = 'png',
+        timeout: Optional[float] = None,
+        max_tokens: int = 300
+    ) -> Optional[str]:
+        """
+        Appel générique à l'API VLM
+        Au plus VLM_MAX_IN_FLIGHT appels simultanés ; `timeout` (secondes) remplace VLM_TIMEOUT pour cet appel.
+        Retourne None sans requête si le circuit breaker écarte tous les endpoints.
+        """
+        if not self.enabled:
+            return None
 
         payload = {
             "model": self.model,
@@ -52,39 +177,81 @@ class VLMService:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{screenshot_base64}"
+                                "url": f"data:image/{image_format};base64,{screenshot_base64}"
                             }
                         }
                     ]
                 }
             ],
-            "max_tokens": 300,
+            "max_tokens": max_tokens,
             "temperature": 0.1
         }
 
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.api_url, headers=headers, json=payload) as response:
-                    if response.status != 200:
-                        error_text = await response.text()
-                        logger.error(f"❌ VLM API Error {response.status}: {error_text}")
-                        return None
-                    
-                    result = await response.json()
-                    content = result['choices'][0]['message']['content']
-                    return content
+        # Sans timeout propre à l'appel, celui de la session s'applique (ne pas passer timeout=None : désactivé)
+        options = {'timeout': aiohttp.ClientTimeout(total=timeout, connect=VLM_CONNECT_TIMEOUT)} if timeout else {}
 
+        # Même prompt sur la même image : une seule requête pour tous les appelants en vol
+        key = hashlib.blake2b(f"{max_tokens}|{prompt}|".encode('utf-8'), digest_size=16)
+        key.update(screenshot_base64.encode('ascii'))
+
+        secondary = None
+        if self.secondary_url:
+            secondary_payload = {**payload, "model": self.secondary_model}
+            secondary = lambda: self._post(self.secondary_url, self.secondary_api_key, secondary_payload, options)
+
+        try:
+            return await self.resilience.call(
+                key.hexdigest(),
+                lambda: self._post(self.api_url, self.api_key, payload, options),
+                secondary
+            )
+        except CircuitOpenError as e:
+            logger.warning(f"⚡ VLM call skipped: {e}")
+            return None
+        except asyncio.TimeoutError:
+            logger.debug(f"VLM call failed: no response within {timeout or VLM_TIMEOUT}s")
+            return None
         except Exception as e:
-            logger.error(f"❌ VLM Request Exception: {e}")
+            # Déjà compté et loggé par _post (une fois, même si l'appel était partagé)
+            logger.debug(f"VLM call failed: {e}")
             return None
 
-    async def get_element_coordinates(self, screenshot_base64: str, element_description: str) -> Optional[Tuple[int, int]]:
+    @staticmethod
+    def _parse_json(response_text: str) -> Dict[str, Any]:
+        """JSON de la réponse, même entouré de markdown ou de texte"""
+        # Nettoyage basique au cas où le modèle est bavard (markdown code blocks)
+        clean_text = response_text.replace("```json", "").replace("```", "").strip()
+        
+        # Chercher le premier { et le dernier }
+        start_idx = clean_text.find('{')
+        end_idx = clean_text.rfind('}')
+        
+        if start_idx != -1 and end_idx != -1:
+            clean_text = clean_text[start_idx:end_idx+1]
+        
+        return json.loads(clean_text)
+
+    @staticmethod
+    def _to_page(data: Dict[str, Any], mapping=None) -> Tuple[int, int]:
+        if mapping:
+            return mapping.to_page(float(data["x"]), float(data["y"]))
+        return (int(data["x"]), int(data["y"]))
+
+    async def get_element_coordinates(
+        self,
+        screenshot_base64: str,
+        element_description: str,
+        mapping=None,
+        image_format: str = 'png'
+    ) -> Optional[Tuple[int, int]]:
         """
         Demande au VLM les coordonnées (x, y) d'un élément.
         Retour attendu du VLM: JSON {"x": 100, "y": 200}
+        `mapping` (ex: un PyramidLevel) convertit les coordonnées de l'image en pixels de la page.
         """
+        size_hint = f"The image is {mapping.width}x{mapping.height} pixels. " if mapping and mapping.width else ""
         prompt = f"""
-        Look at this screenshot of a web page. I need to find the center coordinates (x, y) of the following element:
+        Look at this screenshot of a web page. {size_hint}I need to find the center coordinates (x, y) of the following element:
         "{element_description}"
 
         Return ONLY a JSON object with the coordinates, like this: {{"x": 150, "y": 300}}.
@@ -92,30 +259,20 @@ class VLMService:
         DO NOT write any other text or explanation. Just the JSON.
         """
         
-        response_text = await self._call_vlm_api(prompt, screenshot_base64)
+        response_text = await self._call_vlm_api(prompt, screenshot_base64, image_format)
         
         if not response_text:
             return None
             
         try:
-            # Nettoyage basique au cas où le modèle est bavard (markdown code blocks)
-            clean_text = response_text.replace("```json", "").replace("```", "").strip()
-            
-            # Chercher le premier { et le dernier }
-            start_idx = clean_text.find('{')
-            end_idx = clean_text.rfind('}')
-            
-            if start_idx != -1 and end_idx != -1:
-                clean_text = clean_text[start_idx:end_idx+1]
-            
-            data = json.loads(clean_text)
+            data = self._parse_json(response_text)
             
             if "error" in data:
                 logger.warning(f"👁️ VLM could not find element: {data['error']}")
                 return None
                 
             if "x" in data and "y" in data:
-                return (int(data["x"]), int(data["y"]))
+                return self._to_page(data, mapping)
                 
         except json.JSONDecodeError:
             logger.error(f"❌ Failed to parse VLM response as JSON: {response_text}")
@@ -124,10 +281,62 @@ class VLMService:
             
         return None
 
-    async def validate_state(self, screenshot_base64: str, expectation: str) -> bool:
+    async def get_elements_coordinates(
+        self,
+        screenshot_base64: str,
+        element_descriptions: List[str],
+        mapping=None,
+        image_format: str = 'png'
+    ) -> List[Optional[Tuple[int, int]]]:
+        """
+        Coordonnées de plusieurs éléments du même écran en une seule inférence.
+        Retourne une liste alignée sur `element_descriptions` (None pour un élément non trouvé).
+        """
+        if len(element_descriptions) == 1:
+            return [await self.get_element_coordinates(screenshot_base64, element_descriptions[0], mapping, image_format)]
+        
+        size_hint = f"The image is {mapping.width}x{mapping.height} pixels. " if mapping and mapping.width else ""
+        numbered = "\n".join(f'{i}. "{description}"' for i, description in enumerate(element_descriptions))
+        prompt = f"""
+        Look at this screenshot of a web page. {size_hint}I need to find the center coordinates (x, y) of each of the following elements:
+        {numbered}
+
+        Return ONLY a JSON object with one entry per element, in the same order, like this:
+        {{"elements": [{{"index": 0, "x": 150, "y": 300}}, {{"index": 1, "error": "not found"}}]}}
+        DO NOT write any other text or explanation. Just the JSON.
+        """
+        
+        results: List[Optional[Tuple[int, int]]] = [None] * len(element_descriptions)
+        response_text = await self._call_vlm_api(
+            prompt, screenshot_base64, image_format, max_tokens=100 + 40 * len(element_descriptions)
+        )
+        if not response_text:
+            return results
+        
+        try:
+            elements = self._parse_json(response_text).get("elements", [])
+            for position, element in enumerate(elements):
+                index = int(element.get("index", position))
+                if 0 <= index < len(results) and "x" in element and "y" in element:
+                    results[index] = self._to_page(element, mapping)
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError) as e:
+            logger.error(f"❌ Failed to parse batched VLM response ({e}): {response_text}")
+        
+        found = sum(1 for coords in results if coords)
+        logger.info(f"👁️ VLM batch grounding: {found}/{len(results)} elements found in one call")
+        return results
+
+    async def validate_state(self, screenshot_base64: str, expectation: str, image_format: str = 'png',
+                             fail_open: bool = True) -> bool:
         """
         Vérifie si l'état visuel correspond à l'attente (YES/NO).
+        Sans réponse du VLM (circuit ouvert, erreur, ou plus de VLM_VALIDATE_TIMEOUT), retourne `fail_open`
+        immédiatement plutôt qu'après le timeout complet.
         """
+        if not self.available:
+            logger.warning(f"⚡ VLM unavailable (circuit open), validation skipped: assuming {'success' if fail_open else 'failure'}")
+            return fail_open
+        
         prompt = f"""
         Look at this screenshot. Does it satisfy the following condition?
         Condition: "{expectation}"
@@ -135,13 +344,15 @@ class VLMService:
         Reply with exactly one word: "YES" if the condition is met, "NO" otherwise.
         """
         
-        response_text = await self._call_vlm_api(prompt, screenshot_base64)
+        response_text = await self._call_vlm_api(
+            prompt, screenshot_base64, image_format, timeout=VLM_VALIDATE_TIMEOUT, max_tokens=5
+        )
         
         if not response_text:
-            # En cas d'erreur VLM, on assume le succès pour ne pas bloquer le workflow (fail open)
-            # ou fail close selon la criticité. Ici "fail open" pour l'UX.
-            logger.warning("⚠️ VLM validation failed (network/api), assuming success.")
-            return True
+            # En cas d'erreur VLM : fail open par défaut pour ne pas bloquer le workflow (UX),
+            # fail close si l'appelant le demande (étape critique)
+            logger.warning(f"⚠️ VLM validation failed (network/api), assuming {'success' if fail_open else 'failure'}.")
+            return fail_open
             
         answer = response_text.strip().upper()
         logger.info(f"👁️ VLM Validation: {answer} (Expectation: {expectation})")
@@ -6,8 +6,7 @@ MVP: goto, click, fill (pas de variables pour l'instant)
 
 import asyncio
 import logging
-import base64
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from playwright.async_api import Page
 
 # Eviter l'import circulaire si VLMService est dans un autre fichier,
@@ -17,8 +16,30 @@ try:
 except ImportError:
     VLMService = Any
 
+from frame_provider import CapturedFrame
+from frame_pyramid import FramePyramid
+from element_resolver import ElementResolver
+from page_settle import PageSettle
+from grounding_cache import GroundingCache
+
 logger = logging.getLogger(__name__)
 
+# Premier ancêtre visible (dans le viewport) de l'élément du sélecteur, même si l'élément est masqué
+VISIBLE_CONTAINER_JS = """
+(selector) => {
+    let el = null;
+    try { el = document.querySelector(selector); } catch (e) { return null; }
+    while (el && el !== document.body && el !== document.documentElement) {
+        const r = el.getBoundingClientRect();
+        if (r.width > 0 && r.height > 0 && r.bottom > 0 && r.right > 0 && r.top < innerHeight && r.left < innerWidth) {
+            return {x: r.x, y: r.y, width: r.width, height: r.height};
+        }
+        el = el.parentElement;
+    }
+    return null;
+}
+"""
+
 
 class WorkflowPlayer:
     """
@@ -26,9 +47,23 @@ class WorkflowPlayer:
     MVP: goto, click, fill (pas de variables pour l'instant)
     """
     
-    def __init__(self, page: Page, vlm_service: Optional[VLMService] = None):
+    # Étapes suivantes groupées dans un même appel VLM
+    MAX_LOOKAHEAD = 5
+    # Marge (pixels CSS) autour de la position connue d'un élément, et taille max de la zone envoyée au VLM
+    ROI_MARGIN = 160
+    ROI_MAX_AREA_RATIO = 0.5
+    
+    def __init__(self, page: Page, vlm_service: Optional[VLMService] = None, frame_provider=None,
+                 page_settle: Optional[PageSettle] = None, grounding_cache: Optional[GroundingCache] = None):
         self.page = page
         self.vlm_service = vlm_service
+        self.frame_provider = frame_provider  # Screenshots partagés avec le live view
+        self.page_settle = page_settle or PageSettle(page)
+        # Coordonnées VLM réutilisées d'un rejeu à l'autre (et pré-remplies par les appels groupés)
+        self.grounding_cache = grounding_cache or GroundingCache(path=None)
+        self._actions = []
+        self._current = 0
+        self.resolver = ElementResolver(page)
     
     async def play(self, workflow: Dict[str, Any], variables: Dict[str, str] = None) -> Dict[str, Any]:
         """Rejouer un workflow complet"""
@@ -47,13 +82,15 @@ class WorkflowPlayer:
             'errors': []
         }
         
+        self._actions = actions
         for i, action in enumerate(actions):
             action_type = action.get('type')
+            self._current = i
             
             try:
                 logger.info(f"[{i+1}/{len(actions)}] {action_type}")
                 
-                # NOUVEAU: Attendre que la page soit stable avant chaque action
+                # Attendre que la page soit stable (effets de l'action précédente compris)
                 await self._wait_for_page_ready()
                 
                 if action_type == 'goto':
@@ -73,8 +110,8 @@ class WorkflowPlayer:
                 
                 results['actions_executed'] += 1
                 
-                # NOUVEAU: Attendre après l'action (laisser le temps à la page de réagir)
-                await asyncio.sleep(0.8)  # Augmenté de 0.5 à 0.8
+                if self.frame_provider:
+                    self.frame_provider.invalidate()
             
             except Exception as e:
                 logger.error(f"❌ Action {i+1} failed: {e}")
@@ -91,6 +128,9 @@ class WorkflowPlayer:
                     results['success'] = False
                     break
         
+        # État final stable pour l'appelant (screenshot, validation)
+        await self._wait_for_page_ready()
+        
         if results['success']:
             logger.info(f"✅ Workflow completed: {results['actions_executed']} actions")
         else:
@@ -100,13 +140,10 @@ class WorkflowPlayer:
     
     async def _wait_for_page_ready(self):
         """Attendre que la page soit prête avant d'exécuter une action"""
-        try:
-            # Attendre que la page soit en état stable (pas de requêtes réseau en cours)
-            await self.page.wait_for_load_state('networkidle', timeout=10000)
-        except Exception as e:
-            # Si timeout, continuer quand même (certaines pages ont toujours des requêtes)
-            logger.debug(f"networkidle timeout (OK): {e}")
-            pass
+        result = await self.page_settle.wait(timeout_ms=10000)
+        if not result.settled:
+            # Continuer quand même (animations continues, requêtes longues...)
+            logger.debug(f"Page not settled after {result.elapsed_ms:.0f}ms (OK)")
     
     async def _execute_goto(self, action: Dict[str, Any], variables: Dict[str, str]):
         """Exécuter une navigation"""
@@ -118,9 +155,117 @@ class WorkflowPlayer:
         # Substitution de variables
         url = self._substitute_variables(url, variables)
         
-        await self.page.goto(url, wait_until='networkidle', timeout=30000)
+        await self.page.goto(url, wait_until='domcontentloaded', timeout=30000)
         logger.info(f"  → Navigated to: {url}")
     
+    async def _screenshot_pyramid(self) -> FramePyramid:
+        """Pyramide d'un screenshot pleine résolution (niveau 'full' pour le VLM)"""
+        if self.frame_provider:
+            return await self.frame_provider.get_pyramid(max_age_ms=200, full_resolution=True)
+        
+        viewport = self.page.viewport_size
+        return FramePyramid(
+            CapturedFrame('png', data=await self.page.screenshot(type='png')),
+            (viewport['width'], viewport['height']) if viewport else None
+        )
+    
+    async def _vlm_locate(self, description: str, action: Optional[Dict[str, Any]] = None) -> Optional[Tuple[int, int]]:
+        """
+        Demander au VLM la position d'un élément, en pixels CSS de la page
+        Écran semblable déjà vu pour cette description : coordonnées du cache, vérifiées dans le DOM.
+        Position approximative connue (DOM, enregistrement) : le VLM ne voit que cette zone
+        """
+        pyramid = await self._screenshot_pyramid()
+        level = await pyramid.level('full')
+        
+        hit = await self.grounding_cache.lookup(description, level, pyramid.workers)
+        if hit and await self.grounding_cache.validate(self.page, hit):
+            return hit.x, hit.y
+        
+        roi = await self._region_of_interest(action, level) if action else None
+        region = await pyramid.region(roi) if roi else None
+        if region:
+            logger.info(f"     Region of interest {roi} → {region.width}x{region.height} image")
+            region_base64 = await region.load_base64(pyramid.workers)
+            coords = await self.vlm_service.get_element_coordinates(
+                region_base64, description, mapping=region, image_format=region.format
+            )
+            if coords:
+                await self.grounding_cache.store(description, level, pyramid.workers, coords, self.page)
+                return coords
+            logger.info(f"     Not found in the region, asking on the full screenshot")
+        
+        # Étapes suivantes sur le même écran : un seul appel VLM pour toutes, résultats mis en cache
+        descriptions = [description] + [d for d in self._upcoming_descriptions() if d != description]
+        screenshot_base64 = await level.load_base64(pyramid.workers)
+        results = await self.vlm_service.get_elements_coordinates(
+            screenshot_base64, descriptions, mapping=level, image_format=level.format
+        )
+        
+        for other, coords in zip(descriptions, results):
+            if coords:
+                await self.grounding_cache.store(other, level, pyramid.workers, coords, self.page)
+        return results[0]
+    
+    async def _region_of_interest(self, action: Dict[str, Any], level) -> Optional[Tuple[int, int, int, int]]:
+        """
+        Zone (x, y, largeur, hauteur en pixels CSS) où chercher l'élément :
+        conteneur visible d'un sélecteur qui correspond encore, sinon position enregistrée
+        """
+        rect = None
+        try:
+            rect = await self.page.evaluate(VISIBLE_CONTAINER_JS, action.get('selector'))
+        except Exception as e:
+            logger.debug(f"Container lookup failed: {e}")
+        rect = rect or action.get('context', {}).get('rect')
+        if not rect:
+            return None
+        
+        page_width, page_height = level.page_width, level.page_height
+        left = max(0, rect['x'] - self.ROI_MARGIN)
+        top = max(0, rect['y'] - self.ROI_MARGIN)
+        right = min(page_width, rect['x'] + rect['width'] + self.ROI_MARGIN)
+        bottom = min(page_height, rect['y'] + rect['height'] + self.ROI_MARGIN)
+        if right <= left or bottom <= top:
+            return None
+        
+        # Zone presque aussi grande que l'écran : aucun gain
+        if (right - left) * (bottom - top) > self.ROI_MAX_AREA_RATIO * page_width * page_height:
+            return None
+        return round(left), round(top), round(right - left), round(bottom - top)
+    
+    def _upcoming_descriptions(self) -> List[str]:
+        """
+        Descriptions VLM des prochains click/fill, jusqu'au prochain goto ou au premier clic
+        (qui change probablement l'écran, mais est encore visible sur celui-ci)
+        """
+        descriptions = []
+        for action in self._actions[self._current + 1:self._current + 1 + self.MAX_LOOKAHEAD]:
+            if action.get('type') not in ('click', 'fill'):
+                break
+            descriptions.append(self._vlm_description(action))
+            if action.get('type') == 'click':
+                break
+        return descriptions
+    
+    @staticmethod
+    def _vlm_description(action: Dict[str, Any]) -> str:
+        """Description d'un élément de l'action pour le VLM"""
+        selector = action.get('selector')
+        context = action.get('context', {})
+        
+        if action.get('type') == 'fill':
+            description = f"Input field to fill: {selector}"
+        else:
+            description = f"Element to click: {selector}"
+        if context.get('text'):
+            description += f", text: '{context['text']}'"
+        if context.get('ariaLabel'):
+            description += f", aria-label: '{context['ariaLabel']}'"
+        if context.get('role'):
+            description += f", role: '{context['role']}'"
+        return description
+    
     def _substitute_variables(self, text: str, variables: Dict[str, str]) -> str:
         """Remplacer les variables ${VAR} par leur valeur"""
         if not text or not variables:
@@ -150,138 +295,28 @@ class WorkflowPlayer:
         logger.info(f"     selector: {selector}")
         logger.info(f"     context: {context}")
         
-        # NOUVEAU: Pour les liens, prioriser le texte visible et href
-        if context.get('href') or context.get('text'):
-            text = context.get('text', '')
-            href = context.get('href', '')
-            
-            # Stratégie spéciale pour les résultats de recherche (comme DuckDuckGo)
-            # 1. Chercher un lien qui contient le texte ET pointe vers le bon domaine
-            try:
-                # Extraire le domaine du href
-                from urllib.parse import urlparse
-                expected_domain = ''
-                if href:
-                    expected_domain = urlparse(href).netloc
-                
-                # Chercher tous les liens visibles
-                links = await self.page.locator('a:visible').all()
-                
-                logger.info(f"  🔍 Smart link matching:")
-                logger.info(f"     Expected text: '{text[:50]}'")
-                logger.info(f"     Expected domain: '{expected_domain}'")
-                logger.info(f"     Expected href: '{href[:80]}'")
-                logger.info(f"     Found {len(links)} visible links on page")
-                
-                best_match = None
-                best_score = 0
-                all_candidates = []
-                
-                for idx, link in enumerate(links):
-                    try:
-                        link_text = await link.inner_text()
-                        link_href = await link.get_attribute('href')
-                        
-                        if not link_href:
-                            continue
-                        
-                        # Calculer un score de correspondance
-                        score = 0
-                        score_details = []
-                        
-                        # Le texte correspond (substring ou similaire)
-                        text_lower = text.lower()
-                        link_text_lower = link_text.lower()
-                        
-                        if text_lower and link_text_lower:
-                            # Correspondance exacte
-                            if text_lower == link_text_lower:
-                                score += 100
-                                score_details.append("text_exact=100")
-                            # Le texte attendu est dans le lien
-                            elif text_lower in link_text_lower:
-                                score += 70
-                                score_details.append("text_contains=70")
-                            # Le lien contient des mots du texte attendu
-                            elif link_text_lower in text_lower:
-                                score += 50
-                                score_details.append("text_partial=50")
-                            # Au moins un mot en commun
-                            else:
-                                text_words = set(text_lower.split())
-                                link_words = set(link_text_lower.split())
-                                common_words = text_words & link_words
-                                if common_words:
-                                    score += len(common_words) * 10
-                                    score_details.append(f"common_words={len(common_words) * 10}")
-                        
-                        # Le domaine correspond exactement
-                        link_domain = ''
-                        if link_href.startswith('http'):
-                            link_domain = urlparse(link_href).netloc
-                        
-                        if expected_domain and link_domain:
-                            if link_domain == expected_domain:
-                                score += 100
-                                score_details.append("domain_exact=100")
-                            # Même domaine principal (ex: www.site.com vs site.com)
-                            elif expected_domain.replace('www.', '') == link_domain.replace('www.', ''):
-                                score += 90
-                                score_details.append("domain_main=90")
-                            # Sous-domaine du domaine attendu
-                            elif link_domain.endswith('.' + expected_domain) or expected_domain.endswith('.' + link_domain):
-                                score += 50
-                                score_details.append("domain_related=50")
-                        
-                        # Le href correspond partiellement
-                        if href and link_href:
-                            if href == link_href:
-                                score += 50
-                                score_details.append("href_exact=50")
-                            elif href in link_href or link_href in href:
-                                score += 30
-                                score_details.append("href_partial=30")
-                        
-                        # Sauvegarder pour logs
-                        candidate_info = {
-                            'index': idx,
-                            'score': score,
-                            'text': link_text[:50],
-                            'href': link_href[:80],
-                            'domain': link_domain,
-                            'details': ', '.join(score_details)
-                        }
-                        all_candidates.append(candidate_info)
-                        
-                        if score > best_score:
-                            best_score = score
-                            best_match = link
-                            logger.info(f"     💡 New best match (score={score}): {score_details}")
-                            logger.info(f"        text: {link_text[:50]}")
-                            logger.info(f"        href: {link_href[:80]}")
-                    
-                    except Exception as e:
-                        continue
-                
-                # Log tous les candidats (top 5)
-                logger.info(f"  📊 Top candidates:")
-                sorted_candidates = sorted(all_candidates, key=lambda x: x['score'], reverse=True)
-                for i, candidate in enumerate(sorted_candidates[:5]):
-                    logger.info(f"     #{i+1} [score={candidate['score']:3d}] {candidate['text']}")
-                    logger.info(f"         → {candidate['href']}")
-                    if candidate['details']:
-                        logger.info(f"         → {candidate['details']}")
-                
-                # NOUVEAU: Seuil abaissé à 50 (au lieu de 80)
-                if best_match and best_score >= 50:
-                    await best_match.click(timeout=5000)
-                    logger.info(f"  ✅ Clicked best match (score={best_score})")
-                    return
-                
-                logger.warning(f"  ⚠️ No good match found (best score={best_score}), trying fallback strategies...")
-            
-            except Exception as e:
-                logger.warning(f"Smart link matching failed: {e}")
+        # Résolution en page : sélecteur, texte, href, aria-label, rôle et index scorés en un seul evaluate
+        try:
+            target = {
+                'selector': selector if selector != 'unknown' else None,
+                'text': context.get('text', ''),
+                'href': context.get('href', ''),
+                'ariaLabel': context.get('ariaLabel', ''),
+                'role': context.get('role', ''),
+                'index': context.get('index')
+            }
+            logger.info(f"  🔍 In-page resolver:")
+            resolved = await self.resolver.resolve(target)
+            if resolved and resolved.handle:
+                await resolved.handle.click(timeout=5000)
+                logger.info(f"  ✅ Clicked best match (score={resolved.score}, {resolved.candidates} candidates)")
+                return
+
+            best_score = resolved.score if resolved else 0
+            logger.warning(f"  ⚠️ No good match found (best score={best_score}), trying fallback strategies...")
+
+        except Exception as e:
+            logger.warning(f"In-page resolver failed: {e}")
         
         # Stratégie 1: Sélecteur CSS direct
         try:
@@ -374,27 +409,17 @@ class WorkflowPlayer:
             except Exception as e6:
                 logger.info(f"  ❌ Strategy 6 failed: {e6}")
 
-        # Stratégie 7: VLM Visual Search (NOUVEAU)
-        if self.vlm_service and self.vlm_service.enabled:
+        # Stratégie 7: VLM Visual Search (sautée sans attendre si le circuit du VLM est ouvert)
+        if self.vlm_service and self.vlm_service.available:
             try:
                 logger.info(f"  🎯 Strategy 7 (VLM Visual Search)")
                 
-                # Prendre un screenshot pour le VLM
-                screenshot_bytes = await self.page.screenshot(type='png')
-                screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                
                 # Construire une description de l'élément pour le VLM
-                description = f"Element to click: {selector}"
-                if context.get('text'):
-                    description += f", text: '{context['text']}'"
-                if context.get('ariaLabel'):
-                    description += f", aria-label: '{context['ariaLabel']}'"
-                if context.get('role'):
-                    description += f", role: '{context['role']}'"
+                description = self._vlm_description(action)
                 
                 logger.info(f"     Asking VLM to find: {description}")
                 
-                coords = await self.vlm_service.get_element_coordinates(screenshot_base64, description)
+                coords = await self._vlm_locate(description, action)
                 
                 if coords:
                     x, y = coords
@@ -440,22 +465,16 @@ class WorkflowPlayer:
             logger.info(f"  ❌ Fill failed: {e}")
             
             # Fallback VLM pour le fill
-            if self.vlm_service and self.vlm_service.enabled:
+            if self.vlm_service and self.vlm_service.available:
                 try:
                     logger.info(f"  🎯 Fill Strategy VLM (Visual Search)")
                     
-                    # Prendre un screenshot pour le VLM
-                    screenshot_bytes = await self.page.screenshot(type='png')
-                    screenshot_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                    
                     # Construire une description de l'élément pour le VLM
-                    description = f"Input field to fill: {selector}"
-                    # Pour un fill, on peut donner des indices supplémentaires si disponibles dans le contexte de l'action précédente (si on l'avait)
-                    # Mais ici on n'a que le sélecteur.
+                    description = self._vlm_description(action)
                     
                     logger.info(f"     Asking VLM to find input: {description}")
                     
-                    coords = await self.vlm_service.get_element_coordinates(screenshot_base64, description)
+                    coords = await self._vlm_locate(description, action)
                     
                     if coords:
                         x, y = coords
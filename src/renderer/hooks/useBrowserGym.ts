@@ -33,7 +33,7 @@ export function useBrowserGym() {
       console.log('Received Python message:', data);
 
       // Ignorer les screenshots (gérés par screenshot-handler.js)
-      if (data.type === 'screenshot') {
+      if (data.type === 'screenshot' || data.type === 'screenshot_delta') {
         return;
       }
 
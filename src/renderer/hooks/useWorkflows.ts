@@ -133,7 +133,7 @@ export function useWorkflows() {
         
         default:
           // Log les types non gérés pour debug
-          if (data.type !== 'screenshot' && data.type !== 'init_complete') {
+          if (data.type !== 'screenshot' && data.type !== 'screenshot_delta' && data.type !== 'init_complete') {
             console.log('[useWorkflows] Unhandled message type:', data.type);
           }
       }
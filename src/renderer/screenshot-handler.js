@@ -24,17 +24,75 @@
     }
   };
 
+  // Mode delta : dernière keyframe reçue (les deltas sont relatifs à elle) et canvas de composition
+  let keyframe = null; // { id, format, src, image: Promise<HTMLImageElement> décodée au premier delta }
+  let renderSeq = 0;   // Un rendu plus récent rend obsolète une composition encore en cours
+  const canvas = document.createElement('canvas');
+  const ctx = canvas.getContext('2d');
+
+  function loadImage(src) {
+    return new Promise((resolve, reject) => {
+      const image = new Image();
+      image.onload = () => resolve(image);
+      image.onerror = reject;
+      image.src = src;
+    });
+  }
+
+  function display(src) {
+    screenshotImg.src = src;
+    screenshotImg.style.display = 'block';
+    loadingMessage.style.display = 'none';
+  }
+
+  function applyDelta(data) {
+    const base = keyframe;
+    if (!base || base.id !== data.base_id) {
+      // Le serveur renvoie la keyframe avant le delta suivant si besoin
+      console.warn(`📸 Delta for unknown keyframe ${data.base_id}, skipped`);
+      return;
+    }
+
+    base.image = base.image || loadImage(base.src);
+    const seq = ++renderSeq;
+    const format = data.format || 'png';
+    const tiles = data.tiles.map((tile) => loadImage(`data:image/${format};base64,${tile.data}`));
+    Promise.all([base.image, ...tiles]).then(([baseImage, ...tileImages]) => {
+      if (seq !== renderSeq) {
+        return;
+      }
+      canvas.width = baseImage.naturalWidth;
+      canvas.height = baseImage.naturalHeight;
+      ctx.drawImage(baseImage, 0, 0);
+      tileImages.forEach((tileImage, i) => {
+        const tile = data.tiles[i];
+        ctx.drawImage(tileImage, tile.x, tile.y, tile.w, tile.h);
+      });
+      display(canvas.toDataURL(`image/${base.format}`));
+    }).catch((error) => {
+      console.error('📸 Delta decoding error:', error);
+    });
+  }
+
   // Écouter les screenshots via window.electronAPI
   if (window.electronAPI && window.electronAPI.onPythonMessage) {
     window.electronAPI.onPythonMessage((data) => {
       if (data.type === 'screenshot') {
         // Afficher le screenshot
         const base64Image = data.data;
-        screenshotImg.src = `data:image/png;base64,${base64Image}`;
-        screenshotImg.style.display = 'block';
-        loadingMessage.style.display = 'none';
+        const format = data.format || 'png';
+        const src = `data:image/${format};base64,${base64Image}`;
+        renderSeq++;
+        display(src);
+
+        // Image complète : nouvelle keyframe de référence pour les deltas
+        if (data.frame_id !== undefined) {
+          keyframe = { id: data.frame_id, format, src, image: null };
+        }
         
         console.log('📸 Screenshot updated');
+      } else if (data.type === 'screenshot_delta') {
+        applyDelta(data);
       }
     });
     
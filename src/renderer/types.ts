@@ -13,7 +13,7 @@ export interface BrowserGymStatus {
 }
 
 export interface PythonMessage {
-  type: 'observation' | 'agent_message' | 'error' | 'status' | 'init_complete' | 'screenshot' | 'agent_paused' | 'agent_resumed' | 'recording_started' | 'recording_stopped' | 'workflows_list' | 'workflow_data' | 'workflow_completed' | 'workflow_deleted';
+  type: 'observation' | 'agent_message' | 'error' | 'status' | 'init_complete' | 'screenshot' | 'screenshot_delta' | 'agent_paused' | 'agent_resumed' | 'recording_started' | 'recording_stopped' | 'workflows_list' | 'workflow_data' | 'workflow_completed' | 'workflow_deleted';
   data?: any;
   message?: string;
   error?: string;